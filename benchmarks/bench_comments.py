@@ -0,0 +1,85 @@
+# Lexing speed on programs with large documentation blocks: the multiline
+# comment matched as a whole by the regex 💬⬇️(.|\n)*?💬⬆️\n compared with
+# t_MULTILINECOMMENT finding the end of the comment with str.find.
+# Run with: python -m benchmarks.bench_comments [lines ...]
+#
+# The whole translation is then timed with the comments kept and with the
+# comments stripped by the lexer (debrewer --strip-comments).
+
+import gc
+import sys
+import time
+import types
+
+import tokens_and_grammar
+from benchmarks.corpus import BLOCK
+from ply.lex import lex
+
+BLOCKS = 20
+REPEAT = 5
+DOC_LINE = "    Describes the arguments, the result and the errors of the function below.\n"
+
+
+# defined above the other comment rule of the benchmark lexer, as in tokens_and_grammar
+def t_MULTILINECOMMENT(t):
+    r"💬⬇️(.|\n)*?💬⬆️\n"
+    t.lexer.lineno += t.value.count("\n")
+    return t
+
+
+def regex_comment_lexer():
+    module = types.ModuleType("regex_comments")
+    module.__dict__.update(vars(tokens_and_grammar))
+    module.t_MULTILINECOMMENT = t_MULTILINECOMMENT
+    return lex(module=module).dispatch()
+
+
+def documented(lines):
+    doc = "💬⬇️\n" + DOC_LINE * lines + "💬⬆️\n"
+    return "".join(doc + BLOCK.substitute(i=i) for i in range(BLOCKS))
+
+
+def best_time(lexer, program):
+    best = None
+    for _ in range(REPEAT):
+        lexer.input(program)
+        lexer.lineno = 1
+        gc.collect()
+        start = time.perf_counter()
+        for _ in lexer:
+            pass
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def transpile_time(program, strip_comments):
+    parser = tokens_and_grammar.get_parser()
+    best = None
+    for _ in range(REPEAT):
+        lexer = tokens_and_grammar.get_lexer(strip_comments)
+        lexer.lineno = 1
+        gc.collect()
+        start = time.perf_counter()
+        result = parser.parse(program, lexer=lexer)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(result)
+
+
+def main(sizes):
+    lexers = (("regex", regex_comment_lexer()), ("find", lex(module=tokens_and_grammar).dispatch()))
+
+    for lines in sizes:
+        program = documented(lines)
+        print(f"{BLOCKS} blocks with {lines} lines of documentation, {len(program) / 2**20:.1f} MiB")
+        for title, lexer in lexers:
+            elapsed = best_time(lexer, program)
+            print(f"  {title:8} {elapsed * 1000:>9.2f} ms, {len(program) / elapsed / 2**20:>8.1f} MiB/s")
+        for title, strip_comments in (("kept", False), ("stripped", True)):
+            elapsed, size = transpile_time(program, strip_comments)
+            print(f"  {title:8} {elapsed * 1000:>9.2f} ms translated, output {size / 2**20:.2f} MiB")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10, 1000, 10000])
@@ -0,0 +1,44 @@
+# Tokens removed by the token filters of tokens_and_grammar and the
+# reductions and parse time they save, next to the lexer without filters and
+# the "nocomments" lexer state of --strip-comments.  Run with:
+# python -m benchmarks.bench_filters [blocks]
+#
+# The generated program has single blank lines between its parts; the spaced
+# variant has three, as programs laid out with more space do.  The strip
+# filter gives the translation of --strip-comments, but the lexer state does
+# the same without passing the tokens through a generator.
+
+import sys
+
+import tokens_and_grammar
+from benchmarks.bench_units import best_time, count_reductions
+from benchmarks.corpus import count_tokens, generate
+
+PIPELINES = (
+    ("none", False, None),
+    ("coalesce", False, [tokens_and_grammar.coalesce_newlines]),
+    ("strip+coalesce", False, [tokens_and_grammar.strip_comments, tokens_and_grammar.coalesce_newlines]),
+    ("nocomments", True, None),
+    ("nocomments+coal", True, [tokens_and_grammar.coalesce_newlines]),
+)
+
+
+def main(blocks):
+    parser = tokens_and_grammar.get_parser()
+    program = generate(blocks)
+
+    for title, source in (("generated", program), ("spaced", program.replace("\n\n", "\n\n\n\n"))):
+        count = count_tokens(source)
+        print(f"{title}: {blocks} blocks, {count} tokens")
+        for name, strip, filters in PIPELINES:
+            lexer = tokens_and_grammar.get_lexer(strip)
+            if filters is not None:
+                lexer = lexer.filtered(filters)
+            reductions = count_reductions(parser, source, lexer)
+            elapsed = best_time(parser, source, lexer)
+            removed = f", removed {lexer.removed()}" if filters is not None else ""
+            print(f"  {name:16} {reductions / count:.3f} reductions per token, {count / elapsed:>9,.0f} tokens/s{removed}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,96 @@
+# Tokens per second of the lexer trying the master regex at every position
+# and of the DispatchLexer trying only the rules that may start with the
+# current character.  Run with: python -m benchmarks.bench_lexer [blocks ...]
+#
+# The memory taken by all of the tokens of a program is compared for a list of
+# LexToken objects and for the TokenBuffer returned by Lexer.tokenize_all(),
+# and an edit of one line in the middle of the program is lexed again with
+# Lexer.retokenize().
+
+import gc
+import sys
+import time
+import tracemalloc
+
+import tokens_and_grammar
+from benchmarks.corpus import generate
+from ply.lex import lex
+
+REPEAT = 5
+
+
+def best_time(lexer, program):
+    best = None
+    for _ in range(REPEAT):
+        lexer.input(program)
+        lexer.lineno = 1
+        gc.collect()
+        start = time.perf_counter()
+        for _ in lexer:
+            pass
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def timeit(func):
+    gc.collect()
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def held_memory(func):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        return tracemalloc.get_traced_memory()[0], len(result)
+    finally:
+        tracemalloc.stop()
+
+
+def token_list(lexer, program):
+    lexer.input(program)
+    lexer.lineno = 1
+    return list(lexer)
+
+
+def token_buffer(lexer, program):
+    lexer.lineno = 1
+    return lexer.tokenize_all(program)
+
+
+def main(sizes):
+    regex = lex(module=tokens_and_grammar)
+
+    start = time.perf_counter()
+    dispatch = regex.dispatch()
+    print(f"dispatch lexer built in {time.perf_counter() - start:.4f} s")
+
+    for blocks in sizes:
+        program = generate(blocks)
+        regex.input(program)
+        regex.lineno = 1
+        count = sum(1 for _ in regex)
+        print(f"{blocks} blocks, {count} tokens")
+
+        for title, lexer in (("regex", regex), ("dispatch", dispatch)):
+            elapsed = best_time(lexer, program)
+            print(f"  {title:10} {count / elapsed:>10,.0f} tokens/s")
+
+        elapsed = min(timeit(lambda: token_buffer(dispatch, program)) for _ in range(REPEAT))
+        print(f"  {'bulk':10} {count / elapsed:>10,.0f} tokens/s (tokenize_all)")
+
+        buffer = token_buffer(dispatch, program)
+        offset = program.index("total = total * 2", len(program) // 2)
+        edit = min(timeit(lambda: dispatch.retokenize(buffer, offset, 0, "1 + ")) for _ in range(REPEAT))
+        print(f"  {'edit':10} {edit * 1000:>10.2f} ms (retokenize, {elapsed * 1000:.2f} ms for tokenize_all)")
+
+        for title, collect in (("list", token_list), ("buffer", token_buffer)):
+            size, count = held_memory(lambda: collect(dispatch, program))
+            print(f"  {title:10} {size / count:>10.1f} bytes/token ({size / 2**20:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [50, 200, 800])
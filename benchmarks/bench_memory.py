@@ -0,0 +1,109 @@
+# Memory and speed of the slotted LexToken, YaccSymbol and YaccProduction
+# classes compared with plain classes keeping their attributes in a __dict__.
+# Run with: python -m benchmarks.bench_memory [blocks]
+#
+# Every variant runs in its own interpreter, so that its peak RSS is not
+# raised by the others.  A variant holds all of the tokens of a program in a
+# list, which shows the size of a token, and then lexes and parses it.
+
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+REPEAT = 3
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_dict_classes():
+    import ply.lex
+    import ply.yacc
+
+    class LexToken:
+        __repr__ = ply.lex.LexToken.__repr__
+
+    class YaccSymbol:
+        __str__ = ply.yacc.YaccSymbol.__str__
+        __repr__ = ply.yacc.YaccSymbol.__repr__
+
+    class YaccProduction:
+        pass
+
+    for name, value in vars(ply.yacc.YaccProduction).items():
+        if callable(value) and name not in ("__init_subclass__", "__subclasshook__"):
+            setattr(YaccProduction, name, value)
+
+    ply.lex.LexToken = LexToken
+    ply.yacc.YaccSymbol = YaccSymbol
+    ply.yacc.YaccProduction = YaccProduction
+
+
+def measure(variant, blocks):
+    if variant == "dict":
+        use_dict_classes()
+
+    import tokens_and_grammar
+    from benchmarks.corpus import generate
+
+    lexer = tokens_and_grammar.get_lexer()
+    parser = tokens_and_grammar.get_parser()
+    program = generate(blocks)
+
+    gc.collect()
+    allocated = sys.getallocatedblocks()
+    lexer.input(program)
+    lexer.lineno = 1
+    tokens = list(lexer)
+    allocated = sys.getallocatedblocks() - allocated
+    count = len(tokens)
+    del tokens
+
+    best = None
+    for _ in range(REPEAT):
+        lexer.lineno = 1
+        gc.collect()
+        start = time.perf_counter()
+        parser.parse(program, lexer=lexer)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # tracemalloc keeps its own records of the blocks, so it runs after the peak RSS is taken
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    gc.collect()
+    tracemalloc.start()
+    lexer.input(program)
+    lexer.lineno = 1
+    tokens = list(lexer)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del tokens
+
+    return {
+        "tokens": count,
+        "blocks_per_token": allocated / count,
+        "bytes_per_token": size / count,
+        "tokens_per_second": count / best,
+        "peak_rss": peak_rss,
+    }
+
+
+def main(blocks):
+    print(f"{blocks} blocks")
+    for variant in ("dict", "slots"):
+        result = subprocess.run([sys.executable, "-m", "benchmarks.bench_memory", "--variant", variant, str(blocks)],
+                                cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+        stats = json.loads(result.stdout)
+        print(f"  {variant:6} {stats['tokens']} tokens, {stats['blocks_per_token']:.2f} allocations and "
+              f"{stats['bytes_per_token']:.0f} bytes per held token, "
+              f"{stats['tokens_per_second']:>9,.0f} tokens/s parsed, peak RSS {stats['peak_rss'] / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--variant"]:
+        print(json.dumps(measure(sys.argv[2], int(sys.argv[3]))))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,83 @@
+# Tokens and reductions per second of the parsing engines: the table-driven
+# LRParser, the generated CompiledLRParser (the one debrewer and ParserPool
+# use) and the PackedLRParser running on compressed array tables.
+# Run with: python -m benchmarks.bench_parser [blocks ...]
+#
+# Each size is measured twice: with the lexer producing tokens as the parser
+# asks for them, and with the tokens lexed up front and replayed, which leaves
+# only the parsing engine and the grammar actions in the timing.
+
+import gc
+import sys
+import time
+
+import tokens_and_grammar
+from benchmarks.bench_units import count_reductions
+from benchmarks.corpus import generate
+
+REPEAT = 5
+
+
+class ReplayLexer:
+    def __init__(self, lexer, program):
+        lexer.input(program)
+        lexer.lineno = 1
+        self.tokens = list(lexer)
+        self.lexdata = program
+        self.lineno = lexer.lineno
+
+    def input(self, program):
+        # None marks the end of the input, as it does for the real lexer
+        self.token = self.coded_token = iter(self.tokens + [None]).__next__
+
+    def set_tokencodes(self, codes):
+        for tok in self.tokens:
+            tok.code = codes[tok.type]
+
+
+def table_size(tables):
+    return sys.getsizeof(tables) + sum(sys.getsizeof(row) for row in tables.values())
+
+
+def best_time(parser, program, lexer):
+    best = None
+    for _ in range(REPEAT):
+        lexer.lineno = 1
+        gc.collect()
+        start = time.perf_counter()
+        parser.parse(program, lexer=lexer)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(sizes):
+    lexer = tokens_and_grammar.get_lexer()
+    table = tokens_and_grammar.get_parser()
+
+    start = time.perf_counter()
+    compiled = table.compile()
+    print(f"compiled parser: {len(compiled.source)} bytes of code, built in {time.perf_counter() - start:.3f} s")
+
+    start = time.perf_counter()
+    packed = table.pack()
+    print(f"packed parser: {packed.table_size()} bytes of tables (dicts: "
+          f"{table_size(table.action) + table_size(table.goto)} bytes), built in {time.perf_counter() - start:.3f} s")
+
+    engines = (("table", table), ("compiled", compiled), ("packed", packed))
+    for blocks in sizes:
+        program = generate(blocks)
+        replay = ReplayLexer(lexer, program)
+        count = len(replay.tokens)
+        reductions = count_reductions(table, program, lexer)
+        print(f"\n{blocks} blocks, {len(program)} characters, {count} tokens, {reductions} reductions")
+
+        for title, source in (("with lexer", lexer), ("pre-lexed", replay)):
+            times = [best_time(parser, program, source) for _, parser in engines]
+            print(f"  {title:10}" + "".join(f"  {name} {count / elapsed:>9,.0f} tokens/s {reductions / elapsed:>9,.0f} reductions/s "
+                                             f"({times[0] / elapsed:.2f}x)"
+                                             for (name, _), elapsed in zip(engines, times)))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [50, 200, 800])
@@ -0,0 +1,62 @@
+# Cost of a parser and a lexer for one more thread: built again from the
+# cached tables by yacc() and lex() or cloned from the shared ones
+# (LRParser.clone(), Lexer.clone()), and programs translated per second by
+# ParserPool with several threads.  Run with: python -m benchmarks.bench_pool [blocks]
+#
+# On an interpreter with the GIL the threads take turns; the pool only pays
+# off on a free-threaded build.
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tokens_and_grammar
+from benchmarks.corpus import generate
+from ply.lex import lex
+from ply.yacc import yacc
+
+REPEAT = 5
+PROGRAMS = 16
+THREADS = (1, 2, 4)
+
+
+def best_time(make):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        make()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(blocks):
+    parser = tokens_and_grammar.get_parser()
+    lexer = tokens_and_grammar.get_lexer()
+
+    def build():
+        yacc(module=tokens_and_grammar, tabmodule=tokens_and_grammar.TABMODULE, picklefile=tokens_and_grammar.PARSETAB,
+             manifest=tokens_and_grammar.MANIFEST, optimize=not __debug__, collapse_units=True)
+        lex(module=tokens_and_grammar, picklefile=tokens_and_grammar.LEXTAB).dispatch()
+
+    print("a parser and a lexer for one more thread")
+    for title, make in (("built", build), ("cloned", lambda: (parser.clone(), lexer.clone()))):
+        print(f"  {title:7} {best_time(make) * 1000:>9.3f} ms")
+
+    program = generate(blocks)
+    print(f"{PROGRAMS} programs of {blocks} blocks")
+    for engine in (parser, parser.pack()):
+        pool = tokens_and_grammar.ParserPool(engine)
+
+        def translate(program):
+            with pool.acquire() as (parser, lexer):
+                return parser.parse(program, lexer=lexer)
+
+        for threads in THREADS:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                elapsed = best_time(lambda: list(executor.map(translate, [program] * PROGRAMS)))
+            print(f"  {type(engine).__name__:15} {threads} threads {PROGRAMS / elapsed:>8.1f} programs/s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,64 @@
+# Peak memory and time of translating a large program read whole into a
+# string, as debrewer does for small files, and lexed from the memory-mapped
+# file a window at a time.  Run with: python -m benchmarks.bench_stream [blocks]
+#
+# Every variant runs in its own interpreter on the same program file, so that
+# its peak RSS is not raised by the others.
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(variant, path):
+    import tokens_and_grammar
+    
+    parser = tokens_and_grammar.get_parser()
+    start = time.perf_counter()
+    if variant == "read":
+        with open(path, "r", encoding="utf8") as f:
+            program = f.read()
+        if program[-1] != "\n":
+            program += "\n"
+        lexer = tokens_and_grammar.get_lexer()
+        lexer.lineno = 1
+        result = parser.parse(program, lexer=lexer)
+    else:
+        result = parser.parse(lexer=tokens_and_grammar.get_stream_lexer(path))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "seconds": elapsed,
+        "output": len(result),
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def main(blocks):
+    from benchmarks.corpus import generate
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "program.pint")
+        with open(path, "w", encoding="utf8") as f:
+            f.write(generate(blocks))
+        print(f"{blocks} blocks, {os.path.getsize(path) / 2**20:.1f} MiB")
+
+        for variant in ("read", "stream"):
+            result = subprocess.run([sys.executable, "-m", "benchmarks.bench_stream", "--variant", variant, path],
+                                    cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+            stats = json.loads(result.stdout)
+            print(f"  {variant:6} {stats['seconds']:>7.2f} s, peak RSS {stats['peak_rss'] / 1024:>7.1f} MiB, "
+                  f"output {stats['output'] / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--variant"]:
+        print(json.dumps(measure(sys.argv[2], sys.argv[3])))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,58 @@
+# Time taken by LRTable to build the parsing tables of the Pint grammar and
+# of synthetically enlarged versions of it, in total and per phase.  Run with:
+# python -m benchmarks.bench_tables [copies ...]
+#
+# An enlarged grammar holds the given number of extra copies of the Pint
+# grammar with renamed nonterminals.  Every copy is reached from the start
+# symbol through a terminal of its own, so the copies add states without
+# adding conflicts.
+
+import sys
+import time
+
+import tokens_and_grammar
+from ply.yacc import Grammar, LRTable, ParserReflect
+
+REPEAT = 3
+
+
+def build_grammar(copies):
+    pinfo = ParserReflect({name: getattr(tokens_and_grammar, name) for name in dir(tokens_and_grammar)})
+    pinfo.get_all()
+    pinfo.validate_all()
+    nonterminals = {prodname for _, (_, _, prodname, _) in pinfo.grammar}
+
+    markers = [f"COPY{k}" for k in range(1, copies + 1)]
+    grammar = Grammar(list(pinfo.tokens) + markers)
+    for k in range(copies + 1):
+        suffix = f"_{k}" if k else ""
+        for funcname, (file, line, prodname, syms) in pinfo.grammar:
+            syms = [sym + suffix if sym in nonterminals else sym for sym in syms]
+            grammar.add_production(prodname + suffix, syms, funcname, file, line)
+
+    grammar.add_production("pint", [pinfo.start])
+    for k, marker in enumerate(markers, 1):
+        grammar.add_production("pint", [marker, f"{pinfo.start}_{k}"])
+    grammar.set_start("pint")
+    return grammar
+
+
+def main(sizes):
+    for copies in sizes:
+        best = None
+        for _ in range(REPEAT):
+            grammar = build_grammar(copies)
+            start = time.perf_counter()
+            table = LRTable(grammar)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best, timings = elapsed, table.timings
+
+        print(f"{copies:>3} extra copies: {len(grammar.Productions):>5} productions, "
+              f"{len(table.lr_action):>5} states, tables built in {best:.3f} s")
+        for phase, seconds in timings.items():
+            print(f"      {phase:24} {seconds:.3f} s")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [0, 4, 16])
@@ -0,0 +1,76 @@
+# Reductions per token and parse time with and without unit production
+# elimination (yacc(collapse_units=True)).  Run with:
+# python -m benchmarks.bench_units [blocks]
+
+import functools
+import gc
+import sys
+import time
+
+import tokens_and_grammar
+from benchmarks.corpus import count_tokens, generate
+from ply.yacc import yacc
+
+REPEAT = 5
+
+
+def count_reductions(parser, program, lexer):
+    counts = [0] * len(parser.productions)
+    callables = [p.callable for p in parser.productions]
+
+    def counted(n, func):
+        @functools.wraps(func)
+        def rule(p):
+            counts[n] += 1
+            func(p)
+        return rule
+
+    for n, p in enumerate(parser.productions):
+        if n:
+            p.callable = counted(n, p.callable)
+    try:
+        lexer.lineno = 1
+        parser.parse(program, lexer=lexer)
+    finally:
+        for p, func in zip(parser.productions, callables):
+            p.callable = func
+    return sum(counts)
+
+
+def best_time(parser, program, lexer):
+    best = None
+    for _ in range(REPEAT):
+        lexer.lineno = 1
+        gc.collect()
+        start = time.perf_counter()
+        parser.parse(program, lexer=lexer)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(blocks):
+    lexer = tokens_and_grammar.get_lexer()
+    program = generate(blocks)
+    count = count_tokens(program)
+    print(f"{blocks} blocks, {count} tokens")
+
+    plain = yacc(module=tokens_and_grammar, debug=False)
+    collapsed = yacc(module=tokens_and_grammar, debug=False)
+    redirected = collapsed.collapse_unit_productions()
+    print(f"{redirected} transitions redirected past unit productions")
+
+    results = []
+    for title, parser in (("plain", plain), ("collapsed", collapsed)):
+        reductions = count_reductions(parser, program, lexer)
+        elapsed = best_time(parser, program, lexer)
+        results.append(reductions)
+        print(f"  {title:10} {reductions:>8} reductions, {reductions / count:.3f} per token, "
+              f"{count / elapsed:>9,.0f} tokens/s")
+
+    saved = results[0] - results[1]
+    print(f"  saved      {saved:>8} reductions, {saved / count:.3f} per token")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
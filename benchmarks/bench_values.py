@@ -0,0 +1,87 @@
+# Time spent by a grammar rule in getting the values of its right-hand side:
+# p[1:], which calls YaccProduction.__getitem__ and makes a list from the
+# symbols, compared with p.values, the list the parser makes before the call:
+# with a list comprehension in the table-driven loops and from the symbols
+# named one by one in the generated parser (get_parser().compile()).
+# Run with: python -m benchmarks.bench_values [blocks]
+#
+# The share of the reductions of a synthetic program made by rules reading
+# p.values is counted first, as only these pay for the list.  The others
+# get None: the time this takes is compared with making the list for them
+# anyway and with leaving p.values alone.
+
+import sys
+import timeit
+
+import tokens_and_grammar
+from benchmarks.corpus import generate
+from ply.yacc import YaccProduction, YaccSymbol, reads_values
+
+NUMBER = 200000
+REPEAT = 7
+LENGTHS = (2, 3, 5, 8)
+
+
+def count_readers(parser, program):
+    productions = parser.productions
+    readers = [reads_values(p.callable) for p in productions]
+    counts = [0, 0]
+    callables = [p.callable for p in productions]
+
+    def counted(n, func):
+        def rule(p):
+            counts[readers[n]] += 1
+            func(p)
+        rule.__wrapped__ = func
+        return rule
+
+    for n, p in enumerate(productions):
+        if n:
+            p.callable = counted(n, p.callable)
+    try:
+        lexer = tokens_and_grammar.get_lexer()
+        lexer.lineno = 1
+        parser.parse(program, lexer=lexer)
+    finally:
+        for p, func in zip(productions, callables):
+            p.callable = func
+    return counts[True], sum(counts)
+
+
+def reduction(length):
+    targ = [YaccSymbol() for _ in range(length + 1)]
+    for n, sym in enumerate(targ):
+        sym.value = f"value{n}"
+    return targ, YaccProduction(None)
+
+
+def main(blocks):
+    parser = tokens_and_grammar.get_parser()
+    readers, reductions = count_readers(parser, generate(blocks))
+    print(f"{blocks} blocks, {reductions} reductions, {readers} by rules reading p.values ({readers / reductions:.0%})")
+
+    for length in LENGTHS:
+        targ, p = reduction(length)
+        named = ", ".join(f"targ[{i}].value" for i in range(1, length + 1))
+        times = [min(timeit.repeat(f'p.slice = targ; {fill}"".join({values})', globals={"targ": targ, "p": p},
+                                   number=NUMBER, repeat=REPEAT)) / NUMBER
+                 for fill, values in (("", "p[1:]"),
+                                      ("p.values = [s.value for s in targ[1:]]; ", "p.values"),
+                                      (f"p.values = [{named}]; ", "p.values"))]
+        print(f"  {length} symbols: p[1:] {times[0] * 1e9:>5.0f} ns, p.values {times[1] * 1e9:>5.0f} ns "
+              f"({times[0] / times[1]:.2f}x), generated {times[2] * 1e9:>5.0f} ns ({times[0] / times[2]:.2f}x)")
+
+    print("rules not reading p.values")
+    for length in LENGTHS:
+        targ, p = reduction(length)
+        times = [min(timeit.repeat(f"p.slice = targ{fill}", globals={"targ": targ, "p": p, "reads": False},
+                                   number=NUMBER, repeat=REPEAT)) / NUMBER
+                 for fill in ("",
+                              "; p.values = [s.value for s in targ[1:]]",
+                              "; p.values = [s.value for s in targ[1:]] if reads else None")]
+        print(f"  {length} symbols: untouched {times[0] * 1e9:>5.0f} ns, list made {times[1] * 1e9:>5.0f} ns "
+              f"(+{(times[1] - times[0]) * 1e9:.0f} ns), None {times[2] * 1e9:>5.0f} ns (+{(times[2] - times[0]) * 1e9:.0f} ns)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
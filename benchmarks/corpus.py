@@ -0,0 +1,77 @@
+# Synthetic Pint programs for the benchmarks.  Every block uses its own names,
+# so a program can be made as large as needed without redefinition errors.
+
+from string import Template
+
+import tokens_and_grammar
+
+BLOCK = Template("""
+💬 block $i
+🍺 compute$i(🔢 a, 🔢 b = 2) -> 🔢 {
+    💬⬇️
+    Computes a number
+    over several steps
+    💬⬆️
+    🔢 total = a + b * 2
+    🍃 (total 🐘 10) {
+        total = total - 1
+    }
+    🌲 {
+        🍃 (total 🐜⚖️ 0) {
+            total += 1
+        }
+        🍂 {
+            total -= 1
+        }
+    }
+    🔁 (🔢 k = range(0, b)) {
+        total = total + k
+    }
+    🔁 (total 🐜 100) {
+        total = total * 2
+    }
+    🦞 total
+}
+
+🏛️ Drink$i {
+
+    ⏺️ liters
+    🆒 fizzy
+
+    🏗️ Drink$i (⏺️ lit = 0.5, 🆒 fiz = ❌) {
+        🤗.liters = lit
+        🤗.fizzy = fiz
+    }
+
+    🍺 getLiters() -> ⏺️ {
+        🦞 🤗.liters
+    }
+}
+
+🐍<🔢> values$i = 🐍(1, 2, 3, $i)
+🗺️<🔢, 🔠> names$i = 🗺️(1: "one", 2: "two")
+🔢 index$i = 0
+🔢 result$i = compute$i(values$i[index$i], 3) 💬 call
+🌲 (result$i) {
+    🍃 (1) {
+        🖨️("one")
+    }
+    🍂 {
+        🖨️(result$i)
+    }
+}
+🍃 (😡 result$i ⚖️ 2 🙃 ✅) {
+    🖨️("Good")
+}
+""")
+
+
+def generate(blocks):
+    return "".join(BLOCK.substitute(i=i) for i in range(blocks))
+
+
+def count_tokens(program):
+    lexer = tokens_and_grammar.get_lexer()
+    lexer.input(program)
+    lexer.lineno = 1
+    return sum(1 for _ in lexer)
@@ -1,99 +1,185 @@
-from tokens_and_grammar import lexer, parser
-from utils.errors import PintException, DebrewerException, MyPyError
+from tokens_and_grammar import ParserPool, get_stream_lexer, source_chunks
+from utils.errors import PintException, DebrewerException, InternalError, MyPyError
 
 import sys
 from sys import exit
 import os
+from contextlib import closing
 
-try:
-    if len(sys.argv) > 1:
-        input_file = sys.argv[1]
+# larger programs are lexed from the mapped file instead of being read whole
+STREAM_SIZE = 64 * 2**20
 
-        input_pathname, input_extension = os.path.splitext(input_file)
-        if input_extension not in ('.pint', '.🍺'):
-            raise DebrewerException(f'File {sys.argv[1]} doesn\'t have a proper extension to be a Pint program.')
+USAGE = 'Use: python debrewer.py <input_file> [-o <output_file>] [-t] [--strip-comments]'
 
+
+# The outcome of transpiling one program: the Python code, or None if the
+# program has errors, and the errors (PintException, SyntaxError or
+# DebrewerException; any other exception raised while transpiling it is
+# kept as an InternalError).
+# lines is the LineIndex the errors of the program are shown from.
+class Result:
+    def __init__(self, filename, output=None, errors=(), lines=None):
+        self.filename = filename
+        self.output = output
+        self.errors = list(errors)
+        self.lines = lines
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    # the errors as the command line prints them
+    def report(self):
+        return "\n".join(PintException.format(self.filename, self.lines, e) if isinstance(e, PintException) else str(e)
+                         for e in self.errors)
+
+
+# Parsers and lexers kept warm between the programs, one pair for each thread transpiling at the moment
+_pool = None
+
+
+def get_pool():
+    global _pool
+
+    if _pool is None:
+        _pool = ParserPool()
+    return _pool
+
+
+# Transpiles the Pint program in source and returns a Result; nothing is printed
+def transpile(source, *, filename='<string>', strip_comments=False):
+    return _transpile(source, filename, strip_comments)
+
+
+# source is the program, or the chunks of its text (source_chunks()) to be lexed a window at a time
+def _transpile(source, filename, strip_comments):
+    streamed = not isinstance(source, str)
+    if not streamed and source[-1:] != '\n':
+        source += '\n'
+
+    with get_pool().acquire(strip_comments) as (parser, lexer):
         try:
-            with open(input_file, 'r', encoding="utf8") as f:
+            if streamed:
+                lexer = get_stream_lexer(filename, lexer=lexer, chunks=source)
+                source = None
+            # add debug=True to see the rules being applied
+            return Result(filename, parser.parse(source, lexer=lexer))
+        except PintException as e:
+            return Result(filename, errors=[e], lines=lexer.line_index())
+        except SyntaxError as e:
+            return Result(filename, errors=[e])
+        except Exception as e:
+            return Result(filename, errors=[InternalError(filename, e)])
+
+
+# Transpiles the Pint program in the file at path
+def transpile_file(path, *, strip_comments=False):
+    _, extension = os.path.splitext(path)
+    if extension not in ('.pint', '.🍺'):
+        return Result(path, errors=[DebrewerException(f'File {path} doesn\'t have a proper extension to be a Pint program.')])
+
+    try:
+        stream = os.path.getsize(path) > STREAM_SIZE
+        if not stream:
+            with open(path, 'r', encoding="utf8") as f:
                 program = f.read()
-        except:
-            raise DebrewerException(f'File {input_file} not found.')
+    except OSError:
+        return Result(path, errors=[DebrewerException(f'File {path} not found.')])
+
+    if stream:
+        # the file is closed even if the parse stops before its end
+        with closing(source_chunks(path)) as chunks:
+            return _transpile(chunks, path, strip_comments)
+    return transpile(program, filename=path, strip_comments=strip_comments)
+
+
+# Transpiles the files at paths one after another in this process and returns their Results
+def transpile_many(paths, *, strip_comments=False):
+    return [transpile_file(path, strip_comments=strip_comments) for path in paths]
+
+
+def main(argv):
+    try:
+        if len(argv) > 1:
+            input_file = argv[1]
+            input_pathname, _ = os.path.splitext(input_file)
+        else:
+            raise DebrewerException('No input file provided. ' + USAGE)
+
+    except Exception as e:
+        print(e)
+        exit()
+
+    check_types = False
+
+    # comments are left out of the generated program
+    strip_comments = '--strip-comments' in argv[2:]
+    arguments = [argument for argument in argv[1:] if argument != '--strip-comments']
+
+    output_file = None
+    try:
+        match arguments:
+            case [_]:
+                # output_file = os.path.basename(argv[1]).replace('.pint', '.py')
+                # output_file = os.path.basename(input_pathname) + '.py'
+                output_file = input_pathname + '.py'
+            case [_, '-o', _]:
+                output_file = arguments[2]
+
+                output_extension = os.path.splitext(output_file)[1]
+                if output_extension != '.py':
+                    raise DebrewerException(f'Output file {output_file} doesn\'t have a proper extension to be a Python program.')
+            case [_, '-t']:
+                output_file = input_pathname + '.py'
+                check_types = True
+                pass
+            case [_, '-o']:
+                raise DebrewerException('No output file provided while -o used. ' + USAGE)
+            case _:
+                raise DebrewerException('Invalid arguments. ' + USAGE)
+
+    except Exception as e:
+        print(e)
+        exit()
+
+    try:
+        result = transpile_file(input_file, strip_comments=strip_comments)
+    except Exception as e:
+        print(e)
+        exit()
+
+    if not result.ok:
+        print(result.report())
+        exit()
+
+    if output_file:
+        with open(output_file, 'w', encoding="utf8") as f:
+            f.write(result.output)
     else:
-        raise DebrewerException('No input file provided. Use: python debrewer.py <input_file> [-o <output_file>] [-t]')
-
-except Exception as e:
-    print(e)
-    exit()
-
-if program[-1] != '\n':
-    program += '\n'
-
-check_types = False
-
-output_file = None
-try:
-    match sys.argv[1:]:
-        case [_]:
-            # output_file = os.path.basename(sys.argv[1]).replace('.pint', '.py')
-            # output_file = os.path.basename(input_pathname) + '.py'
-            output_file = input_pathname + '.py'
-        case [_, '-o', _]:
-            output_file = sys.argv[3]
-
-            output_extension = os.path.splitext(output_file)[1]
-            if output_extension != '.py':
-                raise DebrewerException(f'Output file {output_file} doesn\'t have a proper extension to be a Python program.')
-        case [_, '-t']:
-            output_file = input_pathname + '.py'
-            check_types = True
-            pass
-        case [_, '-o']:
-            raise DebrewerException('No output file provided while -o used. Use: python debrewer.py <input_file> [-o <output_file>] [-t]')
-        case _:
-            raise DebrewerException('Invalid arguments. Use: python debrewer.py <input_file> [-o <output_file>] [-t]')
-
-except Exception as e:
-    print(e)
-    exit()
-
-try:
-    # add debug=True to see the rules being applied
-    # result = parser.parse(program, lexer=lexer, debug=True)
-    result = parser.parse(program, lexer=lexer)
-except PintException as e:
-    line = program.split('\n')[e.line - 1]
-    # print(f"{e}\n{PintExceeption.format_error_line(line, e.column - 1, e.symbol)}")
-    PintException.display(input_file, line, e)
-    exit()
-except Exception as e:
-    print(e)
-    exit()
-
-if output_file:
-    with open(output_file, 'w', encoding="utf8") as f:
-        f.write(result)
-else:
-    print(result, end='')
-
-# calling mypy
-if check_types:
-    import subprocess
-
-    # debug
-    command = f"mypy {output_file} --strict --hide-error-codes --no-error-summary --pretty" # remove --pretty not to see .py context
-    output = subprocess.run(command, capture_output=True, text=True).stdout
-    print(output)
-    print("\n" + "-" * 80 + "\n")
-
-    # production
-    command = f"mypy {output_file} --strict --hide-error-codes --no-error-summary"
-    output = subprocess.run(command, capture_output=True, text=True).stdout
-
-    messages = [message[message.find("error")+7:] for message in output.split("\n") if message != ""]
-    errors = [MyPyError("Error", message) for message in messages]
-    
-    for error in errors:
-        print(error)
-
-print(f"\n{DebrewerException.green_color}Transpilation succesfull!{DebrewerException.reset_color}")
- 
\ No newline at end of file
+        print(result.output, end='')
+
+    # calling mypy
+    if check_types:
+        import subprocess
+
+        # debug
+        command = f"mypy {output_file} --strict --hide-error-codes --no-error-summary --pretty" # remove --pretty not to see .py context
+        output = subprocess.run(command, capture_output=True, text=True).stdout
+        print(output)
+        print("\n" + "-" * 80 + "\n")
+
+        # production
+        command = f"mypy {output_file} --strict --hide-error-codes --no-error-summary"
+        output = subprocess.run(command, capture_output=True, text=True).stdout
+
+        messages = [message[message.find("error")+7:] for message in output.split("\n") if message != ""]
+        errors = [MyPyError("Error", message) for message in messages]
+
+        for error in errors:
+            print(error)
+
+    print(f"\n{DebrewerException.green_color}Transpilation succesfull!{DebrewerException.reset_color}")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -39,6 +39,18 @@ import types
 import copy
 import os
 import inspect
+import hashlib
+import pickle
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+
+try:
+    from re import _parser as sre_parse
+except ImportError:                 # Python < 3.11
+    import sre_parse
+
+__tabversion__ = '2022.10.27-1'   # Version of the cached lexer table format
 
 # This tuple contains acceptable string types
 StringTypes = (str, bytes)
@@ -54,7 +66,12 @@ class LexError(Exception):
         self.text = s
 
 # Token class.  This class is used to represent the tokens produced.
+# Tokens are allocated for every match, so they have slots instead of a
+# __dict__.  lexer is only set on the tokens passed to rule functions and
+# code on the tokens of coded_token().
 class LexToken(object):
+    __slots__ = ('type', 'value', 'lineno', 'lexpos', 'lexer', 'code')
+
     def __repr__(self):
         return f'LexToken({self.type},{self.value!r},{self.lineno},{self.lexpos})'
 
@@ -118,9 +135,15 @@ class Lexer:
         self.lexliterals = ''         # Literal characters that can be passed through
         self.lexmodule = None         # Module
         self.lineno = 1               # Current line number
+        self.lextokencodes = None     # Dictionary mapping token types to integer codes
+        self.lexunknowncode = None    # Code of the types missing from lextokencodes
+        self.lexlineindex = None      # LineIndex of lexdata, made by line_index()
+        self.lexnames = {}            # Strings interned by intern() for the current input
+        self.lexfirstline = 1         # Line number of the first line of lexdata
 
     def clone(self, object=None):
         c = copy.copy(self)
+        c.lexstatestack = list(self.lexstatestack)
 
         # If the object parameter has been supplied, it means we are attaching the
         # lexer to a new object.  In this case, we have to rebind all methods in
@@ -146,6 +169,86 @@ class Lexer:
             c.lexmodule = object
         return c
 
+    # ------------------------------------------------------------
+    # pickle_table() - Write the master regexs and the rule names
+    # mapped to their groups to a pickle file.  Functions are stored
+    # by name and bound again when the file is read.
+    # ------------------------------------------------------------
+    def pickle_table(self, filename, signature=''):
+        tabre = {}
+        for statename, lre in self.lexstatere.items():
+            titem = []
+            for (pat, func), renames in zip(lre, self.lexstaterenames[statename]):
+                titem.append((pat.pattern, _funcs_to_names(func, renames)))
+            tabre[statename] = titem
+
+        taberr = {}
+        for statename, ef in self.lexstateerrorf.items():
+            taberr[statename] = ef.__name__ if ef else None
+
+        tabeof = {}
+        for statename, ef in self.lexstateeoff.items():
+            tabeof[statename] = ef.__name__ if ef else None
+
+        dirname = os.path.dirname(filename)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        tmpname = f'{filename}.{os.getpid()}.tmp'
+        try:
+            with open(tmpname, 'wb') as outf:
+                pickle.dump(__tabversion__, outf, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(signature_digest(signature), outf, pickle.HIGHEST_PROTOCOL)
+                pickle.dump((tuple(sorted(self.lextokens)), int(self.lexreflags), self.lexliterals,
+                             self.lexstateinfo, tabre, self.lexstaterenames, self.lexstateignore,
+                             taberr, tabeof), outf, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpname, filename)
+        finally:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+
+    # ------------------------------------------------------------
+    # read_pickle() - Restore the lexer from a file written by
+    # pickle_table().  Returns the signature digest the file was
+    # generated for; the lexer is only usable if it matches.
+    # ------------------------------------------------------------
+    def read_pickle(self, filename, fdict):
+        with open(filename, 'rb') as in_f:
+            tabversion = pickle.load(in_f)
+            if tabversion != __tabversion__:
+                raise ImportError('lex table file version is out of date')
+            signature = pickle.load(in_f)
+            (lextokens, lexreflags, lexliterals, lexstateinfo, tabre, lexstaterenames,
+             lexstateignore, taberr, tabeof) = pickle.load(in_f)
+
+        self.lextokens      = set(lextokens)
+        self.lexreflags     = lexreflags
+        self.lexliterals    = lexliterals
+        self.lextokens_all  = self.lextokens | set(self.lexliterals)
+        self.lexstateinfo   = lexstateinfo
+        self.lexstateignore = lexstateignore
+        self.lexstaterenames = lexstaterenames
+        self.lexstatere     = {}
+        self.lexstateretext = {}
+        for statename, lre in tabre.items():
+            titem = []
+            txtitem = []
+            for pat, func_name in lre:
+                titem.append((re.compile(pat, lexreflags), _names_to_funcs(func_name, fdict)))
+                txtitem.append(pat)
+            self.lexstatere[statename] = titem
+            self.lexstateretext[statename] = txtitem
+
+        self.lexstateerrorf = {}
+        for statename, ef in taberr.items():
+            self.lexstateerrorf[statename] = fdict[ef] if ef else None
+
+        self.lexstateeoff = {}
+        for statename, ef in tabeof.items():
+            self.lexstateeoff[statename] = fdict[ef] if ef else None
+
+        self.begin('INITIAL')
+        return signature
+
     # ------------------------------------------------------------
     # input() - Push a new string into the lexer
     # ------------------------------------------------------------
@@ -153,6 +256,8 @@ class Lexer:
         self.lexdata = s
         self.lexpos = 0
         self.lexlen = len(s)
+        self.lexnames = {}
+        self.lexfirstline = 1
 
     # ------------------------------------------------------------
     # begin() - Changes the lexing state
@@ -195,6 +300,10 @@ class Lexer:
     # ------------------------------------------------------------
     # token() - Return the next token from the Lexer
     #
+    # The rules tried at a position are the ones candidates()
+    # returns for its character: all of them here, only those that
+    # can start with it in a DispatchLexer, which shares this loop.
+    #
     # Note: This function has been carefully implemented to be as fast
     # as possible.  Don't make changes unless you really know what
     # you are doing
@@ -205,15 +314,17 @@ class Lexer:
         lexlen    = self.lexlen
         lexignore = self.lexignore
         lexdata   = self.lexdata
+        candidates = self.candidates
 
         while lexpos < lexlen:
             # This code provides some short-circuit code for whitespace, tabs, and other ignored characters
-            if lexdata[lexpos] in lexignore:
+            c = lexdata[lexpos]
+            if c in lexignore:
                 lexpos += 1
                 continue
 
             # Look for a regular expression match
-            for lexre, lexindexfunc in self.lexre:
+            for lexre, lexindexfunc in candidates(c):
                 m = lexre.match(lexdata, lexpos)
                 if not m:
                     continue
@@ -244,20 +355,19 @@ class Lexer:
                 self.lexmatch = m
                 self.lexpos = lexpos
                 newtok = func(tok)
-                del tok.lexer
-                del self.lexmatch
 
                 # Every function must return a token, if nothing, we just move to next token
                 if not newtok:
                     lexpos    = self.lexpos         # This is here in case user has updated lexpos.
                     lexignore = self.lexignore      # This is here in case there was a state change
+                    candidates = self.candidates
                     break
                 return newtok
             else:
                 # No match, see if in literals
-                if lexdata[lexpos] in self.lexliterals:
+                if c in self.lexliterals:
                     tok = LexToken()
-                    tok.value = lexdata[lexpos]
+                    tok.value = c
                     tok.lineno = self.lineno
                     tok.type = tok.value
                     tok.lexpos = lexpos
@@ -276,7 +386,7 @@ class Lexer:
                     newtok = self.lexerrorf(tok)
                     if lexpos == self.lexpos:
                         # Error method didn't change text position at all. This is an error.
-                        raise LexError(f"Scanning error. Illegal character {lexdata[lexpos]!r}",
+                        raise LexError(f"Scanning error. Illegal character {c!r}",
                                        lexdata[lexpos:])
                     lexpos = self.lexpos
                     if not newtok:
@@ -284,7 +394,7 @@ class Lexer:
                     return newtok
 
                 self.lexpos = lexpos
-                raise LexError(f"Illegal character {lexdata[lexpos]!r} at index {lexpos}",
+                raise LexError(f"Illegal character {c!r} at index {lexpos}",
                                lexdata[lexpos:])
 
         if self.lexeoff:
@@ -303,6 +413,229 @@ class Lexer:
             raise RuntimeError('No input string given with input()')
         return None
 
+    # ------------------------------------------------------------
+    # coded_token() - Return the next token with the integer code
+    # of its type in .code, as assigned by set_tokencodes().  Types
+    # without a code get len(codes), which a parser treats as an
+    # error.
+    # ------------------------------------------------------------
+    def coded_token(self):
+        tok = self.token()
+        if tok:
+            tok.code = self.lextokencodes.get(tok.type, self.lexunknowncode)
+        return tok
+
+    def set_tokencodes(self, codes):
+        self.lextokencodes = codes
+        self.lexunknowncode = len(codes)
+
+    # ------------------------------------------------------------
+    # line_index() - Return the LineIndex of the current input.  It
+    # is made on first use and kept until the input changes.
+    # ------------------------------------------------------------
+    def line_index(self):
+        index = self.lexlineindex
+        if index is None or index.data is not self.lexdata or index.first != self.lexfirstline:
+            self.lexlineindex = index = LineIndex(self.lexdata, self.lexfirstline)
+        return index
+
+    # ------------------------------------------------------------
+    # intern() - Return the string equal to s that was first passed
+    # to intern() since the last input(), so that the values of
+    # repeated names share one object.  Token rules call it on
+    # the values they return.
+    # ------------------------------------------------------------
+    def intern(self, s):
+        return self.lexnames.setdefault(s, s)
+
+    # ------------------------------------------------------------
+    # dispatch() - Return a DispatchLexer that selects the rules to
+    # try by the first character at the current position
+    # ------------------------------------------------------------
+    def dispatch(self):
+        return DispatchLexer(self)
+
+    # ------------------------------------------------------------
+    # filtered() - Return a FilteredLexer passing the tokens of
+    # this lexer through the given filters
+    # ------------------------------------------------------------
+    def filtered(self, filters):
+        return FilteredLexer(self, filters)
+
+    # ------------------------------------------------------------
+    # candidates() - Return the (regex, findex) pairs to try at a
+    # position starting with the character c
+    # ------------------------------------------------------------
+    def candidates(self, c):
+        return self.lexre
+
+    # ------------------------------------------------------------
+    # tokenize_all() - Lex the whole string s into a TokenBuffer.
+    # Tokens of rules without a function are stored without ever
+    # creating a LexToken for them.
+    # ------------------------------------------------------------
+    def tokenize_all(self, s):
+        self.input(s)
+        buffer = TokenBuffer(s, sorted(self.lextokens_all), self.lexnames)
+
+        if self.lexeoff:
+            # An eof rule may push more input, so leave the end of it to token()
+            for tok in iter(self.token, None):
+                buffer.values[len(buffer)] = tok.value
+                buffer.append(tok.type, tok.lexpos, self.lexpos, tok.lineno)
+            buffer.lineno = self.lineno
+            return buffer
+
+        typecodes = buffer.typecodes
+        codes, starts, ends, lines = buffer.codes, buffer.starts, buffer.ends, buffer.lines
+        candidates = self.candidates
+        lexpos    = 0
+        lexlen    = self.lexlen
+        lexignore = self.lexignore
+        lexdata   = s
+
+        while lexpos < lexlen:
+            c = lexdata[lexpos]
+            if c in lexignore:
+                lexpos += 1
+                continue
+
+            for lexre, lexindexfunc in candidates(c):
+                m = lexre.match(lexdata, lexpos)
+                if not m:
+                    continue
+
+                func, toktype = lexindexfunc[m.lastindex]
+                end = m.end()
+
+                if not func:
+                    if toktype:
+                        codes.append(typecodes[toktype])
+                        starts.append(lexpos)
+                        ends.append(end)
+                        lines.append(self.lineno)
+                    lexpos = end
+                    break
+
+                tok = LexToken()
+                tok.value = value = m.group()
+                tok.lineno = self.lineno
+                tok.lexpos = lexpos
+                tok.type = toktype
+
+                tok.lexer = self
+                self.lexmatch = m
+                self.lexpos = end
+                newtok = func(tok)
+
+                lexpos    = self.lexpos
+                lexignore = self.lexignore
+                candidates = self.candidates
+                if newtok:
+                    # Values equal to the text are sliced again when asked for
+                    if newtok.value is not value and newtok.value != lexdata[newtok.lexpos:lexpos]:
+                        buffer.values[len(buffer)] = newtok.value
+                    buffer.append(newtok.type, newtok.lexpos, lexpos, newtok.lineno)
+                break
+            else:
+                if c in self.lexliterals:
+                    buffer.append(c, lexpos, lexpos + 1, self.lineno)
+                    lexpos += 1
+                    continue
+
+                if self.lexerrorf:
+                    tok = LexToken()
+                    tok.value = lexdata[lexpos:]
+                    tok.lineno = self.lineno
+                    tok.type = 'error'
+                    tok.lexer = self
+                    tok.lexpos = lexpos
+                    self.lexpos = lexpos
+                    newtok = self.lexerrorf(tok)
+                    if lexpos == self.lexpos:
+                        raise LexError(f"Scanning error. Illegal character {c!r}",
+                                       lexdata[lexpos:])
+                    if newtok:
+                        buffer.values[len(buffer)] = newtok.value
+                        buffer.append(newtok.type, newtok.lexpos, self.lexpos, newtok.lineno)
+                    lexpos = self.lexpos
+                    continue
+
+                self.lexpos = lexpos
+                raise LexError(f"Illegal character {c!r} at index {lexpos}",
+                               lexdata[lexpos:])
+
+        self.lexpos = lexpos + 1
+        buffer.lineno = self.lineno
+        return buffer
+
+    # ------------------------------------------------------------
+    # retokenize() - Return the TokenBuffer of the text of buffer
+    # with the removed characters at offset replaced by inserted,
+    # and the token delta (first, removed, added): from index
+    # first on, removed tokens of buffer are replaced by added new
+    # ones and the tokens after them are the same as before.
+    #
+    # Lexing restarts at the start of the line of the edit, or at
+    # the start of a token spanning into that line, and stops at
+    # the first line start after the edit where a token of the
+    # same type is found at the same place in the text as before.
+    # Like the StreamLexer, this takes the tokens of a line to
+    # depend only on the text from the start of the line on.
+    # ------------------------------------------------------------
+    def retokenize(self, buffer, offset, removed, inserted):
+        old = buffer.lexdata
+        data = old[:offset] + inserted + old[offset + removed:]
+        n = len(buffer)
+
+        if self.lexeoff:
+            self.lineno = _lineno_at(buffer, 0, 0)
+            new = self.tokenize_all(data)
+            return new, (0, n, len(new))
+
+        line_start = old.rfind('\n', 0, offset) + 1
+        first = bisect_right(buffer.ends, line_start)
+        start = line_start
+        if first < n and buffer.starts[first] < start:
+            start = buffer.starts[first]
+        end = offset + len(inserted)
+        shift = len(inserted) - removed
+
+        self.input(data)
+        self.lexpos = start
+        self.lineno = _lineno_at(buffer, first, start)
+        tail = TokenBuffer(data, buffer.types)
+        starts = buffer.starts
+        last = n
+        for tok in iter(self.token, None):
+            pos = tok.lexpos
+            if pos >= end and (pos == 0 or data[pos - 1] == '\n'):
+                j = bisect_left(starts, pos - shift, first)
+                if j < n and starts[j] == pos - shift and buffer.types[buffer.codes[j]] == tok.type:
+                    last = j
+                    break
+            if tok.value != data[pos:self.lexpos]:
+                tail.values[len(tail)] = tok.value
+            tail.append(tok.type, pos, self.lexpos, tok.lineno)
+        added = len(tail)
+
+        newlines = data.count('\n', offset, end) - old.count('\n', offset, offset + removed)
+        new = TokenBuffer(data, (), self.lexnames)
+        new.types, new.typecodes = tail.types, tail.typecodes
+        new.codes = buffer.codes[:first] + tail.codes + buffer.codes[last:]
+        new.starts = buffer.starts[:first] + tail.starts + _shifted(buffer.starts[last:], shift)
+        new.ends = buffer.ends[:first] + tail.ends + _shifted(buffer.ends[last:], shift)
+        new.lines = buffer.lines[:first] + tail.lines + _shifted(buffer.lines[last:], newlines)
+        for k, value in buffer.values.items():
+            if k < first:
+                new.values[k] = value
+            elif k >= last:
+                new.values[k - last + first + added] = value
+        for k, value in tail.values.items():
+            new.values[first + k] = value
+        new.lineno = buffer.lineno + newlines
+        return new, (first, last - first, added)
+
     # Iterator interface
     def __iter__(self):
         return self
@@ -313,6 +646,575 @@ class Lexer:
             raise StopIteration
         return t
 
+# Line number at offset pos of the input of buffer, which is at or before its token n
+def _lineno_at(buffer, n, pos):
+    if n < len(buffer):
+        return buffer.lines[n] - buffer.lexdata.count('\n', pos, buffer.starts[n])
+    return buffer.lineno - buffer.lexdata.count('\n', pos)
+
+def _shifted(numbers, shift):
+    if not shift:
+        return numbers
+    return array(numbers.typecode, map(shift.__add__, numbers))
+
+# -----------------------------------------------------------------------------
+#                             === Line Index ===
+#
+# A LineIndex maps offsets in a string to line numbers and columns and returns
+# the text of a line without scanning for the newlines around it.  It keeps the
+# offsets at which the lines start, so both are a binary search or a slice.
+# Lines and columns are counted from 1, or lines from first when the string
+# is a part of a larger input that starts on that line.
+# -----------------------------------------------------------------------------
+
+_newline = re.compile('\n')
+
+class LineIndex:
+    def __init__(self, data, first=1):
+        self.data = data
+        self.first = first
+        self.starts = array('q', [0])
+        self.starts.extend(m.end() for m in _newline.finditer(data))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __contains__(self, lineno):
+        return self.first <= lineno < self.first + len(self.starts)
+
+    def lineno(self, offset):
+        return bisect_right(self.starts, offset) + self.first - 1
+
+    def position(self, offset):
+        n = bisect_right(self.starts, offset)
+        return n + self.first - 1, offset - self.starts[n - 1] + 1
+
+    def line(self, lineno):
+        n = lineno - self.first + 1
+        start = self.starts[n - 1]
+        if n < len(self.starts):
+            return self.data[start:self.starts[n] - 1]
+        return self.data[start:]
+
+# -----------------------------------------------------------------------------
+#                           === Token Filters ===
+#
+# A FilteredLexer sits between a lexer and the parser and passes the tokens
+# through a chain of filters, so that the tokens the grammar has no use for
+# never reach the parsing loop.  A filter is a function taking an iterator of
+# tokens and returning an iterator of the tokens to pass on.  It may drop,
+# hold back or change tokens, but must pass on the token objects it got in
+# their order: the FilteredLexer finds the line number each token left the
+# lexer at by its identity.
+#
+# lineno is the line number of the lexer right after it produced the last
+# token handed out, as it would be without the filters.  removed() counts the
+# tokens each filter took out of the stream for the current input.
+# -----------------------------------------------------------------------------
+
+class FilteredLexer:
+    def __init__(self, lexer, filters):
+        self.lexer = lexer
+        self.filters = list(filters)
+        self.counts = [0] * (len(self.filters) + 1)
+        self.pending = deque()
+        self.stream = iter(())
+        self.lextokencodes = None
+        self.lexunknowncode = None
+        self._lineno = lexer.lineno
+
+    @property
+    def lineno(self):
+        return self._lineno
+
+    @lineno.setter
+    def lineno(self, lineno):
+        self._lineno = self.lexer.lineno = lineno
+
+    @property
+    def lexdata(self):
+        return self.lexer.lexdata
+
+    @property
+    def lexpos(self):
+        return self.lexer.lexpos
+
+    def line_index(self):
+        return self.lexer.line_index()
+
+    def input(self, s):
+        self.lexer.input(s)
+        self.pending.clear()
+        self.counts = [0] * (len(self.filters) + 1)
+        stream = self.source()
+        for n, f in enumerate(self.filters):
+            stream = f(self.counted(stream, n))
+        self.stream = self.counted(stream, len(self.filters))
+
+    def source(self):
+        lexer = self.lexer
+        pending = self.pending
+        while True:
+            tok = lexer.token()
+            if not tok:
+                return
+            pending.append((tok, lexer.lineno))
+            yield tok
+
+    def counted(self, tokens, n):
+        counts = self.counts
+        for tok in tokens:
+            counts[n] += 1
+            yield tok
+
+    def removed(self):
+        return {f.__name__: self.counts[n] - self.counts[n + 1] for n, f in enumerate(self.filters)}
+
+    def token(self):
+        tok = next(self.stream, None)
+        if tok is None:
+            self._lineno = self.lexer.lineno
+            return None
+        pending = self.pending
+        while pending:
+            t, lineno = pending.popleft()
+            if t is tok:
+                self._lineno = lineno
+                break
+        return tok
+
+    def coded_token(self):
+        tok = self.token()
+        if tok:
+            tok.code = self.lextokencodes.get(tok.type, self.lexunknowncode)
+        return tok
+
+    def set_tokencodes(self, codes):
+        self.lextokencodes = codes
+        self.lexunknowncode = len(codes)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        t = self.token()
+        if t is None:
+            raise StopIteration
+        return t
+
+# -----------------------------------------------------------------------------
+#                          === Streaming Input ===
+#
+# A StreamLexer lexes an input given as an iterable of text chunks, so that
+# the whole of it is never held as one string.  Every chunk is passed once to
+# split(chunk, state), which returns the offset in the chunk before which
+# every token of the input read so far is whole, or 0, and the state to scan
+# the next chunk with (None before the first one).  The chunks up to the cut
+# are joined and lexed as one window and the rest is carried into the next
+# one; on 0, more chunks are read.  The default cuts after the last newline,
+# which is right for lexers with no token spanning lines other than a newline.
+#
+# Each window is passed to the lexer with input().  lineno runs on across the
+# windows, line_index() numbers the lines of a window from the line it starts
+# on and intern() keeps one table for the whole input.  The lexpos of a token
+# is its offset in its window; base is the offset of the current window in
+# the input.
+# -----------------------------------------------------------------------------
+
+def _split_lines(text, state=None):
+    return text.rfind('\n') + 1, None
+
+class StreamLexer:
+    def __init__(self, lexer, split=None):
+        self.lexer = lexer
+        self.split = split or _split_lines
+        self.chunks = iter(())
+        self.rest = ''
+        self.state = None
+        self.base = 0
+        self.lextokencodes = None
+        self.lexunknowncode = None
+
+    @property
+    def lineno(self):
+        return self.lexer.lineno
+
+    @lineno.setter
+    def lineno(self, lineno):
+        self.lexer.lineno = lineno
+
+    @property
+    def lexdata(self):
+        return self.lexer.lexdata
+
+    @property
+    def lexpos(self):
+        return self.lexer.lexpos
+
+    def line_index(self):
+        return self.lexer.line_index()
+
+    def input(self, chunks):
+        self.chunks = iter(chunks)
+        self.rest = ''
+        self.state = None
+        self.base = 0
+        self.lexer.input('')
+
+    # Return the text of the next window, or None at the end of the input
+    def window(self):
+        pending = [self.rest]
+        for chunk in self.chunks:
+            cut, self.state = self.split(chunk, self.state)
+            if cut:
+                pending.append(chunk[:cut])
+                self.rest = chunk[cut:]
+                return ''.join(pending)
+            pending.append(chunk)
+        self.rest = ''
+        return ''.join(pending) or None
+
+    def token(self):
+        lexer = self.lexer
+        while True:
+            tok = lexer.token()
+            if tok:
+                return tok
+            text = self.window()
+            if text is None:
+                return None
+            self.base += len(lexer.lexdata)
+            lineno, names = lexer.lineno, lexer.lexnames
+            lexer.input(text)
+            lexer.lexfirstline, lexer.lexnames = lineno, names
+
+    def coded_token(self):
+        tok = self.token()
+        if tok:
+            tok.code = self.lextokencodes.get(tok.type, self.lexunknowncode)
+        return tok
+
+    def set_tokencodes(self, codes):
+        self.lextokencodes = codes
+        self.lexunknowncode = len(codes)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        t = self.token()
+        if t is None:
+            raise StopIteration
+        return t
+
+# -----------------------------------------------------------------------------
+#                           === Token Buffers ===
+#
+# Lexer.tokenize_all() returns the tokens of a whole input as a TokenBuffer:
+# parallel arrays of type codes, start and end offsets and line numbers.
+# The value of a token is the text between its offsets unless its rule
+# function replaced it; only those values are kept, in the dict values.
+# The text is interned in names, the lexnames of the input, when it is
+# sliced, so that it is the object Lexer.intern() gave the token rules.
+#
+# TokenBuffer.reader() returns an object with the token interface of a Lexer,
+# which the parsers use when a TokenBuffer is passed as their input.
+# -----------------------------------------------------------------------------
+
+class TokenBuffer:
+    def __init__(self, lexdata, types, names=None):
+        self.lexdata = lexdata        # Input string
+        self.types = list(types)      # Token types by code
+        self.typecodes = {toktype: code for code, toktype in enumerate(self.types)}
+        self.codes = array('H')       # Type code of each token
+        self.starts = array('q')      # Offset of the first character of each token
+        self.ends = array('q')        # Offset after the last character of each token
+        self.lines = array('I')       # Line number of each token
+        self.values = {}              # Values that differ from the token text, by index
+        self.names = {} if names is None else names  # Interned token texts
+        self.lineno = 1               # Line number at the end of the input
+        self.lineindex = None         # LineIndex of lexdata, made by line_index()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def append(self, toktype, start, end, lineno):
+        if toktype not in self.typecodes:
+            self.typecodes[toktype] = len(self.types)
+            self.types.append(toktype)
+        self.codes.append(self.typecodes[toktype])
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(lineno)
+
+    def type(self, n):
+        return self.types[self.codes[n]]
+
+    def value(self, n):
+        if n in self.values:
+            return self.values[n]
+        text = self.lexdata[self.starts[n]:self.ends[n]]
+        return self.names.setdefault(text, text)
+
+    def token(self, n):
+        tok = LexToken()
+        tok.type = self.types[self.codes[n]]
+        tok.value = self.value(n)
+        tok.lineno = self.lines[n]
+        tok.lexpos = self.starts[n]
+        return tok
+
+    def reader(self):
+        return TokenReader(self)
+
+    def line_index(self):
+        if self.lineindex is None:
+            self.lineindex = LineIndex(self.lexdata)
+        return self.lineindex
+
+# -----------------------------------------------------------------------------
+# TokenReader
+#
+# Hands out the tokens of a TokenBuffer one by one.  lineno and lexpos follow
+# the tokens read as they would follow a lexer producing them: after a token,
+# lineno is the line number of the next one.
+# -----------------------------------------------------------------------------
+
+class TokenReader:
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.lexdata = buffer.lexdata
+        self.lexpos = 0
+        self.lineno = buffer.lines[0] if len(buffer) else buffer.lineno
+        self.index = 0
+        self.lextokencodes = None
+
+    def input(self, s):
+        raise RuntimeError('A TokenReader can only read its TokenBuffer')
+
+    def line_index(self):
+        return self.buffer.line_index()
+
+    def token(self):
+        buffer = self.buffer
+        n = self.index
+        if n >= len(buffer.codes):
+            return None
+        tok = buffer.token(n)
+        self.index = n + 1
+        self.lexpos = buffer.ends[n]
+        self.lineno = buffer.lines[n + 1] if n + 1 < len(buffer.codes) else buffer.lineno
+        return tok
+
+    # ------------------------------------------------------------
+    # coded_token() - Return the next token with the code assigned
+    # to its type by set_tokencodes() in .code
+    # ------------------------------------------------------------
+    def coded_token(self):
+        n = self.index
+        tok = self.token()
+        if tok:
+            tok.code = self.lextokencodes[self.buffer.codes[n]]
+        return tok
+
+    def set_tokencodes(self, codes):
+        self.lextokencodes = [codes.get(toktype, len(codes)) for toktype in self.buffer.types]
+
+# -----------------------------------------------------------------------------
+#                        === Dispatching Lexer ===
+#
+# Lexer.token() tries the whole master regex at every position, so the regex
+# engine walks through all of the alternatives that cannot start with the
+# character at hand.  A DispatchLexer splits the rules of every state into
+# buckets keyed by the characters a match may start with and only tries the
+# bucket of the current character.
+#
+# A bucket keeps the rules in the order of the master regex, so the first
+# matching alternative -- and with it the token -- is always the one the master
+# regex would have found.  Rules of which the first character can't be listed
+# (classes such as \d, '.', negated sets) are put in a bucket whenever they
+# may start with its character.
+# -----------------------------------------------------------------------------
+
+_CATEGORY_TEXT = {
+    sre_parse.CATEGORY_DIGIT: r'\d', sre_parse.CATEGORY_NOT_DIGIT: r'\D',
+    sre_parse.CATEGORY_SPACE: r'\s', sre_parse.CATEGORY_NOT_SPACE: r'\S',
+    sre_parse.CATEGORY_WORD: r'\w', sre_parse.CATEGORY_NOT_WORD: r'\W',
+}
+
+_REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT}
+if hasattr(sre_parse, 'POSSESSIVE_REPEAT'):
+    _REPEATS.add(sre_parse.POSSESSIVE_REPEAT)
+
+# Regexs without any special characters match just their own text
+_is_plain = re.compile(r'[^\\.^$*+?{}\[\]|()#\s]*\Z')
+
+def _any_char(c):
+    return True
+
+# -----------------------------------------------------------------------------
+# _first_chars()
+#
+# Collects the characters a parsed regex may start with.  Returns a tuple
+# (chars, tests, nullable) where chars is a set of characters, tests a list of
+# predicates for the first characters that can't be listed and nullable tells
+# whether the regex can match without consuming anything.  The result may be
+# larger than the real set, but never smaller.
+# -----------------------------------------------------------------------------
+def _first_chars(pattern, reflags):
+    chars = set()
+    tests = []
+    for op, av in pattern:
+        nullable = False
+        if op is sre_parse.LITERAL:
+            chars.add(chr(av))
+        elif op is sre_parse.IN:
+            for iop, iav in av:
+                if iop is sre_parse.LITERAL:
+                    chars.add(chr(iav))
+                elif iop is sre_parse.RANGE and iav[1] - iav[0] < 256:
+                    chars.update(chr(c) for c in range(iav[0], iav[1] + 1))
+                elif iop is sre_parse.RANGE:
+                    tests.append(lambda c, lo=iav[0], hi=iav[1]: lo <= ord(c) <= hi)
+                elif iop is sre_parse.CATEGORY and iav in _CATEGORY_TEXT:
+                    tests.append(re.compile(_CATEGORY_TEXT[iav], reflags & re.ASCII).match)
+                else:
+                    tests.append(_any_char)
+        elif op is sre_parse.SUBPATTERN and not av[1] & re.IGNORECASE:
+            subchars, subtests, nullable = _first_chars(av[-1], reflags)
+            chars |= subchars
+            tests += subtests
+        elif op is sre_parse.BRANCH:
+            for item in av[1]:
+                subchars, subtests, subnullable = _first_chars(item, reflags)
+                chars |= subchars
+                tests += subtests
+                nullable = nullable or subnullable
+        elif op in _REPEATS:
+            subchars, subtests, nullable = _first_chars(av[2], reflags)
+            chars |= subchars
+            tests += subtests
+            nullable = nullable or av[0] == 0
+        elif op is sre_parse.AT:
+            nullable = True
+        else:
+            tests.append(_any_char)
+        if not nullable:
+            return chars, tests, False
+    return chars, tests, True
+
+# -----------------------------------------------------------------------------
+# _split_master_re()
+#
+# Splits the text of a master regex back into the '(?P<name>regex)' items of
+# its rules.  names are the rule names in the order of the master regex.
+# -----------------------------------------------------------------------------
+def _split_master_re(text, names):
+    starts = [0]
+    for name in names[1:]:
+        starts.append(text.index('|(?P<%s>' % name, starts[-1]) + 1)
+    ends = [start - 1 for start in starts[1:]] + [len(text)]
+    return [text[start:end] for start, end in zip(starts, ends)]
+
+# -----------------------------------------------------------------------------
+# _form_bucket_re()
+#
+# Compiles the rules of a bucket the same way _form_master_re() compiles all
+# of them.  ruleinfo maps rule names to the (function, token type) entries of
+# the master regexs.
+# -----------------------------------------------------------------------------
+def _form_bucket_re(items, ruleinfo, reflags):
+    if not items:
+        return []
+    try:
+        lexre = re.compile('|'.join(items), reflags)
+        lexindexfunc = [None] * (max(lexre.groupindex.values()) + 1)
+        for f, i in lexre.groupindex.items():
+            lexindexfunc[i] = ruleinfo.get(f)
+        return [(lexre, lexindexfunc)]
+    except Exception:
+        m = (len(items) // 2) + 1
+        return _form_bucket_re(items[:m], ruleinfo, reflags) + _form_bucket_re(items[m:], ruleinfo, reflags)
+
+# -----------------------------------------------------------------------------
+# _Buckets
+#
+# The buckets of one lexer state.  The bucket of a character is made by
+# bucket() on its first use and kept in the dict table, so only the rules
+# for the characters that actually occur in the input are compiled.
+# Characters with the same rules share the compiled regexs.
+# -----------------------------------------------------------------------------
+class _Buckets:
+    def __init__(self, items, ruleinfo, reflags):
+        self.items = items
+        self.ruleinfo = ruleinfo
+        self.reflags = reflags
+        self.firsts = []
+        for name, item in items:
+            regex = item[len(name) + 5:-1]
+            if not _is_plain.match(regex):
+                chars, tests, nullable = _first_chars(sre_parse.parse(regex, reflags), reflags)
+            elif regex:
+                chars, tests, nullable = {regex[0]}, [], False
+            else:
+                chars, tests, nullable = set(), [], True
+            if nullable or reflags & re.IGNORECASE:
+                tests = [_any_char]
+            self.firsts.append((chars, tests))
+        self.compiled = {}
+        self.table = {}
+
+    def bucket(self, c):
+        selected = [rule for rule, (chars, tests) in zip(self.items, self.firsts)
+                    if c in chars or any(test(c) for test in tests)]
+        key = tuple(name for name, _ in selected)
+        if key not in self.compiled:
+            self.compiled[key] = _form_bucket_re([item for _, item in selected], self.ruleinfo, self.reflags)
+        bucket = self.table[c] = self.compiled[key]
+        return bucket
+
+class DispatchLexer(Lexer):
+    def __init__(self, lexer):
+        self.__dict__.update(lexer.__dict__)
+        self.build_dispatch()
+        self.begin(self.lexstate)
+
+    # ------------------------------------------------------------
+    # build_dispatch() - Set up the buckets of every state from the
+    # master regexs in lexstatebuckets
+    # ------------------------------------------------------------
+    def build_dispatch(self):
+        self.lexstatebuckets = {}
+        for state, lre in self.lexstatere.items():
+            items = []
+            ruleinfo = {}
+            for (pat, findex), text, renames in zip(lre, self.lexstateretext[state],
+                                                    self.lexstaterenames[state]):
+                names = [name for name in renames if name]
+                items.extend(zip(names, _split_master_re(text, names)))
+                for name, entry in zip(renames, findex):
+                    if name:
+                        ruleinfo[name] = entry
+            self.lexstatebuckets[state] = _Buckets(items, ruleinfo, self.lexreflags)
+
+    def clone(self, object=None):
+        c = Lexer.clone(self, object)
+        if object:
+            c.build_dispatch()
+            c.begin(c.lexstate)
+        return c
+
+    def begin(self, state):
+        Lexer.begin(self, state)
+        self.lexbuckets = self.lexstatebuckets[state]
+        self.lexdispatch = self.lexbuckets.table
+
+    def candidates(self, c):
+        bucket = self.lexdispatch.get(c)
+        if bucket is None:
+            bucket = self.lexbuckets.bucket(c)
+        return bucket
+
 # -----------------------------------------------------------------------------
 #                           ==== Lex Builder ===
 #
@@ -340,6 +1242,39 @@ def get_caller_module_dict(levels):
     f = sys._getframe(levels)
     return { **f.f_globals, **f.f_locals }
 
+# -----------------------------------------------------------------------------
+# _funcs_to_names()
+# _names_to_funcs()
+#
+# Given a list of regular expression functions, these replace the functions by
+# their names and back again.  They are used to store lexers in a cache file.
+# -----------------------------------------------------------------------------
+def _funcs_to_names(funclist, namelist):
+    result = []
+    for f, name in zip(funclist, namelist):
+        if f and f[0]:
+            result.append((name, f[1]))
+        else:
+            result.append(f)
+    return result
+
+def _names_to_funcs(namelist, fdict):
+    result = []
+    for n in namelist:
+        if n and n[0]:
+            result.append((fdict[n[0]], n[1]))
+        else:
+            result.append(n)
+    return result
+
+# -----------------------------------------------------------------------------
+# signature_digest()
+#
+# Cached lexers are keyed on a digest of LexerReflect.signature().
+# -----------------------------------------------------------------------------
+def signature_digest(signature):
+    return hashlib.sha256(signature.encode('utf-8')).hexdigest()
+
 # -----------------------------------------------------------------------------
 # _form_master_re()
 #
@@ -434,6 +1369,26 @@ class LexerReflect(object):
         self.validate_rules()
         return self.error
 
+    # Compute a signature over the token rules.  Rules are listed in the
+    # order in which they end up in the master regular expression.  Returns
+    # None if the rules are too malformed to describe, so that no cached
+    # lexer is used for them.
+    def signature(self):
+        try:
+            parts = [' '.join(self.tokens), repr(self.literals), repr(self.stateinfo), str(int(self.reflags))]
+            for state in self.stateinfo:
+                for fname, f in self.funcsym[state]:
+                    parts.append(f'{state}:{fname}={_get_regex(f)}')
+                for name, r in self.strsym[state]:
+                    parts.append(f'{state}:{name}={r}')
+                parts.append(f'{state}:ignore={self.ignore.get(state, "")}')
+                for name, funcs in (('error', self.errorf), ('eof', self.eoff)):
+                    f = funcs.get(state)
+                    parts.append(f'{state}:{name}={f.__name__ if f else ""}')
+        except (TypeError, ValueError, AttributeError):
+            return None
+        return '\n'.join(parts)
+
     # Get the tokens map
     def get_tokens(self):
         tokens = self.ldict.get('tokens', None)
@@ -715,7 +1670,7 @@ class LexerReflect(object):
 # Build all of the regular expression rules from definitions in the supplied module
 # -----------------------------------------------------------------------------
 def lex(*, module=None, object=None, debug=False, 
-        reflags=int(re.VERBOSE), debuglog=None, errorlog=None):
+        reflags=int(re.VERBOSE), debuglog=None, errorlog=None, picklefile=None):
 
     global lexer
 
@@ -748,6 +1703,25 @@ def lex(*, module=None, object=None, debug=False,
     # Collect parser information from the dictionary
     linfo = LexerReflect(ldict, log=errorlog, reflags=reflags)
     linfo.get_all()
+
+    # Try to restore the lexer from the cache file.  A matching signature means
+    # the rules were validated when the file was written.
+    signature = linfo.signature()
+    if picklefile and signature is None:
+        picklefile = None
+    if picklefile and not debug:
+        try:
+            if lexobj.read_pickle(picklefile, ldict) == signature_digest(signature):
+                token = lexobj.token
+                input = lexobj.input
+                lexer = lexobj
+                return lexobj
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            errorlog.warning('There was a problem loading the lexer table file: %r', e)
+        lexobj = Lexer()
+
     if linfo.validate_all():
         raise SyntaxError("Can't build lexer")
 
@@ -845,6 +1819,12 @@ def lex(*, module=None, object=None, debug=False,
             if s not in linfo.ignore:
                 linfo.ignore[s] = linfo.ignore.get('INITIAL', '')
 
+    if picklefile:
+        try:
+            lexobj.pickle_table(picklefile, signature)
+        except IOError as e:
+            errorlog.warning("Couldn't create %r. %s" % (picklefile, e))
+
     # Create global versions of the token() and input() functions
     token = lexobj.token
     input = lexobj.input
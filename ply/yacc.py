@@ -63,8 +63,20 @@
 
 import re
 import types
+import copy
 import sys
+import os
 import inspect
+import dis
+import importlib
+import importlib.util
+import hashlib
+import marshal
+import pickle
+import time
+from array import array
+
+__tabversion__ = '2022.10.27-1'   # Version of the cached table format
 
 #-----------------------------------------------------------------------------
 #                     === User configurable parameters ===
@@ -81,6 +93,8 @@ resultlimit = 40               # Size limit of results when running in debug mod
 
 MAXINT = sys.maxsize
 
+pickle_protocol = pickle.HIGHEST_PROTOCOL   # Protocol used for cached tables
+
 # This object is a stand-in for a logging object created by the
 # logging module.   PLY will use this by default to create things
 # such as the parser.out file.  If a user wants more detailed
@@ -116,6 +130,10 @@ class NullLogger(object):
 class YaccError(Exception):
     pass
 
+# Exception raised when a cached table file was written by another version
+class VersionError(YaccError):
+    pass
+
 # Format the result message that the parser produces when running in debug mode.
 def format_result(r):
     repr_str = repr(r)
@@ -152,8 +170,13 @@ def format_stack_entry(r):
 #        .endlineno  = Ending line number (optional, set automatically)
 #        .lexpos     = Starting lex position
 #        .endlexpos  = Ending lex position (optional, set automatically)
+#
+# Symbols are allocated for every reduction, so like LexToken they have slots
+# instead of a __dict__.
 
 class YaccSymbol:
+    __slots__ = ('type', 'value', 'lineno', 'lexpos', 'endlineno', 'endlexpos', 'lexer', 'code')
+
     def __str__(self):
         return self.type
 
@@ -169,12 +192,20 @@ class YaccSymbol:
 # for a symbol.  The lexspan() method returns a tuple (lexpos,endlexpos)
 # representing the range of positional information for a symbol.
 
+#
+# values is the list of the values of the right-hand side symbols, as p[1:]
+# returns it, made by the parser before it calls a rule that reads p.values.
+# It is a plain attribute, so reading it costs no call to __getitem__.
+
 class YaccProduction:
+    __slots__ = ('slice', 'stack', 'lexer', 'parser', 'values')
+
     def __init__(self, s, stack=None):
         self.slice = s
         self.stack = stack
         self.lexer = None
         self.parser = None
+        self.values = None
 
     def __getitem__(self, n):
         if isinstance(n, slice):
@@ -218,6 +249,49 @@ class YaccProduction:
     def error(self):
         raise SyntaxError
 
+# The parsers only make p.values for the rules that read it: the ones whose
+# code names values, and any callable whose code can't be
+# seen.  The other rules get None, so a rule reading it by some other way fails
+# instead of finding the values of the rule reduced before.
+
+def reads_values(func):
+    code = getattr(inspect.unwrap(func), '__code__', None)
+    return code is None or 'values' in code.co_names
+
+# p_error() may take the parser as a second argument.  It is called with None
+# for the token at the end of the input, and then finds the lexer the parse
+# read, and its position, as parser.lexer.
+
+def error_takes_parser(func):
+    return func is not None and len(inspect.signature(func).parameters) == 2
+
+# Grammar rules whose whole action is p[0] = p[1] pass the value of their first
+# symbol through unchanged.  They are recognized by comparing their bytecode
+# with the one of identity_rule().
+
+def identity_rule(p):
+    p[0] = p[1]
+
+def rule_instructions(func):
+    return [(i.opname, i.argval if i.opcode in dis.hasconst else i.arg) for i in dis.get_instructions(func)]
+
+def is_identity_rule(func):
+    return isinstance(func, types.FunctionType) and rule_instructions(func) == rule_instructions(identity_rule)
+
+# The parsers read their tokens from the lexer, which is given the input string
+# first.  A TokenBuffer made by Lexer.tokenize_all() is read directly instead.
+# Without a lexer, the last one built by lex() is used.
+
+def input_lexer(input, lexer):
+    from . import lex
+    if isinstance(input, lex.TokenBuffer):
+        return input.reader()
+    if not lexer:
+        lexer = lex.lexer
+    if input is not None:
+        lexer.input(input)
+    return lexer
+
 # -----------------------------------------------------------------------------
 #                               == LRParser ==
 #
@@ -225,11 +299,14 @@ class YaccProduction:
 # -----------------------------------------------------------------------------
 
 class LRParser:
-    def __init__(self, lrtab, errorf):
+    def __init__(self, lrtab, errorf, beginf=None):
         self.productions = lrtab.lr_productions
         self.action = lrtab.lr_action
         self.goto = lrtab.lr_goto
         self.errorfunc = errorf
+        self.errorparser = error_takes_parser(errorf)  # p_error() is also given the parser
+        self.beginfunc = beginf              # p_begin(), called with the parser before every parse
+        self.signature = None                # Digest of the grammar signature (set by yacc())
         self.set_defaulted_states()
         self.errorok = True
 
@@ -262,6 +339,83 @@ class LRParser:
     def disable_defaulted_states(self):
         self.defaulted_states = {}
 
+    # Unit production elimination.
+    # A state whose only action, whatever the lookahead, is the reduction of an
+    # identity unit rule A -> B (see is_identity_rule()) does no work: the value
+    # of B becomes the value of A.  Every shift or goto on B from a state s into
+    # such a state is redirected to goto(s, A), and so on along chains of unit
+    # rules, so that the reductions never happen.  A transition is not redirected
+    # into a defaulted state, which would reduce before reading the lookahead
+    # that the skipped state used to read first.  As with default reductions, a
+    # syntax error may be detected after more reductions than without
+    # elimination, but never after the erroneous token is shifted.
+    #
+    # Returns the number of transitions that were redirected.
+
+    def collapse_unit_productions(self):
+        unitstates = {}
+        for state, actions in self.action.items():
+            rules = set(actions.values())
+            if len(rules) == 1 and min(rules) < 0:
+                p = self.productions[-min(rules)]
+                if p.len == 1 and is_identity_rule(p.callable):
+                    unitstates[state] = p.name
+
+        def collapse(state, target):
+            while target in unitstates:
+                t = self.goto[state].get(unitstates[target])
+                if t is None or t in self.defaulted_states:
+                    break
+                target = t
+            return target
+
+        count = 0
+        for table in (self.action, self.goto):
+            for state, row in table.items():
+                for name, target in row.items():
+                    if target is not None and target > 0 and target in unitstates:
+                        collapsed = collapse(state, target)
+                        if collapsed != target:
+                            row[name] = collapsed
+                            count += 1
+        return count
+
+    # write_table().
+    #
+    # Writes the parsing tables to a self-contained Python module.  The module
+    # only holds literals: the action and goto tables, the productions together
+    # with the names of the functions they reduce with, the table version and
+    # the signature digest of the grammar.  It is loaded with yacc(tabmodule=...),
+    # which checks the signature and skips all grammar analysis.
+
+    def write_table(self, filename):
+        basemodulename = os.path.splitext(os.path.basename(filename))[0]
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write('# %s.py\n' % basemodulename)
+            f.write('# This file is automatically generated. Do not edit.\n')
+            f.write('# pylint: disable=W,C,R\n')
+            f.write('_tabversion = %r\n\n' % __tabversion__)
+            f.write('_lr_signature = %r\n\n' % self.signature)
+
+            f.write('_lr_action = {\n')
+            for state, actions in self.action.items():
+                f.write('    %r: %r,\n' % (state, actions))
+            f.write('}\n\n')
+
+            f.write('_lr_goto = {\n')
+            for state, gotos in self.goto.items():
+                f.write('    %r: %r,\n' % (state, gotos))
+            f.write('}\n\n')
+
+            f.write('_lr_productions = [\n')
+            for p in self.productions:
+                if p.func:
+                    f.write('    (%r, %r, %d, %r, %r, %d),\n' % (p.str, p.name, p.len, p.func,
+                                                              os.path.basename(p.file), p.line))
+                else:
+                    f.write('    (%r, %r, %d, None, None, None),\n' % (str(p), p.name, p.len))
+            f.write(']\n')
+
     # parse().
     #
     # This is the core parsing engine.  To operate, it requires a lexer object.
@@ -275,11 +429,16 @@ class LRParser:
         if isinstance(debug, int) and debug:
             debug = PlyLogger(sys.stderr)
 
+        # Let the grammar set up the state of a new parse
+        if self.beginfunc:
+            self.beginfunc(self)
+
         lookahead = None                         # Current lookahead symbol
         lookaheadstack = []                      # Stack of lookahead symbols
         actions = self.action                    # Local reference to action table (to avoid lookup on self.)
         goto    = self.goto                      # Local reference to goto table (to avoid lookup on self.)
         prod    = self.productions               # Local reference to production list (to avoid lookup on self.)
+        reads   = [reads_values(p.callable) for p in prod]  # Productions whose rule reads p.values
         defaulted_states = self.defaulted_states # Local reference to defaulted states
         pslice  = YaccProduction(None)           # Production object passed to grammar rules
         errorcount = 0                           # Used during error recovery
@@ -287,19 +446,13 @@ class LRParser:
         if debug:
             debug.info('PLY: PARSE DEBUG START')
 
-        # If no lexer was given, we will try to use the lex module
-        if not lexer:
-            from . import lex
-            lexer = lex.lexer
+        # Get the lexer the tokens are read from
+        lexer = self.lexer = input_lexer(input, lexer)
 
         # Set up the lexer and parser objects on pslice
         pslice.lexer = lexer
         pslice.parser = self
 
-        # If input was supplied, pass to lexer
-        if input is not None:
-            lexer.input(input)
-
         # Set the token function
         get_token = self.token = lexer.token
 
@@ -401,6 +554,7 @@ class LRParser:
                         # changes get made in both locations.
 
                         pslice.slice = targ
+                        pslice.values = [s.value for s in targ[1:]] if reads[-t] else None
 
                         try:
                             # Call the grammar rule with our special slice object
@@ -441,6 +595,7 @@ class LRParser:
                         # changes get made in both locations.
 
                         pslice.slice = targ
+                        pslice.values = [] if reads[-t] else None
 
                         try:
                             # Call the grammar rule with our special slice object
@@ -500,7 +655,7 @@ class LRParser:
                         if errtoken and not hasattr(errtoken, 'lexer'):
                             errtoken.lexer = lexer
                         self.state = state
-                        tok = self.errorfunc(errtoken)
+                        tok = self.errorfunc(errtoken, self) if self.errorparser else self.errorfunc(errtoken)
                         if self.errorok:
                             # User must have done some kind of panic
                             # mode recovery on their own.  The
@@ -580,6 +735,427 @@ class LRParser:
             # If we'r here, something really bad happened
             raise RuntimeError('yacc: internal parser error!!!\n')
 
+    # compile().
+    #
+    # Returns a CompiledLRParser that runs the same automaton as generated code
+    # instead of interpreting the tables.  Compiling the generated source takes
+    # most of the time; with a cachefile the code object is kept there.
+
+    def compile(self, cachefile=None):
+        return CompiledLRParser(self, cachefile)
+
+    # pack().
+    #
+    # Returns a PackedLRParser that runs on integer token codes and
+    # compressed array tables.
+
+    def pack(self):
+        return PackedLRParser(self)
+
+    # clone().
+    #
+    # Returns a parser of the same class sharing the tables (and the generated
+    # code or the packed arrays) of this one.  A parse keeps its stacks on the
+    # parser object, so threads parsing at the same time need a clone each.
+
+    def clone(self):
+        c = copy.copy(self)
+        for name in ('token', 'lexer', 'statestack', 'symstack', 'state'):
+            c.__dict__.pop(name, None)
+        c.errorok = True
+        return c
+
+# -----------------------------------------------------------------------------
+#                           == CompiledLRParser ==
+#
+# An alternative parsing engine.  The LALR automaton is translated into Python
+# source with one function per parser state.  A state function fetches the
+# lookahead (unless the state is defaulted), looks the action up in a dict
+# private to that state and then either shifts or performs the reduction
+# inline: the production length, the rule function and the goto row of the
+# reduced nonterminal are constants of the generated code.  Each function
+# returns the function of the next state and parse() runs them in a loop
+# until the input is accepted.
+#
+# The lookahead is fetched at exactly the same points as in LRParser.parse(),
+# so grammar rules that inspect the lexer see the same state.  Error recovery
+# is not supported: on the first syntax error the error function is called
+# and, if it returns, a YaccError is raised.  Debugging and position tracking
+# fall back to the table-driven engine.
+# -----------------------------------------------------------------------------
+
+class CompiledLRParser(LRParser):
+    def __init__(self, parser, cachefile=None):
+        self.productions = parser.productions
+        self.action = parser.action
+        self.goto = parser.goto
+        self.errorfunc = parser.errorfunc
+        self.errorparser = parser.errorparser
+        self.beginfunc = parser.beginfunc
+        self.signature = parser.signature
+        self.defaulted_states = parser.defaulted_states
+        self.errorok = True
+        self.source = self.generate_code()
+        namespace = {}
+        exec(self.compile_source(cachefile), namespace)
+        self.make_states = namespace['make_states']
+
+    # compile_source().
+    #
+    # Returns the code object of the generated source.  A cachefile keeps it in
+    # marshal format with the magic number of the interpreter and a digest of
+    # the source; it is used while both match and written again otherwise.
+
+    def compile_source(self, cachefile):
+        key = (importlib.util.MAGIC_NUMBER, hashlib.sha256(self.source.encode('utf-8')).hexdigest())
+        if cachefile:
+            try:
+                with open(cachefile, 'rb') as f:
+                    magic, digest, code = marshal.load(f)
+                if (magic, digest) == key:
+                    return code
+            except Exception:
+                pass
+
+        code = compile(self.source, '<compiled parser %s>' % (self.signature or ''), 'exec')
+        if cachefile:
+            try:
+                dirname = os.path.dirname(cachefile)
+                if dirname:
+                    os.makedirs(dirname, exist_ok=True)
+                tmpname = '%s.%d.tmp' % (cachefile, os.getpid())
+                with open(tmpname, 'wb') as f:
+                    marshal.dump(key + (code,), f)
+                os.replace(tmpname, cachefile)
+            except OSError:
+                pass
+        return code
+
+    # generate_code().
+    #
+    # Returns the source of the module defining make_states(), which builds the
+    # state functions for a single parse.
+
+    def generate_code(self):
+        prods = self.productions
+        nonterminals = sorted({p.name for p in prods})
+        gotos = {name: {} for name in nonterminals}
+        for state, row in self.goto.items():
+            for name, target in row.items():
+                gotos[name][state] = target
+
+        lines = []
+        emit = lines.append
+
+        def emit_reduce(n, indent):
+            p = prods[n]
+            code = ['# reduce %s' % p.str.replace('\n', ' '),
+                    'sym = YaccSymbol()',
+                    'sym.type = %r' % p.name,
+                    'sym.value = None']
+            if p.len:
+                code += ['targ = symstack[-%d:]' % (p.len + 1),
+                         'targ[0] = sym',
+                         'pslice.slice = targ',
+                         'pslice.values = [%s] if reads_%d else None' % (', '.join('targ[%d].value' % i for i in range(1, p.len + 1)), n),
+                         'del symstack[-%d:]' % p.len,
+                         'rule_%d(pslice)' % n,
+                         'del statestack[-%d:]' % p.len]
+            else:
+                code += ['pslice.slice = [sym]',
+                         'pslice.values = [] if reads_%d else None' % n,
+                         'rule_%d(pslice)' % n]
+            code += ['symstack.append(sym)',
+                     'state = goto_%d[statestack[-1]]' % nonterminals.index(p.name),
+                     'statestack.append(state)',
+                     'return states[state]']
+            lines.extend(indent + line for line in code)
+
+        emit('# Generated by CompiledLRParser.  Do not edit.')
+        emit('def make_states(get_token, rules, reads, pslice, syntax_error, YaccSymbol):')
+        emit('    lookahead = None')
+        emit('    statestack = [0]')
+        emit('    sym = YaccSymbol()')
+        emit("    sym.type = '$end'")
+        emit('    symstack = [sym]')
+        emit('    pslice.stack = symstack')
+        emit('')
+        for state, actions in sorted(self.action.items()):
+            emit('    def state_%d():' % state)
+            if state in self.defaulted_states:
+                emit_reduce(-self.defaulted_states[state], '        ')
+                emit('')
+                continue
+
+            emit('        nonlocal lookahead')
+            emit('        if lookahead is None:')
+            emit('            lookahead = get_token()')
+            emit('            if not lookahead:')
+            emit('                lookahead = YaccSymbol()')
+            emit("                lookahead.type = '$end'")
+            emit('        t = actions_%d.get(lookahead.type)' % state)
+            emit('        if t is None:')
+            emit('            syntax_error(lookahead)')
+            if any(t > 0 for t in actions.values()):
+                emit('        if t > 0:')
+                emit('            statestack.append(t)')
+                emit('            symstack.append(lookahead)')
+                emit('            lookahead = None')
+                emit('            return states[t]')
+            reductions = sorted({-t for t in actions.values() if t < 0})
+            accepts = 0 in actions.values()
+            for i, n in enumerate(reductions):
+                if i == len(reductions) - 1 and not accepts:
+                    emit_reduce(n, '        ')
+                else:
+                    emit('        if t == %d:' % -n)
+                    emit_reduce(n, '            ')
+            if accepts:
+                emit('        return None')
+            emit('')
+
+        for state, actions in sorted(self.action.items()):
+            if state not in self.defaulted_states:
+                emit('    actions_%d = %r' % (state, actions))
+        for i, name in enumerate(nonterminals):
+            emit('    goto_%d = %r  # %s' % (i, gotos[name], name))
+        for n in range(1, len(prods)):
+            emit('    rule_%d = rules[%d]' % (n, n))
+            emit('    reads_%d = reads[%d]' % (n, n))
+        emit('    states = [%s]' % ', '.join('state_%d' % state for state in sorted(self.action)))
+        emit('    return states[0], symstack')
+        return '\n'.join(lines) + '\n'
+
+    def parse(self, input=None, lexer=None, debug=False, tracking=False):
+        if debug or tracking:
+            return LRParser.parse(self, input, lexer, debug, tracking)
+        if self.beginfunc:
+            self.beginfunc(self)
+
+        lexer = self.lexer = input_lexer(input, lexer)
+
+        pslice = YaccProduction(None)
+        pslice.lexer = lexer
+        pslice.parser = self
+
+        def syntax_error(lookahead):
+            errtoken = lookahead
+            if errtoken.type == '$end':
+                errtoken = None
+            if self.errorfunc:
+                if errtoken and not hasattr(errtoken, 'lexer'):
+                    errtoken.lexer = lexer
+                self.errorfunc(errtoken, self) if self.errorparser else self.errorfunc(errtoken)
+            raise YaccError('Syntax error at %s' % (errtoken.type if errtoken else 'EOF'))
+
+        self.token = lexer.token
+        rules = [p.callable for p in self.productions]
+        state, symstack = self.make_states(lexer.token, rules, [reads_values(rule) for rule in rules],
+                                           pslice, syntax_error, YaccSymbol)
+        self.symstack = symstack
+        while state is not None:
+            state = state()
+
+        return getattr(symstack[-1], 'value', None)
+
+# -----------------------------------------------------------------------------
+#                            == PackedLRParser ==
+#
+# The LR parsing engine running on compressed tables.  Terminals and
+# nonterminals are numbered ('$end' is terminal 0) and the lexer is asked to
+# put the code of each token in tok.code (see Lexer.set_tokencodes()).
+#
+# Every row of the action table keeps only the entries that differ from its
+# default action, the reduction that occurs most often in the row.  The rows
+# are then overlaid in a single array by row displacement: the action of state
+# s on terminal a is table[base[s] + a] if check[base[s] + a] == s and
+# default[s] otherwise.  The goto table is packed the same way by columns,
+# with the most frequent target state of every nonterminal as its default.
+#
+# As in yacc, a default reduction may be performed on a token that is not
+# valid in the state; the error is then reported before that token is
+# shifted.  Error recovery is not supported (see CompiledLRParser).
+# -----------------------------------------------------------------------------
+
+# Action used for the blank entries of rows without a default reduction
+PACKED_ERROR = 0x7fffffff
+
+def pack_rows(rows, width):
+    # First fit: each row is placed at the lowest displacement where its
+    # entries fall on free slots.
+    base = array('i', [0] * len(rows))
+    check = array('i')
+    table = array('i')
+    used = 0                              # Bit set of the occupied slots
+    free = 0                              # Lowest free slot
+    order = sorted(range(len(rows)), key=lambda r: -len(rows[r]))
+    for r in order:
+        row = rows[r]
+        mask = sum(1 << c for c in row)
+        displacement = max(free - min(row, default=0), 0)
+        while (used >> displacement) & mask:
+            displacement += 1
+        used |= mask << displacement
+        while (used >> free) & 1:
+            free += 1
+        size = displacement + width + 1
+        if size > len(check):
+            check.extend([-1] * (size - len(check)))
+            table.extend([0] * (size - len(table)))
+        for c, value in row.items():
+            check[displacement + c] = r
+            table[displacement + c] = value
+        base[r] = displacement
+    return base, check, table
+
+def most_common(values):
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return max(counts, key=counts.get) if counts else None
+
+class PackedLRParser(LRParser):
+    def __init__(self, parser):
+        self.productions = parser.productions
+        self.action = parser.action
+        self.goto = parser.goto
+        self.errorfunc = parser.errorfunc
+        self.errorparser = parser.errorparser
+        self.beginfunc = parser.beginfunc
+        self.signature = parser.signature
+        self.defaulted_states = parser.defaulted_states
+        self.errorok = True
+
+        terminals = {name for actions in self.action.values() for name in actions}
+        terminals.discard('$end')
+        self.terminals = ['$end'] + sorted(terminals)
+        self.tokencodes = {name: code for code, name in enumerate(self.terminals)}
+        self.nonterminals = sorted({p.name for p in self.productions})
+        self.symbolcodes = {name: code for code, name in enumerate(self.nonterminals)}
+        self.lhs = array('h', [self.symbolcodes[p.name] for p in self.productions])
+        self.plen = array('h', [p.len for p in self.productions])
+
+        nstates = len(self.action)
+        rows = []
+        self.default = array('i', [PACKED_ERROR] * nstates)
+        for state in range(nstates):
+            actions = self.action[state]
+            default = most_common([t for t in actions.values() if t < 0])
+            if default is not None:
+                self.default[state] = default
+            rows.append({self.tokencodes[name]: t for name, t in actions.items() if t != default})
+        self.base, self.check, self.table = pack_rows(rows, len(self.terminals))
+        self.lookahead = bytes([state not in self.defaulted_states for state in range(nstates)])
+
+        columns = [{} for _ in self.nonterminals]
+        for state, gotos in self.goto.items():
+            for name, target in gotos.items():
+                columns[self.symbolcodes[name]][state] = target
+        self.goto_default = array('i', [most_common(column.values()) or 0 for column in columns])
+        for n, column in enumerate(columns):
+            columns[n] = {state: target for state, target in column.items() if target != self.goto_default[n]}
+        self.goto_base, self.goto_check, self.goto_table = pack_rows(columns, nstates)
+
+    # table_size().
+    #
+    # Returns the number of bytes taken by the packed tables.
+
+    def table_size(self):
+        return sum(sys.getsizeof(a) for a in (self.base, self.check, self.table, self.default,
+                                              self.lookahead, self.goto_base, self.goto_check,
+                                              self.goto_table, self.goto_default, self.lhs, self.plen))
+
+    def parse(self, input=None, lexer=None, debug=False, tracking=False):
+        if debug or tracking:
+            return LRParser.parse(self, input, lexer, debug, tracking)
+        if self.beginfunc:
+            self.beginfunc(self)
+
+        base, check, table, default = self.base, self.check, self.table, self.default
+        goto_base, goto_check = self.goto_base, self.goto_check
+        goto_table, goto_default = self.goto_table, self.goto_default
+        uses_lookahead = self.lookahead
+        lhs, plens = self.lhs, self.plen
+        names = [p.name for p in self.productions]
+        rules = [p.callable for p in self.productions]
+        reads = [reads_values(rule) for rule in rules]
+
+        lexer = self.lexer = input_lexer(input, lexer)
+
+        pslice = YaccProduction(None)
+        pslice.lexer = lexer
+        pslice.parser = self
+
+        lexer.set_tokencodes(self.tokencodes)
+        get_token = self.token = lexer.coded_token
+
+        statestack = self.statestack = [0]
+        sym = YaccSymbol()
+        sym.type = '$end'
+        symstack = self.symstack = [sym]
+        pslice.stack = symstack
+        state = 0
+        lookahead = None
+
+        while True:
+            if uses_lookahead[state]:
+                if lookahead is None:
+                    lookahead = get_token()
+                    if not lookahead:
+                        lookahead = YaccSymbol()
+                        lookahead.type = '$end'
+                        lookahead.code = 0
+                i = base[state] + lookahead.code
+                t = table[i] if check[i] == state else default[state]
+            else:
+                t = default[state]
+
+            if t < 0:
+                t = -t
+                plen = plens[t]
+                sym = YaccSymbol()
+                sym.type = names[t]
+                sym.value = None
+                if plen:
+                    targ = symstack[-plen-1:]
+                    targ[0] = sym
+                    pslice.slice = targ
+                    pslice.values = [s.value for s in targ[1:]] if reads[t] else None
+                    del symstack[-plen:]
+                    self.state = state
+                    rules[t](pslice)
+                    del statestack[-plen:]
+                else:
+                    pslice.slice = [sym]
+                    pslice.values = [] if reads[t] else None
+                    self.state = state
+                    rules[t](pslice)
+                symstack.append(sym)
+                n = lhs[t]
+                i = goto_base[n] + statestack[-1]
+                state = goto_table[i] if goto_check[i] == n else goto_default[n]
+                statestack.append(state)
+                continue
+
+            if t == 0:
+                return getattr(symstack[-1], 'value', None)
+
+            if t == PACKED_ERROR:
+                errtoken = lookahead
+                if errtoken.type == '$end':
+                    errtoken = None
+                if self.errorfunc:
+                    if errtoken and not hasattr(errtoken, 'lexer'):
+                        errtoken.lexer = lexer
+                    self.state = state
+                    self.errorfunc(errtoken, self) if self.errorparser else self.errorfunc(errtoken)
+                raise YaccError('Syntax error at %s' % (errtoken.type if errtoken else 'EOF'))
+
+            statestack.append(t)
+            symstack.append(lookahead)
+            lookahead = None
+            state = t
+
 # -----------------------------------------------------------------------------
 #                          === Grammar Representation ===
 #
@@ -682,6 +1258,35 @@ class Production(object):
         if self.func:
             self.callable = pdict[self.func]
 
+# -----------------------------------------------------------------------------
+# class MiniProduction:
+#
+# This class is a stripped-down version of Production that is used when the
+# parsing tables are restored from a cache instead of being generated from
+# the grammar.  It only holds what the LR parsing engine needs.
+# -----------------------------------------------------------------------------
+
+class MiniProduction(object):
+    def __init__(self, str, name, len, func, file, line):
+        self.name     = name
+        self.len      = len
+        self.func     = func
+        self.callable = None
+        self.file     = file
+        self.line     = line
+        self.str      = str
+
+    def __str__(self):
+        return self.str
+
+    def __repr__(self):
+        return 'MiniProduction(%s)' % self.str
+
+    # Bind the production function name to a callable
+    def bind(self, pdict):
+        if self.func:
+            self.callable = pdict[self.func]
+
 # -----------------------------------------------------------------------------
 # class LRItem
 #
@@ -704,6 +1309,7 @@ class Production(object):
 #       len        - Length of the production (number of symbols on right hand side)
 #       lr_after    - List of all productions that immediately follow
 #       lr_before   - Grammar symbol immediately before
+#       lr_id       - Number of the item among all items of the grammar
 # -----------------------------------------------------------------------------
 
 class LRItem(object):
@@ -1110,6 +1716,35 @@ class Grammar(object):
 
         return result
 
+    # -------------------------------------------------------------------------
+    # nullable_nonterminals()
+    #
+    # Returns the set of nonterminals that can derive the empty string.
+    # -------------------------------------------------------------------------
+    def nullable_nonterminals(self):
+        # Count the symbols of each production not yet known to be nullable and
+        # revisit the productions using a symbol once it becomes nullable.
+        nullable = set()
+        remaining = {}
+        users = {}
+        work = []
+        for p in self.Productions[1:]:
+            remaining[p] = len(p.prod)
+            for t in p.prod:
+                users.setdefault(t, []).append(p)
+            if not p.prod:
+                work.append(p.name)
+        while work:
+            n = work.pop()
+            if n in nullable:
+                continue
+            nullable.add(n)
+            for p in users.get(n, []):
+                remaining[p] -= 1
+                if remaining[p] == 0:
+                    work.append(p.name)
+        return nullable
+
     # -------------------------------------------------------------------------
     # compute_first()
     #
@@ -1126,23 +1761,30 @@ class Grammar(object):
         self.First['$end'] = ['$end']
 
         # Nonterminals:
-
-        # Initialize to the empty set:
+        #
+        # FIRST(n) holds the terminals that start a production of n after a
+        # (possibly empty) prefix of nullable nonterminals and the FIRST sets of
+        # the nonterminals in the prefix and right after it, less <empty>: only
+        # nullable nonterminals get <empty>, once the sets are complete.
+        nullable = self.nullable_nonterminals()
+        direct = {}
+        related = {}
         for n in self.Nonterminals:
-            self.First[n] = []
-
-        # Then propagate symbols until no change:
-        while True:
-            some_change = False
-            for n in self.Nonterminals:
-                for p in self.Prodnames[n]:
-                    for f in self._first(p.prod):
-                        if f not in self.First[n]:
-                            self.First[n].append(f)
-                            some_change = True
-            if not some_change:
-                break
+            direct[n] = []
+            related[n] = []
+            for p in self.Prodnames.get(n, []):
+                for x in p.prod:
+                    if x in self.Terminals:
+                        direct[n].append(x)
+                        break
+                    related[n].append(x)
+                    if x not in nullable:
+                        break
 
+        self.First.update(digraph(self.Nonterminals, related.get, direct.get))
+        # digraph() shares one list between the nonterminals of a cycle
+        for n in nullable:
+            self.First[n] = self.First[n] + ['<empty>']
         return self.First
 
     # ---------------------------------------------------------------------
@@ -1151,6 +1793,9 @@ class Grammar(object):
     # Computes all of the follow sets for every non-terminal symbol.  The
     # follow set is the set of all symbols that might follow a given
     # non-terminal.  See the Dragon book, 2nd Ed. p. 189.
+    #
+    # For every production A -> a B b, FOLLOW(B) holds FIRST(b) and, if b
+    # can derive the empty string, FOLLOW(A).
     # ---------------------------------------------------------------------
     def compute_follow(self, start=None):
         # If already computed, return the result
@@ -1161,38 +1806,32 @@ class Grammar(object):
         if not self.First:
             self.compute_first()
 
-        # Add '$end' to the follow list of the start symbol
+        direct = {}
+        related = {}
         for k in self.Nonterminals:
-            self.Follow[k] = []
+            direct[k] = []
+            related[k] = []
 
+        # Add '$end' to the follow list of the start symbol
         if not start:
             start = self.Productions[1].name
 
-        self.Follow[start] = ['$end']
-
-        while True:
-            didadd = False
-            for p in self.Productions[1:]:
-                # Here is the production set
-                for i, B in enumerate(p.prod):
-                    if B in self.Nonterminals:
-                        # Okay. We got a non-terminal in a production
-                        fst = self._first(p.prod[i+1:])
-                        hasempty = False
-                        for f in fst:
-                            if f != '<empty>' and f not in self.Follow[B]:
-                                self.Follow[B].append(f)
-                                didadd = True
-                            if f == '<empty>':
-                                hasempty = True
-                        if hasempty or i == (len(p.prod)-1):
-                            # Add elements of follow(a) to follow(b)
-                            for f in self.Follow[p.name]:
-                                if f not in self.Follow[B]:
-                                    self.Follow[B].append(f)
-                                    didadd = True
-            if not didadd:
-                break
+        direct[start].append('$end')
+
+        for p in self.Productions[1:]:
+            # Here is the production set
+            for i, B in enumerate(p.prod):
+                if B in self.Nonterminals:
+                    # Okay. We got a non-terminal in a production
+                    fst = self._first(p.prod[i+1:])
+                    for f in fst:
+                        if f != '<empty>':
+                            direct[B].append(f)
+                    if '<empty>' in fst:
+                        # Add elements of follow(a) to follow(b)
+                        related[B].append(p.name)
+
+        self.Follow.update(digraph(self.Nonterminals, related.get, direct.get))
         return self.Follow
 
 
@@ -1212,6 +1851,7 @@ class Grammar(object):
     # -----------------------------------------------------------------------------
 
     def build_lritems(self):
+        self.LRItems = []
         for p in self.Productions:
             lastlri = p
             i = 0
@@ -1221,6 +1861,8 @@ class Grammar(object):
                     lri = None
                 else:
                     lri = LRItem(p, i)
+                    lri.lr_id = len(self.LRItems)
+                    self.LRItems.append(lri)
                     # Precompute the list of productions immediately following
                     try:
                         lri.lr_after = self.Prodnames[lri.prod[i+1]]
@@ -1248,54 +1890,81 @@ class Grammar(object):
 
 # -----------------------------------------------------------------------------
 # digraph()
-# traverse()
 #
-# The following two functions are used to compute set valued functions
+# The following function is used to compute set valued functions
 # of the form:
 #
 #     F(x) = F'(x) U U{F(y) | x R y}
 #
 # This is used to compute the values of Read() sets as well as FOLLOW sets
-# in LALR(1) generation.
+# in LALR(1) generation, and the FIRST and FOLLOW sets of the grammar.
 #
 # Inputs:  X    - An input set
 #          R    - A relation
 #          FP   - Set-valued function
+#
+# This is the traversal of DeRemer and Pennello, a variant of Tarjan's
+# strongly connected components algorithm: all members of a component share
+# the same F.  The depth-first search keeps its own stack of frames instead
+# of recursing, so the size of the grammar is not limited by the recursion
+# limit, and every relation is followed once.  F(x) is returned as a list in
+# the order the symbols were found.
 # ------------------------------------------------------------------------------
 
 def digraph(X, R, FP):
-    N = {}
-    for x in X:
-        N[x] = 0
-    stack = []
+    N = dict.fromkeys(X, 0)
     F = {}
-    for x in X:
-        if N[x] == 0:
-            traverse(x, N, stack, F, X, R, FP)
-    return F
-
-def traverse(x, N, stack, F, X, R, FP):
-    stack.append(x)
-    d = len(stack)
-    N[x] = d
-    F[x] = FP(x)             # F(X) <- F'(x)
+    members = {}              # Set of the symbols in each F(x), for membership tests
+    stack = []
 
-    rel = R(x)               # Get y's related to x
-    for y in rel:
-        if N[y] == 0:
-            traverse(y, N, stack, F, X, R, FP)
+    def union(x, y):
         N[x] = min(N[x], N[y])
-        for a in F.get(y, []):
-            if a not in F[x]:
-                F[x].append(a)
-    if N[x] == d:
-        N[stack[-1]] = MAXINT
-        F[stack[-1]] = F[x]
-        element = stack.pop()
-        while element != x:
-            N[stack[-1]] = MAXINT
-            F[stack[-1]] = F[x]
-            element = stack.pop()
+        fx, mx = F[x], members[x]
+        if fx is not F[y]:
+            for a in F[y]:
+                if a not in mx:
+                    mx.add(a)
+                    fx.append(a)
+
+    for root in X:
+        if N[root]:
+            continue
+
+        frames = []           # Stack of (x, depth of x, iterator over the y with x R y)
+        y = root
+        while True:
+            if y is not None:
+                # Start visiting y
+                stack.append(y)
+                d = len(stack)
+                N[y] = d
+                F[y] = list(dict.fromkeys(FP(y)))     # F(X) <- F'(x)
+                members[y] = set(F[y])
+                frames.append((y, d, iter(R(y))))
+                y = None
+
+            x, d, rel = frames[-1]
+            for y in rel:
+                if N[y] == 0:
+                    break
+                union(x, y)
+            else:
+                y = None
+                frames.pop()
+                if N[x] == d:
+                    fx, mx = F[x], members[x]
+                    while True:
+                        element = stack.pop()
+                        N[element] = MAXINT
+                        F[element] = fx
+                        members[element] = mx
+                        if element == x:
+                            break
+                if not frames:
+                    break
+                union(frames[-1][0], x)
+
+    return F
 
 class LALRError(YaccError):
     pass
@@ -1321,10 +1990,10 @@ class LRTable:
         self.lr_action     = {}        # Action table
         self.lr_goto       = {}        # Goto table
         self.lr_productions  = grammar.Productions    # Copy of grammar Production array
-        self.lr_goto_cache = {}        # Cache of computed gotos
-        self.lr0_cidhash   = {}        # Cache of closures
-
-        self._add_count    = 0         # Internal counter used to detect cycles
+        self.lr0_states    = []        # Item sets of the LR(0) machine, by state number
+        self.lr0_cidhash   = {}        # Maps id() of an item set to its state number
+        self.lr0_kernels   = {}        # Maps the kernel of a state (frozenset of item ids) to its number
+        self.lr0_transitions = []      # Transitions of each state: {symbol: state number}
 
         # Diagnostic information filled in by the table generator
         self.sr_conflict   = 0
@@ -1334,12 +2003,21 @@ class LRTable:
         self.sr_conflicts  = []
         self.rr_conflicts  = []
 
+        self.timings       = {}        # Seconds spent in each phase of the construction
+
         # Build the tables
-        self.grammar.build_lritems()
-        self.grammar.compute_first()
-        self.grammar.compute_follow()
+        self.timed('lr items', self.grammar.build_lritems)
+        self.timed('first', self.grammar.compute_first)
+        self.timed('follow', self.grammar.compute_follow)
         self.lr_parse_table()
 
+    # Run func(*args), adding the time it took to self.timings[phase]
+    def timed(self, phase, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.timings[phase] = self.timings.get(phase, 0.0) + time.perf_counter() - start
+        return result
+
     # Bind all production function names to callable objects in pdict
     def bind_callables(self, pdict):
         for p in self.lr_productions:
@@ -1348,72 +2026,39 @@ class LRTable:
     # Compute the LR(0) closure operation on I, where I is a set of LR(0) items.
 
     def lr0_closure(self, I):
-        self._add_count += 1
-
-        # Add everything in I to J
-        J = I[:]
-        didadd = True
-        while didadd:
-            didadd = False
-            for j in J:
-                for x in j.lr_after:
-                    if getattr(x, 'lr0_added', 0) == self._add_count:
-                        continue
-                    # Add B --> .G to J
-                    J.append(x.lr_next)
-                    x.lr0_added = self._add_count
-                    didadd = True
+        # Add everything in I to J.  Items appended to J are visited by the same loop.
+        J = list(I)
+        added = set()
+        for j in J:
+            for x in j.lr_after:
+                if x.number in added:
+                    continue
+                # Add B --> .G to J
+                J.append(x.lr_next)
+                added.add(x.number)
 
         return J
 
-    # Compute the LR(0) goto function goto(I,X) where I is a set
-    # of LR(0) items and X is a grammar symbol.   This function is written
-    # in a way that guarantees uniqueness of the generated goto sets
-    # (i.e. the same goto set will never be returned as two different Python
-    # objects).  With uniqueness, we can later do fast set comparisons using
-    # id(obj) instead of element-wise comparison.
+    # Compute the LR(0) goto function goto(I,X) where I is a state of the LR(0)
+    # machine built by lr0_items() and X is a grammar symbol.  The gotos are
+    # computed once, when the states are built, and recorded in lr0_transitions,
+    # so the same goto set is always the same Python object.
 
     def lr0_goto(self, I, x):
-        # First we look for a previously cached entry
-        g = self.lr_goto_cache.get((id(I), x))
-        if g:
-            return g
-
-        # Now we generate the goto set in a way that guarantees uniqueness
-        # of the result
-
-        s = self.lr_goto_cache.get(x)
-        if not s:
-            s = {}
-            self.lr_goto_cache[x] = s
-
-        gs = []
-        for p in I:
-            n = p.lr_next
-            if n and n.lr_before == x:
-                s1 = s.get(id(n))
-                if not s1:
-                    s1 = {}
-                    s[id(n)] = s1
-                gs.append(n)
-                s = s1
-        g = s.get('$end')
-        if not g:
-            if gs:
-                g = self.lr0_closure(gs)
-                s['$end'] = g
-            else:
-                s['$end'] = gs
-        self.lr_goto_cache[(id(I), x)] = g
-        return g
+        j = self.lr0_transitions[self.lr0_cidhash[id(I)]].get(x)
+        return [] if j is None else self.lr0_states[j]
+
+    # Compute the LR(0) sets of item function.  A state is identified by its
+    # kernel, the frozenset of the ids of the items it was reached with, so
+    # every goto is a single dictionary lookup.
 
-    # Compute the LR(0) sets of item function
     def lr0_items(self):
-        C = [self.lr0_closure([self.grammar.Productions[0].lr_next])]
-        i = 0
-        for I in C:
-            self.lr0_cidhash[id(I)] = i
-            i += 1
+        start = self.grammar.Productions[0].lr_next
+        C = self.lr0_states
+        C.append(self.lr0_closure([start]))
+        kernels = self.lr0_kernels
+        transitions = self.lr0_transitions
+        kernels[frozenset([start.lr_id])] = 0
 
         # Loop over the items in C and each grammar symbols
         i = 0
@@ -1421,18 +2066,34 @@ class LRTable:
             I = C[i]
             i += 1
 
-            # Collect all of the symbols that could possibly be in the goto(I,X) sets
+            # Group the items of each goto(I,X) set by X
             asyms = {}
+            gotos = {}
             for ii in I:
                 for s in ii.usyms:
                     asyms[s] = None
+                n = ii.lr_next
+                if n:
+                    if n.lr_before in gotos:
+                        gotos[n.lr_before].append(n)
+                    else:
+                        gotos[n.lr_before] = [n]
 
+            trans = {}
             for x in asyms:
-                g = self.lr0_goto(I, x)
-                if not g or id(g) in self.lr0_cidhash:
+                gs = gotos.get(x)
+                if not gs:
                     continue
-                self.lr0_cidhash[id(g)] = len(C)
-                C.append(g)
+                kernel = frozenset([n.lr_id for n in gs])
+                j = kernels.get(kernel)
+                if j is None:
+                    j = kernels[kernel] = len(C)
+                    C.append(self.lr0_closure(gs))
+                trans[x] = j
+            transitions.append(trans)
+
+        for j, I in enumerate(C):
+            self.lr0_cidhash[id(I)] = j
 
         return C
 
@@ -1465,22 +2126,7 @@ class LRTable:
     # -----------------------------------------------------------------------------
 
     def compute_nullable_nonterminals(self):
-        nullable = set()
-        num_nullable = 0
-        while True:
-            for p in self.grammar.Productions[1:]:
-                if p.len == 0:
-                    nullable.add(p.name)
-                    continue
-                for t in p.prod:
-                    if t not in nullable:
-                        break
-                else:
-                    nullable.add(p.name)
-            if len(nullable) == num_nullable:
-                break
-            num_nullable = len(nullable)
-        return nullable
+        return self.grammar.nullable_nonterminals()
 
     # -----------------------------------------------------------------------------
     # find_nonterminal_trans(C)
@@ -1495,12 +2141,14 @@ class LRTable:
 
     def find_nonterminal_transitions(self, C):
         trans = []
+        seen = set()
         for stateno, state in enumerate(C):
             for p in state:
                 if p.lr_index < p.len - 1:
                     t = (stateno, p.prod[p.lr_index+1])
                     if t[1] in self.grammar.Nonterminals:
-                        if t not in trans:
+                        if t not in seen:
+                            seen.add(t)
                             trans.append(t)
         return trans
 
@@ -1517,7 +2165,7 @@ class LRTable:
         state, N = trans
         terms = []
 
-        g = self.lr0_goto(C[state], N)
+        g = C[self.lr0_transitions[state][N]]
         for p in g:
             if p.lr_index < p.len - 1:
                 a = p.prod[p.lr_index+1]
@@ -1542,9 +2190,8 @@ class LRTable:
         rel = []
         state, N = trans
 
-        g = self.lr0_goto(C[state], N)
-        j = self.lr0_cidhash.get(id(g), -1)
-        for p in g:
+        j = self.lr0_transitions[state][N]
+        for p in C[j]:
             if p.lr_index < p.len - 1:
                 a = p.prod[p.lr_index + 1]
                 if a in empty:
@@ -1623,8 +2270,7 @@ class LRTable:
                             # Appears to be a relation between (j,t) and (state,N)
                             includes.append((j, t))
 
-                    g = self.lr0_goto(C[j], t)               # Go to next set
-                    j = self.lr0_cidhash.get(id(g), -1)      # Go to next state
+                    j = self.lr0_transitions[j][t]           # Go to next state
 
                 # When we get here, j is the final state, now we have to locate the production
                 for r in C[j]:
@@ -1701,15 +2347,21 @@ class LRTable:
     # -----------------------------------------------------------------------------
 
     def add_lookaheads(self, lookbacks, followset):
+        added = {}            # Set of the lookaheads of each (state, p), for membership tests
         for trans, lb in lookbacks.items():
             # Loop over productions in lookback
             for state, p in lb:
                 if state not in p.lookaheads:
                     p.lookaheads[state] = []
+                laheads = p.lookaheads[state]
+                seen = added.get((state, p))
+                if seen is None:
+                    seen = added[state, p] = set(laheads)
                 f = followset.get(trans, [])
                 for a in f:
-                    if a not in p.lookaheads[state]:
-                        p.lookaheads[state].append(a)
+                    if a not in seen:
+                        seen.add(a)
+                        laheads.append(a)
 
     # -----------------------------------------------------------------------------
     # add_lalr_lookaheads()
@@ -1719,23 +2371,25 @@ class LRTable:
     # -----------------------------------------------------------------------------
 
     def add_lalr_lookaheads(self, C):
+        timed = self.timed
+
         # Determine all of the nullable nonterminals
-        nullable = self.compute_nullable_nonterminals()
+        nullable = timed('nullable', self.compute_nullable_nonterminals)
 
         # Find all non-terminal transitions
-        trans = self.find_nonterminal_transitions(C)
+        trans = timed('nonterminal transitions', self.find_nonterminal_transitions, C)
 
         # Compute read sets
-        readsets = self.compute_read_sets(C, trans, nullable)
+        readsets = timed('read sets', self.compute_read_sets, C, trans, nullable)
 
         # Compute lookback/includes relations
-        lookd, included = self.compute_lookback_includes(C, trans, nullable)
+        lookd, included = timed('lookback/includes', self.compute_lookback_includes, C, trans, nullable)
 
         # Compute LALR FOLLOW sets
-        followsets = self.compute_follow_sets(trans, readsets, included)
+        followsets = timed('follow sets', self.compute_follow_sets, trans, readsets, included)
 
         # Add all of the lookaheads
-        self.add_lookaheads(lookd, followsets)
+        timed('add lookaheads', self.add_lookaheads, lookd, followsets)
 
     # -----------------------------------------------------------------------------
     # lr_parse_table()
@@ -1754,8 +2408,9 @@ class LRTable:
         # Step 1: Construct C = { I0, I1, ... IN}, collection of LR(0) items
         # This determines the number of states
 
-        C = self.lr0_items()
+        C = self.timed('lr0 items', self.lr0_items)
         self.add_lalr_lookaheads(C)
+        start = time.perf_counter()
 
         # Build the parser table, state by state
         st = 0
@@ -1838,8 +2493,7 @@ class LRTable:
                         i = p.lr_index
                         a = p.prod[i+1]       # Get symbol right after the "."
                         if a in self.grammar.Terminals:
-                            g = self.lr0_goto(I, a)
-                            j = self.lr0_cidhash.get(id(g), -1)
+                            j = self.lr0_transitions[st].get(a, -1)
                             if j >= 0:
                                 # We are in a shift state
                                 actlist.append((a, p, 'shift and go to state %d' % j))
@@ -1911,8 +2565,7 @@ class LRTable:
                     if s in self.grammar.Nonterminals:
                         nkeys[s] = None
             for n in nkeys:
-                g = self.lr0_goto(I, n)
-                j = self.lr0_cidhash.get(id(g), -1)
+                j = self.lr0_transitions[st].get(n, -1)
                 if j >= 0:
                     st_goto[n] = j
                     log.info('    %-30s shift and go to state %d', n, j)
@@ -1922,6 +2575,155 @@ class LRTable:
             goto[st] = st_goto
             st += 1
 
+        self.timings['parse table'] = time.perf_counter() - start
+
+    # -----------------------------------------------------------------------------
+    # pickle_table()
+    #
+    # Write the action/goto tables and the productions to a pickle file so that
+    # they can be restored by CachedLRTable without regenerating them.  The file
+    # is written to a temporary name first and then moved into place, so that
+    # concurrent builds never observe a partially written file.
+    # -----------------------------------------------------------------------------
+
+    def pickle_table(self, filename, signature=''):
+        outp = []
+        for p in self.lr_productions:
+            if p.func:
+                outp.append((p.str, p.name, p.len, p.func, os.path.basename(p.file), p.line))
+            else:
+                outp.append((str(p), p.name, p.len, None, None, None))
+
+        dirname = os.path.dirname(filename)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        tmpname = '%s.%d.tmp' % (filename, os.getpid())
+        try:
+            with open(tmpname, 'wb') as outf:
+                pickle.dump(__tabversion__, outf, pickle_protocol)
+                pickle.dump(signature_digest(signature), outf, pickle_protocol)
+                pickle.dump(self.lr_action, outf, pickle_protocol)
+                pickle.dump(self.lr_goto, outf, pickle_protocol)
+                pickle.dump(outp, outf, pickle_protocol)
+            os.replace(tmpname, filename)
+        finally:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+
+# -----------------------------------------------------------------------------
+# signature_digest()
+#
+# Cached tables are keyed on the grammar signature (see ParserReflect.signature()).
+# Only a digest of it is stored, since the signature contains every docstring.
+# -----------------------------------------------------------------------------
+
+def signature_digest(signature):
+    return hashlib.sha256(signature.encode('utf-8')).hexdigest()
+
+# -----------------------------------------------------------------------------
+# write_manifest()
+# read_manifest()
+#
+# A manifest records the digest of a grammar signature that passed all of the
+# checks made by yacc().  The record is followed by a sha256 checksum of it,
+# so that a truncated or damaged manifest is not trusted.  The checksum is not
+# keyed and anyone able to write the file can make a valid one.
+# read_manifest() returns the recorded digest, or None if the file is
+# missing, damaged or was written by another version of PLY.
+# -----------------------------------------------------------------------------
+
+def write_manifest(filename, signature):
+    record = 'tabversion %s\nsignature %s\n' % (__tabversion__, signature_digest(signature))
+    checksum = hashlib.sha256(record.encode('utf-8')).hexdigest()
+    dirname = os.path.dirname(filename)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    tmpname = '%s.%d.tmp' % (filename, os.getpid())
+    with open(tmpname, 'w', encoding='utf-8') as f:
+        f.write('# Grammar validated by PLY.  This file is automatically generated. Do not edit.\n')
+        f.write(record)
+        f.write('checksum %s\n' % checksum)
+    os.replace(tmpname, filename)
+
+def read_manifest(filename):
+    try:
+        with open(filename, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    if len(lines) != 4:
+        return None
+    record = lines[1] + '\n' + lines[2] + '\n'
+    if lines[3] != 'checksum %s' % hashlib.sha256(record.encode('utf-8')).hexdigest():
+        return None
+    if lines[1] != 'tabversion %s' % __tabversion__:
+        return None
+    return lines[2].partition(' ')[2]
+
+# -----------------------------------------------------------------------------
+#                             == CachedLRTable ==
+#
+# Parsing tables restored from a file written by LRTable.pickle_table().  It
+# provides the same attributes as LRTable that are used by LRParser.
+# -----------------------------------------------------------------------------
+
+class CachedLRTable:
+    def __init__(self):
+        self.lr_action = None
+        self.lr_goto = None
+        self.lr_productions = None
+
+    # Read the tables from a module written by LRParser.write_table().  The
+    # module can be given as a module object, as the path of its .py file or
+    # by its name.  A path is loaded from that file only, whatever is on
+    # sys.path.  Returns the signature digest the tables were generated for.
+    def read_table(self, module):
+        if isinstance(module, types.ModuleType):
+            parsetab = module
+        elif module.endswith('.py'):
+            if not os.path.exists(module):
+                raise ImportError('No table module at %r' % module)
+            spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(module))[0], module)
+            parsetab = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(parsetab)
+        else:
+            parsetab = importlib.import_module(module)
+
+        if parsetab._tabversion != __tabversion__:
+            raise VersionError('yacc table file version is out of date')
+
+        self.lr_action = parsetab._lr_action
+        self.lr_goto = parsetab._lr_goto
+
+        self.lr_productions = []
+        for p in parsetab._lr_productions:
+            self.lr_productions.append(MiniProduction(*p))
+
+        return parsetab._lr_signature
+
+    # Read the tables from a pickle file.  Returns the signature digest the
+    # tables were generated for.
+    def read_pickle(self, filename):
+        with open(filename, 'rb') as in_f:
+            tabversion = pickle.load(in_f)
+            if tabversion != __tabversion__:
+                raise VersionError('yacc table file version is out of date')
+            signature      = pickle.load(in_f)
+            self.lr_action = pickle.load(in_f)
+            self.lr_goto   = pickle.load(in_f)
+            productions    = pickle.load(in_f)
+
+        self.lr_productions = []
+        for p in productions:
+            self.lr_productions.append(MiniProduction(*p))
+
+        return signature
+
+    # Bind all production function names to callable objects in pdict
+    def bind_callables(self, pdict):
+        for p in self.lr_productions:
+            p.bind(pdict)
+
 # -----------------------------------------------------------------------------
 #                            === INTROSPECTION ===
 #
@@ -1995,6 +2797,7 @@ class ParserReflect(object):
         self.pdict      = pdict
         self.start      = None
         self.error_func = None
+        self.begin_func = None
         self.tokens     = None
         self.modules    = set()
         self.grammar    = []
@@ -2009,6 +2812,7 @@ class ParserReflect(object):
     def get_all(self):
         self.get_start()
         self.get_error_func()
+        self.get_begin_func()
         self.get_tokens()
         self.get_precedence()
         self.get_pfunctions()
@@ -2017,6 +2821,7 @@ class ParserReflect(object):
     def validate_all(self):
         self.validate_start()
         self.validate_error_func()
+        self.validate_begin_func()
         self.validate_tokens()
         self.validate_precedence()
         self.validate_pfunctions()
@@ -2107,8 +2912,30 @@ class ParserReflect(object):
             self.modules.add(module)
 
             argcount = self.error_func.__code__.co_argcount - ismethod
+            if argcount not in (1, 2):
+                self.log.error('%s:%d: p_error() requires 1 or 2 arguments', efile, eline)
+                self.error = True
+
+    # Look for the function called at the start of every parse
+    def get_begin_func(self):
+        self.begin_func = self.pdict.get('p_begin')
+
+    # Validate the begin function
+    def validate_begin_func(self):
+        if self.begin_func:
+            if isinstance(self.begin_func, types.FunctionType):
+                ismethod = 0
+            elif isinstance(self.begin_func, types.MethodType):
+                ismethod = 1
+            else:
+                self.log.error("'p_begin' defined, but is not a function or method")
+                self.error = True
+                return
+
+            argcount = self.begin_func.__code__.co_argcount - ismethod
             if argcount != 1:
-                self.log.error('%s:%d: p_error() requires 1 argument', efile, eline)
+                self.log.error('%s:%d: p_begin() requires 1 argument', self.begin_func.__code__.co_filename,
+                               self.begin_func.__code__.co_firstlineno)
                 self.error = True
 
     # Get the tokens map
@@ -2184,7 +3011,7 @@ class ParserReflect(object):
     def get_pfunctions(self):
         p_functions = []
         for name, item in self.pdict.items():
-            if not name.startswith('p_') or name == 'p_error':
+            if not name.startswith('p_') or name in ('p_error', 'p_begin'):
                 continue
             if isinstance(item, (types.FunctionType, types.MethodType)):
                 line = getattr(item, 'co_firstlineno', item.__code__.co_firstlineno)
@@ -2247,7 +3074,7 @@ class ParserReflect(object):
                 continue
             if n.startswith('t_'):
                 continue
-            if n.startswith('p_') and n != 'p_error':
+            if n.startswith('p_') and n not in ('p_error', 'p_begin'):
                 self.log.warning('%r not defined as a function', n)
             if ((isinstance(v, types.FunctionType) and v.__code__.co_argcount == 1) or
                    (isinstance(v, types.MethodType) and v.__func__.__code__.co_argcount == 2)):
@@ -2270,7 +3097,8 @@ class ParserReflect(object):
 
 def yacc(*, debug=yaccdebug, module=None, start=None,
          check_recursion=True, optimize=False, debugfile=debug_file,
-         debuglog=None, errorlog=None):
+         debuglog=None, errorlog=None, picklefile=None, tabmodule=None,
+         collapse_units=False, manifest=None):
 
     # Reference to the parsing method of the last built parser
     global parse
@@ -2303,6 +3131,61 @@ def yacc(*, debug=yaccdebug, module=None, start=None,
     if pinfo.error:
         raise YaccError('Unable to build parser')
 
+    signature = pinfo.signature()
+
+    # Create the parser from tables restored by CachedLRTable
+    def restored_parser(lr, read_signature):
+        lr.bind_callables(pinfo.pdict)
+        parser = LRParser(lr, pinfo.error_func, pinfo.begin_func)
+        parser.signature = read_signature
+        if collapse_units:
+            parser.collapse_unit_productions()
+        return parser
+
+    # Try to restore the tables from the cache file.  Returns None if there is
+    # no usable cache.
+    def unpickled_parser():
+        try:
+            lr = CachedLRTable()
+            read_signature = lr.read_pickle(picklefile)
+            if read_signature == signature_digest(signature):
+                return restored_parser(lr, read_signature)
+        except FileNotFoundError:
+            pass
+        except VersionError as e:
+            errorlog.warning(str(e))
+        except Exception as e:
+            errorlog.warning('There was a problem loading the table file: %r', e)
+        return None
+
+    # Load the tables from a module written by LRParser.write_table().  These
+    # were generated from a fully validated grammar, so when the signature still
+    # matches, neither validation nor any grammar analysis is needed.
+    if tabmodule and not debug:
+        try:
+            lr = CachedLRTable()
+            read_signature = lr.read_table(tabmodule)
+            if read_signature == signature_digest(signature):
+                parser = restored_parser(lr, read_signature)
+                parse = parser.parse
+                return parser
+            errorlog.warning('Table module %r is out of date', getattr(tabmodule, '__name__', tabmodule))
+        except ImportError:
+            pass
+        except VersionError as e:
+            errorlog.warning(str(e))
+        except Exception as e:
+            errorlog.warning('There was a problem loading the table module: %r', e)
+
+    # A manifest matching the signature means that this grammar already passed
+    # all of the checks below, so optimized builds can use the cached tables
+    # right away.  Other builds always run the checks.
+    if manifest and picklefile and optimize and not debug and read_manifest(manifest) == signature_digest(signature):
+        parser = unpickled_parser()
+        if parser:
+            parse = parser.parse
+            return parser
+
     if debuglog is None:
         if debug:
             try:
@@ -2430,9 +3313,29 @@ def yacc(*, debug=yaccdebug, module=None, start=None,
     if errors:
         raise YaccError('Unable to build parser')
 
+    if manifest:
+        try:
+            write_manifest(manifest, signature)
+        except IOError as e:
+            errorlog.warning("Couldn't create %r. %s" % (manifest, e))
+
+    # Try to restore the tables from the cache file.  The cache is bypassed in
+    # debug mode so that the parser.out file describes the full construction.
+    if picklefile and not debug:
+        parser = unpickled_parser()
+        if parser:
+            parse = parser.parse
+            return parser
+
     # Run the LRTable on the grammar
     lr = LRTable(grammar, debuglog)
 
+    if picklefile:
+        try:
+            lr.pickle_table(picklefile, signature)
+        except IOError as e:
+            errorlog.warning("Couldn't create %r. %s" % (picklefile, e))
+
     if debug:
         num_sr = len(lr.sr_conflicts)
 
@@ -2476,7 +3379,10 @@ def yacc(*, debug=yaccdebug, module=None, start=None,
 
     # Build the parser
     lr.bind_callables(pinfo.pdict)
-    parser = LRParser(lr, pinfo.error_func)
+    parser = LRParser(lr, pinfo.error_func, pinfo.begin_func)
+    parser.signature = signature_digest(signature)
+    if collapse_units:
+        parser.collapse_unit_productions()
 
     parse = parser.parse
     return parser
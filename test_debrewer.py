@@ -1,38 +1,1021 @@
 import unittest
+import functools
+import importlib.util
+import io
+import mmap
 import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-DEBREWER_PATH = ".\\debrewer.py"
-EXAMPLES_DIR = ".\\examples"
+import debrewer
+import tokens_and_grammar
+from ply.lex import lex, LexerReflect, LineIndex, StreamLexer
+from ply.yacc import yacc, read_manifest, CompiledLRParser, is_identity_rule, reads_values, Grammar, LRTable, MiniProduction, NullLogger, ParserReflect, PACKED_ERROR
+from utils.freeze_parser import freeze
+from utils.errors import DebrewerException, InternalError, PintException
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEBREWER_PATH = os.path.join(ROOT_DIR, "debrewer.py")
+EXAMPLES_DIR = os.path.join(ROOT_DIR, "examples")
 
 
 class TestDebrewer(unittest.TestCase):
     def test_examples(self):
         failed = False
 
+        filenames = [filename for filename in os.listdir(EXAMPLES_DIR) if filename.endswith(".pint") or filename.endswith(".🍺")]
+        results = debrewer.transpile_many([os.path.join(EXAMPLES_DIR, filename) for filename in filenames])
+
+        for filename, result in zip(filenames, results):
+            input_pathname, input_extension = os.path.splitext(result.filename)
+            output_file = input_pathname + ".py"
+
+            with open(output_file, "r", encoding="utf8") as f:
+                expected = f.read()
+
+            try:
+                self.assertEqual(expected, result.output)
+                print(f"File {filename} OK")
+            except AssertionError:
+                print(f"File {filename} failed")
+                failed = True
+
+        if failed:
+            self.fail("Some tests failed")
+
+    def test_command_line(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output_file = os.path.join(tmp, "oop.py")
+            subprocess.run([sys.executable, DEBREWER_PATH, os.path.join(EXAMPLES_DIR, "oop.pint"), "-o", output_file],
+                           capture_output=True, check=True)
+
+            with open(output_file, "r", encoding="utf8") as f:
+                actual = f.read()
+        with open(os.path.join(EXAMPLES_DIR, "oop.py"), "r", encoding="utf8") as f:
+            self.assertEqual(f.read(), actual)
+
+    def test_errors_are_returned(self):
+        paths = [os.path.join(EXAMPLES_DIR, "bad", "duplicate_classes.pint"), os.path.join(EXAMPLES_DIR, "oop.pint"),
+                 os.path.join(EXAMPLES_DIR, "missing.pint"), os.path.join(EXAMPLES_DIR, "oop.py")]
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            results = debrewer.transpile_many(paths)
+
+        self.assertEqual(stdout.getvalue(), "")
+        self.assertEqual([result.ok for result in results], [False, True, False, False])
+        self.assertIsNone(results[0].output)
+        (error,) = results[0].errors
+        self.assertIsInstance(error, PintException)
+        self.assertEqual(error.line, 12)
+        self.assertIn(f"In {paths[0]} [12:1]:", results[0].report())
+        self.assertIsInstance(results[2].errors[0], DebrewerException)
+        self.assertIn("not found", results[2].report())
+        self.assertIn("proper extension", results[3].report())
+
+    def test_batch_goes_on_after_a_failing_file(self):
+        good = os.path.join(EXAMPLES_DIR, "simple.pint")
+        with tempfile.TemporaryDirectory() as tmp:
+            unknown_type = os.path.join(tmp, "unknown_type.pint")
+            unclosed = os.path.join(tmp, "unclosed.pint")
+            with open(unknown_type, "w", encoding="utf8") as f:
+                f.write("Foo x = 1\n")
+            with open(unclosed, "w", encoding="utf8") as f:
+                f.write("🏛️ A {\n")
+
+            results = debrewer.transpile_many([good, unknown_type, good, unclosed, os.path.join(tmp, "missing.pint"), good])
+
+        self.assertEqual([result.ok for result in results], [True, False, True, False, False, True])
+        # a crash is reported as an internal error in that file, not as an error in the program
+        self.assertIsInstance(results[1].errors[0], InternalError)
+        self.assertIsInstance(results[1].errors[0].error, KeyError)
+        self.assertIn("Internal error", results[1].report())
+        self.assertIn(results[1].filename, results[1].report())
+        self.assertIsNone(results[3].output)
+        self.assertIn("Unexpected end of input", results[3].report())
+        self.assertIn("not found", results[4].report())
+        self.assertEqual(results[0].output, results[5].output)
+
+    def test_source_is_transpiled(self):
+        result = debrewer.transpile("🔢 a = 1", filename="a.pint")
+        self.assertTrue(result.ok)
+        self.assertEqual(result.output, "a: int = 1 \n")
+
+        result = debrewer.transpile("🔢 a = 1\n🔢 a = 2\n", filename="a.pint")
+        self.assertEqual(result.errors[0].category, "Definition error")
+        self.assertIn(" 2 | ", result.report())
+
+    def test_large_files_are_streamed(self):
+        path = os.path.join(EXAMPLES_DIR, "oop.pint")
+        with mock.patch.object(debrewer, "STREAM_SIZE", 0):
+            result = debrewer.transpile_file(path, strip_comments=True)
+
+        self.assertTrue(result.ok)
+        self.assertEqual(result.output, debrewer.transpile_file(path, strip_comments=True).output)
+
+    def test_streamed_file_is_closed_after_an_error(self):
+        opened = []
+
+        def recorded(open_):
+            def wrapper(*args, **kwargs):
+                opened.append(open_(*args, **kwargs))
+                return opened[-1]
+            return wrapper
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bad.pint")
+            with open(path, "w", encoding="utf8") as f:
+                f.write("🔢 a = 1\n🔢 b = = 2\n" * 100)
+
+            with mock.patch.object(debrewer, "STREAM_SIZE", 0), \
+                 mock.patch("tokens_and_grammar.open", recorded(open), create=True), \
+                 mock.patch("mmap.mmap", recorded(mmap.mmap)):
+                result = debrewer.transpile_file(path)
+
+            self.assertEqual(result.errors[0].line, 2)
+            self.assertEqual(len(opened), 2)
+            self.assertTrue(all(f.closed for f in opened))
+
+
+class TestParserCache(unittest.TestCase):
+    def test_tables_are_restored_from_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            picklefile = os.path.join(tmp, "parsetab.pickle")
+
+            built = yacc(module=tokens_and_grammar, picklefile=picklefile)
+            cached = yacc(module=tokens_and_grammar, picklefile=picklefile)
+
+            self.assertTrue(os.path.exists(picklefile))
+            self.assertIsInstance(cached.productions[1], MiniProduction)
+            self.assertEqual(built.action, cached.action)
+            self.assertEqual(built.goto, cached.goto)
+
+    def test_tables_are_rebuilt_when_grammar_changes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            picklefile = os.path.join(tmp, "parsetab.pickle")
+
+            yacc(module=tokens_and_grammar, picklefile=picklefile)
+            rebuilt = yacc(module=tokens_and_grammar, start="expression", picklefile=picklefile, errorlog=NullLogger())
+
+            self.assertNotIsInstance(rebuilt.productions[1], MiniProduction)
+            self.assertEqual(rebuilt.productions[0].prod, ("expression",))
+
+
+class TestManifest(unittest.TestCase):
+    def test_validated_grammar_is_not_validated_again(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            picklefile = os.path.join(tmp, "parsetab.pickle")
+            manifest = os.path.join(tmp, "grammar.manifest")
+
+            built = yacc(module=tokens_and_grammar, picklefile=picklefile, manifest=manifest)
+            self.assertEqual(read_manifest(manifest), built.signature)
+
+            with mock.patch.object(ParserReflect, "validate_all", side_effect=AssertionError) as validate_all:
+                cached = yacc(module=tokens_and_grammar, picklefile=picklefile, manifest=manifest, optimize=True)
+            self.assertFalse(validate_all.called)
+            self.assertEqual(built.action, cached.action)
+
+            with mock.patch.object(ParserReflect, "validate_all", autospec=True, side_effect=ParserReflect.validate_all) as validate_all:
+                yacc(module=tokens_and_grammar, picklefile=picklefile, manifest=manifest)
+            self.assertTrue(validate_all.called)
+
+            with mock.patch.object(ParserReflect, "validate_all", autospec=True, side_effect=ParserReflect.validate_all) as validate_all:
+                yacc(module=tokens_and_grammar, picklefile=picklefile, manifest=manifest, optimize=True, debug=True,
+                     debugfile=os.path.join(tmp, "parser.out"), errorlog=NullLogger())
+            self.assertTrue(validate_all.called)
+
+    def test_damaged_manifest_is_ignored(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest = os.path.join(tmp, "grammar.manifest")
+            yacc(module=tokens_and_grammar, picklefile=os.path.join(tmp, "parsetab.pickle"), manifest=manifest)
+
+            with open(manifest, "r", encoding="utf8") as f:
+                content = f.read()
+            with open(manifest, "w", encoding="utf8") as f:
+                f.write(content.replace("signature ", "signature 0"))
+
+            self.assertIsNone(read_manifest(manifest))
+
+
+class TestParserTables(unittest.TestCase):
+    def test_lr0_states_are_unique(self):
+        pinfo = ParserReflect(vars(tokens_and_grammar))
+        pinfo.get_all()
+        pinfo.validate_all()
+        grammar = Grammar(pinfo.tokens)
+        for funcname, (file, line, prodname, syms) in pinfo.grammar:
+            grammar.add_production(prodname, syms, funcname, file, line)
+        grammar.set_start(pinfo.start)
+
+        table = LRTable(grammar)
+
+        self.assertEqual(len(table.lr0_kernels), len(table.lr0_states))
+        for state, transitions in enumerate(table.lr0_transitions):
+            for symbol, target in transitions.items():
+                kernel = frozenset(p.lr_next.lr_id for p in table.lr0_states[state] if p.lr_next and p.lr_next.lr_before == symbol)
+                self.assertEqual(table.lr0_kernels[kernel], target)
+                self.assertIs(table.lr0_goto(table.lr0_states[state], symbol), table.lr0_states[target])
+
+    def test_lookaheads_do_not_depend_on_recursion_limit(self):
+        # every a<i> is nullable, so the READS relation is a chain through all of them
+        depth = sys.getrecursionlimit() + 100
+        grammar = Grammar(["X", "Y"])
+        grammar.add_production("s", [f"a{i}" for i in range(depth)] + ["X"])
+        for i in range(depth):
+            grammar.add_production(f"a{i}", ["Y"])
+            grammar.add_production(f"a{i}", [])
+        grammar.set_start("s")
+
+        table = LRTable(grammar)
+
+        self.assertEqual(table.lr_action[0]["X"], -grammar.Prodnames["a0"][1].number)
+        self.assertEqual(set(grammar.Follow["a0"]), {"X", "Y"})
+
+    def test_first_and_follow_match_fixed_point(self):
+        # t : b s Z, where s starts with the nullable a
+        grammar = Grammar(["B", "X", "Y", "Z"])
+        grammar.add_production("t", ["b", "s", "Z"])
+        grammar.add_production("b", ["B"])
+        grammar.add_production("s", ["a", "X"])
+        grammar.add_production("a", ["Y"])
+        grammar.add_production("a", [])
+        grammar.set_start("t")
+        grammar.compute_first()
+        grammar.compute_follow()
+
+        # the sets as the baseline computed them, iterating until nothing changes
+        first = {n: set() for n in grammar.Nonterminals}
+        first.update({t: {t} for t in grammar.Terminals})
+        follow = {n: set() for n in grammar.Nonterminals}
+        follow["t"].add("$end")
+        changed = True
+        while changed:
+            changed = False
+            for p in grammar.Productions[1:]:
+                for i, x in enumerate(p.prod + ("<empty>",)):
+                    if x == "<empty>" or x not in first:
+                        continue
+                    rest = set()
+                    for y in p.prod[i + 1:]:
+                        rest |= first[y] - {"<empty>"}
+                        if "<empty>" not in first[y]:
+                            break
+                    else:
+                        rest.add("<empty>")
+                    if x in follow:
+                        added = (rest - {"<empty>"}) | (follow[p.name] if "<empty>" in rest else set())
+                        if not added <= follow[x]:
+                            follow[x] |= added
+                            changed = True
+                start = set()
+                for y in p.prod:
+                    start |= first[y] - {"<empty>"}
+                    if "<empty>" not in first[y]:
+                        break
+                else:
+                    start.add("<empty>")
+                if not start <= first[p.name]:
+                    first[p.name] |= start
+                    changed = True
+
+        for n in grammar.Nonterminals:
+            with self.subTest(nonterminal=n):
+                self.assertEqual(set(grammar.First[n]), first[n])
+                self.assertEqual(set(grammar.Follow[n]), follow[n])
+        self.assertEqual(set(grammar.First["s"]), {"X", "Y"})
+        self.assertEqual(set(grammar.Follow["b"]), {"X", "Y"})
+
+
+class TestUnitProductions(unittest.TestCase):
+    def test_identity_rules_are_recognized(self):
+        self.assertTrue(is_identity_rule(tokens_and_grammar.p_statement))
+        self.assertFalse(is_identity_rule(tokens_and_grammar.p_expression))
+
+    def test_unit_reductions_are_skipped(self):
+        parser = yacc(module=tokens_and_grammar, collapse_units=True)
+        reduced = []
+        for p in parser.productions[1:]:
+            if p.name == "statement":
+                p.callable = lambda p, rule=p.str: reduced.append(rule)
+
+        lexer = tokens_and_grammar.get_lexer()
+        lexer.lineno = 1
+        result = parser.parse("🔢 a = 1\na = 2\n", lexer=lexer)
+
+        self.assertEqual(result, "a: int = 1 \na = 2 \n")
+        self.assertEqual(reduced, [])
+
+
+class TestProductionValues(unittest.TestCase):
+    def parse(self, parse, program):
+        lexer = tokens_and_grammar.get_lexer()
+        lexer.lineno = 1
+        return parse(program, lexer=lexer)
+
+    def test_values_are_the_right_hand_side(self):
+        parser = tokens_and_grammar.get_parser()
+        callables = [p.callable for p in parser.productions]
+        seen = []
+        with open(os.path.join(EXAMPLES_DIR, "quicksort.pint"), "r", encoding="utf8") as f:
+            program = f.read()
+
+        def checked(func):
+            @functools.wraps(func)
+            def rule(p):
+                # the rules not reading p.values get None
+                expected = p[1:] if reads_values(func) else None
+                seen.append(getattr(p, "values") == expected)
+                func(p)
+            return rule
+
+        for p in parser.productions[1:]:
+            p.callable = checked(p.callable)
+        try:
+            for parse in (parser.parse, parser.compile().parse, parser.pack().parse):
+                del seen[:]
+                with self.subTest(parse=parse.__qualname__):
+                    self.parse(parse, program)
+                    self.assertTrue(seen)
+                    self.assertTrue(all(seen))
+        finally:
+            for p, func in zip(parser.productions, callables):
+                p.callable = func
+
+    def test_values_are_made_for_the_rules_reading_them(self):
+        self.assertTrue(reads_values(tokens_and_grammar.p_definitions_and_statements))
+        self.assertFalse(reads_values(tokens_and_grammar.p_statement))
+        self.assertTrue(reads_values(print))
+
+class TestSessions(unittest.TestCase):
+    def read(self, filename):
+        with open(os.path.join(EXAMPLES_DIR, filename), "r", encoding="utf8") as f:
+            return f.read()
+
+    def parse(self, parser, lexer, program):
+        lexer.lineno = 1
+        return parser.parse(program, lexer=lexer)
+
+    def test_classes_are_defined_again_in_every_parse(self):
+        parser = tokens_and_grammar.get_parser()
+        lexer = tokens_and_grammar.get_lexer()
+        program, expected = self.read("oop.pint"), self.read("oop.py")
+
+        sessions = []
+        for engine in (parser, parser, parser.compile(), parser.pack()):
+            self.assertEqual(self.parse(engine, lexer, program), expected)
+            sessions.append(engine.session)
+
+        self.assertIsNot(sessions[0], sessions[1])
+        session = sessions[-1]
+        self.assertTrue(session.classes)
+        self.assertTrue(all(cls.name in session.types for cls in session.classes))
+        self.assertFalse(any(cls.name in tokens_and_grammar.types for cls in session.classes))
+
+    def test_module_parser_gets_a_session(self):
+        lexer = tokens_and_grammar.get_lexer()
+        program, expected = self.read("oop.pint"), self.read("oop.py")
+        for _ in range(2):
+            self.assertEqual(self.parse(tokens_and_grammar.parser, lexer, program), expected)
+
+    def test_session_is_made_in_debug_mode(self):
+        parser = tokens_and_grammar.get_parser()
+        lexer = tokens_and_grammar.get_lexer()
+        lexer.lineno = 1
+        before = getattr(parser, "session", None)
+        parser.parse("🔢 a = 1\n", lexer=lexer, tracking=True)
+        self.assertIsNot(parser.session, before)
+
+    def test_parses_in_threads(self):
+        programs = [(self.read(name + ".pint"), self.read(name + ".py")) for name in ("oop", "quicksort", "simple")]
+
+        def parse_all(n):
+            parser = tokens_and_grammar.get_parser().pack()
+            lexer = tokens_and_grammar.get_lexer().clone()
+            results = []
+            # the threads start from different programs
+            for program, expected in programs[n:] + programs[:n]:
+                results.append((self.parse(parser, lexer, program), expected))
+            return results
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            for results in pool.map(parse_all, [n % len(programs) for n in range(8)]):
+                for result, expected in results:
+                    self.assertEqual(result, expected)
+
+
+class TestParserPool(unittest.TestCase):
+    def test_clones_share_tables(self):
+        parser = tokens_and_grammar.get_parser()
+        for engine in (parser, parser.compile(), parser.pack()):
+            with self.subTest(engine=type(engine).__name__):
+                clone = engine.clone()
+                self.assertIs(type(clone), type(engine))
+                self.assertIs(clone.action, engine.action)
+                self.assertIs(clone.productions, engine.productions)
+                self.assertIs(getattr(clone, "make_states", None), getattr(engine, "make_states", None))
+                self.assertIs(getattr(clone, "table", None), getattr(engine, "table", None))
+
+        lexer = tokens_and_grammar.get_lexer()
+        clone = lexer.clone()
+        self.assertIs(clone.lexstatere, lexer.lexstatere)
+        self.assertIsNot(clone.lexstatestack, lexer.lexstatestack)
+
+    def test_instances_are_reused(self):
+        pool = tokens_and_grammar.ParserPool()
+        with pool.acquire() as (parser, lexer):
+            pass
+        with pool.acquire() as (again, _):
+            self.assertIs(again, parser)
+            with pool.acquire() as (other, _):
+                self.assertIsNot(other, parser)
+
+    def test_parses_in_threads(self):
+        programs = []
+        for name in ("oop", "quicksort", "matches", "data_structures"):
+            with open(os.path.join(EXAMPLES_DIR, name + ".pint"), "r", encoding="utf8") as f:
+                program = f.read()
+            with open(os.path.join(EXAMPLES_DIR, name + ".py"), "r", encoding="utf8") as f:
+                programs.append((program if program.endswith("\n") else program + "\n", f.read()))
+
+        for engine in (None, tokens_and_grammar.get_parser(), tokens_and_grammar.get_parser().pack()):
+            pool = tokens_and_grammar.ParserPool(engine)
+
+            def translate(program):
+                with pool.acquire() as (parser, lexer):
+                    return parser.parse(program, lexer=lexer)
+
+            with self.subTest(engine=type(pool.parser).__name__), ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(translate, [program for program, _ in programs] * 8))
+                self.assertEqual(results, [expected for _, expected in programs] * 8)
+
+
+class TestLexerCache(unittest.TestCase):
+    def tokens(self, lexer, data):
+        lexer.input(data)
+        return [(tok.type, tok.value, tok.lineno, tok.lexpos) for tok in lexer]
+
+    def test_lexer_is_restored_from_cache(self):
+        with open(os.path.join(EXAMPLES_DIR, "quicksort.pint"), "r", encoding="utf8") as f:
+            program = f.read()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            picklefile = os.path.join(tmp, "lextab.pickle")
+
+            built = lex(module=tokens_and_grammar, picklefile=picklefile)
+            cached = lex(module=tokens_and_grammar, picklefile=picklefile)
+
+            self.assertTrue(os.path.exists(picklefile))
+            self.assertEqual(built.lexretext, cached.lexretext)
+            self.assertEqual(self.tokens(built, program), self.tokens(cached, program))
+
+    def test_malformed_rules_have_no_signature(self):
+        class Skip:
+            def __call__(self, t):
+                t.lexer.skip(1)
+
+        class Rules:
+            tokens = ("A",)
+            t_A = "a"
+            # callable, but with no __name__ to put in the signature
+            t_error = Skip()
+
+        info = LexerReflect(dict(vars(Rules)), log=NullLogger())
+        info.get_all()
+        self.assertIsNone(info.signature())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            picklefile = os.path.join(tmp, "lextab.pickle")
+            with mock.patch.object(LexerReflect, "signature", return_value=None):
+                lex(module=tokens_and_grammar, picklefile=picklefile)
+            self.assertFalse(os.path.exists(picklefile))
+
+
+class TestDispatchLexer(unittest.TestCase):
+    def tokens(self, lexer, data):
+        lexer.input(data)
+        lexer.lineno = 1
+        try:
+            return [(tok.type, tok.value, tok.lineno, tok.lexpos) for tok in lexer]
+        except PintException as e:
+            return (e.line, e.column, e.symbol)
+
+    def test_tokens_match_regex_lexer(self):
+        regex = lex(module=tokens_and_grammar)
+        dispatch = regex.dispatch()
+        programs = [
+            "🐜⚖️ 🐜 🐘⚖️ 🐘 ⚖️ 👨‍👦 -> -= - -1.5 -2 //= // ✏️“a” \"b\" ٣\n",
+            "💬⬇️\n🔢 a\n💬⬆️\n💬 a\n🔢 a = 1\n",
+            "🔢 a = 1\n🔢 b = $\n",
+        ]
         for filename in os.listdir(EXAMPLES_DIR):
             if filename.endswith(".pint") or filename.endswith(".🍺"):
-                input_file = os.path.join(EXAMPLES_DIR, filename)
-                input_pathname, input_extension = os.path.splitext(input_file)
-                output_file = input_pathname + ".py"
-                test_output_file = input_pathname + "_test.py"
+                with open(os.path.join(EXAMPLES_DIR, filename), "r", encoding="utf8") as f:
+                    programs.append(f.read())
+
+        for program in programs:
+            with self.subTest(program=program[:20]):
+                self.assertEqual(self.tokens(regex, program), self.tokens(dispatch, program))
+
+    def test_buckets_keep_rule_order(self):
+        lexer = lex(module=tokens_and_grammar).dispatch()
+        buckets = lexer.lexstatebuckets["INITIAL"]
+
+        def types(c):
+            return [entry[1] for _, findex in buckets.bucket(c) for entry in findex if entry]
+
+        order = [name[2:] for names in lexer.lexstaterenames["INITIAL"] for name in names if name]
+        minus = types("-")
+
+        self.assertEqual(types("🐜"), ["LESSEQUAL", "LESS"])
+        self.assertEqual(sorted(minus), ["FLOAT", "INT", "MINUS", "MINUSASSIGN", "RETURNARROW"])
+        self.assertEqual(minus, sorted(minus, key=order.index))
+        self.assertEqual(types("x"), ["IDENTIFIER"])
+        self.assertEqual(types("7"), ["FLOAT", "INT"])
+        self.assertEqual(types("$"), [])
+
+
+class TestTokenBuffer(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(EXAMPLES_DIR, "quicksort.pint"), "r", encoding="utf8") as f:
+            self.program = f.read()
+        self.lexer = tokens_and_grammar.get_lexer()
 
-                os.system(
-                    f"python {DEBREWER_PATH} {input_file} -o {test_output_file}"
-                )
+    def test_buffer_holds_lexer_tokens(self):
+        self.lexer.lineno = 1
+        self.lexer.input(self.program)
+        expected = [(tok.type, tok.value, tok.lineno, tok.lexpos) for tok in self.lexer]
 
-                with open(output_file, "r", encoding="utf8") as f:
+        self.lexer.lineno = 1
+        buffer = self.lexer.tokenize_all(self.program)
+
+        self.assertEqual(len(buffer), len(expected))
+        self.assertEqual(expected, [(buffer.type(n), buffer.value(n), buffer.lines[n], buffer.starts[n])
+                                    for n in range(len(buffer))])
+        self.assertTrue(all(type(value) in (int, float) for value in buffer.values.values()))
+
+    def test_parsers_read_buffer(self):
+        parser = tokens_and_grammar.get_parser()
+        program = self.program if self.program.endswith("\n") else self.program + "\n"
+
+        self.lexer.lineno = 1
+        expected = parser.parse(program, lexer=self.lexer)
+
+        for engine in (parser, parser.compile(), parser.pack()):
+            with self.subTest(engine=type(engine).__name__):
+                self.lexer.lineno = 1
+                buffer = self.lexer.tokenize_all(program)
+                self.assertEqual(expected, engine.parse(buffer))
+
+    def test_syntax_error_line(self):
+        self.lexer.lineno = 1
+        buffer = self.lexer.tokenize_all("🔢 a = 1\n🔢 b = = 2\n")
+
+        with self.assertRaises(PintException) as cm:
+            tokens_and_grammar.get_parser().parse(buffer)
+
+        self.assertEqual(cm.exception.line, 2)
+
+    def tokens(self, buffer):
+        return ([buffer.type(n) for n in range(len(buffer))], list(buffer.starts), list(buffer.ends),
+                list(buffer.lines), [buffer.value(n) for n in range(len(buffer))], buffer.lineno)
+
+    def test_retokenize_matches_tokenize_all(self):
+        at = self.program.index("i = i + 1")
+        comment = self.program.index("💬⬇️")
+        edits = [
+            (at, 0, "1 + "),                   # within a line
+            (at, 9, "🔢 j = 2\n🔢 k = 3"),    # adds lines
+            (at - 1, 1, ""),                   # joins two lines
+            (comment + 10, 3, "x\ny"),         # inside a multiline comment
+            (0, 0, "💬⬇️\n"),                  # opens a comment running to the next closing mark
+            (0, 0, "💬 first\n"),
+            (len(self.program), 0, "🔢 z = 1.5\n"),
+        ]
+        for offset, removed, inserted in edits:
+            with self.subTest(inserted=inserted):
+                self.lexer.lineno = 1
+                buffer = self.lexer.tokenize_all(self.program)
+                new, (first, gone, added) = self.lexer.retokenize(buffer, offset, removed, inserted)
+
+                program = self.program[:offset] + inserted + self.program[offset + removed:]
+                self.lexer.lineno = 1
+                expected = self.lexer.tokenize_all(program)
+                self.assertEqual(self.tokens(new), self.tokens(expected))
+                self.assertEqual(len(new), len(buffer) - gone + added)
+                self.assertEqual(new.values, expected.values)
+
+    def test_retokenize_delta(self):
+        self.lexer.lineno = 1
+        buffer = self.lexer.tokenize_all("🔢 a = 1\n💬⬇️\ntext\n💬⬆️\n🔢 b = 2\n")
+
+        # the line of the edit is lexed again, up to the next line
+        new, delta = self.lexer.retokenize(buffer, 6, 1, "10 + a")
+        self.assertEqual(delta, (0, 5, 7))
+        self.assertEqual(new.value(3), 10)
+
+        # an edit in a multiline comment restarts at its start
+        new, delta = self.lexer.retokenize(buffer, buffer.starts[5] + 4, 4, "more text")
+        self.assertEqual(delta, (5, 1, 1))
+        self.assertEqual(new.lines[6:], buffer.lines[6:])
+
+
+class TestLineIndex(unittest.TestCase):
+    def test_positions_and_lines(self):
+        data = "🔢 a = 1\n\n🔢 b = 2"
+        index = LineIndex(data)
+
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.position(0), (1, 1))
+        self.assertEqual(index.position(data.index("a")), (1, 3))
+        self.assertEqual(index.position(data.index("\n")), (1, data.index("\n") + 1))
+        self.assertEqual(index.position(data.index("b")), (3, 3))
+        self.assertEqual([index.line(n) for n in (1, 2, 3)], data.split("\n"))
+
+    def test_error_columns(self):
+        lexer = tokens_and_grammar.get_lexer()
+        for program, line, column in (("🔢 a = = 1\n", 1, 7), ("🔢 a = 1\n🔢 b = = 2\n", 2, 7), ("a = 1 $\n", 1, 7)):
+            with self.subTest(program=program):
+                lexer.lineno = 1
+                with self.assertRaises(PintException) as cm:
+                    tokens_and_grammar.get_parser().parse(program, lexer=lexer)
+
+                self.assertEqual((cm.exception.line, cm.exception.column), (line, column))
+                self.assertIs(lexer.line_index(), lexer.line_index())
+
+
+class TestComments(unittest.TestCase):
+    def tokens(self, data):
+        lexer = tokens_and_grammar.get_lexer()
+        lexer.input(data)
+        lexer.lineno = 1
+        return [(tok.type, tok.lineno) for tok in lexer]
+
+    def test_multiline_comment_ends_at_first_closing_line(self):
+        comment = "💬⬇️\nnot the end 💬⬆️ yet\n\n💬⬆️\n"
+
+        self.assertEqual(self.tokens(comment + "a\n💬⬆️\n"),
+                         [("MULTILINECOMMENT", 1), ("IDENTIFIER", 5), ("NEWLINE", 5), ("ONELINECOMMENT", 6)])
+
+    def test_unterminated_comment(self):
+        with self.assertRaises(PintException) as cm:
+            self.tokens("🔢 a = 1\n  💬⬇️\n🔢 b = 2\n💬⬆️ b\n")
+
+        self.assertEqual((cm.exception.category, cm.exception.line, cm.exception.column), ("Unterminated comment", 2, 3))
+
+    def test_stripped_comments(self):
+        program = ("💬⬇️\nDocs\n💬⬆️\n🔢 total = 1 💬 start\n💬 loop\n"
+                   "🔁 (total 🐜 100) {\n    total = total * 2\n    💬 doubled\n    total = total + 1\n}\n")
+
+        lexer = tokens_and_grammar.get_lexer(strip_comments=True)
+        lexer.lineno = 1
+        self.assertEqual(tokens_and_grammar.get_parser().parse(program, lexer=lexer),
+                         "total: int = 1 \nwhile total < 100:\n    total = total * 2\n    total = total + 1\n")
+
+        lexer = tokens_and_grammar.get_lexer(strip_comments=True)
+        lexer.input(program)
+        lexer.lineno = 1
+        self.assertEqual([(tok.type, tok.value, tok.lineno) for tok in lexer if "COMMENT" in tok.type],
+                         [("MULTILINECOMMENT", "", 1), ("ONELINECOMMENT", "\n", 4), ("ONELINECOMMENT", "", 5),
+                          ("ONELINECOMMENT", "", 8)])
+
+        # comments are kept again by the next get_lexer()
+        self.assertEqual(self.tokens("💬 a\n"), [("ONELINECOMMENT", 1)])
+        self.assertEqual(tokens_and_grammar.get_lexer().lexstate, "INITIAL")
+
+
+class TestInterning(unittest.TestCase):
+    def values(self, lexer, data):
+        lexer.input(data)
+        lexer.lineno = 1
+        return [tok.value for tok in lexer if tok.type in ("IDENTIFIER", "TYPE")]
+
+    def test_repeated_names_share_one_string(self):
+        lexer = tokens_and_grammar.get_lexer()
+        program = "🔢 total = 1\n🔢 count = total + total\n"
+        first = self.values(lexer, program)
+
+        self.assertEqual(first, ["🔢", "total", "🔢", "count", "total", "total"])
+        self.assertIs(first[0], first[2])
+        self.assertIs(first[1], first[4])
+        self.assertIs(first[1], first[5])
+
+        # every input gets a table of its own
+        second = self.values(lexer, program)
+        self.assertIsNot(first[1], second[1])
+        self.assertEqual(len(lexer.lexnames), 3)
+
+    def test_buffered_names_are_interned(self):
+        lexer = tokens_and_grammar.get_lexer()
+        lexer.lineno = 1
+        buffer = lexer.tokenize_all("🔢 total = 1\n🔢 count = total + total\n")
+        reader = buffer.reader()
+        names = [tok.value for tok in iter(reader.token, None) if tok.type == "IDENTIFIER"]
+
+        self.assertEqual(names, ["total", "count", "total", "total"])
+        self.assertIs(names[0], lexer.lexnames["total"])
+        self.assertIs(names[2], names[0])
+        self.assertIs(names[3], names[0])
+
+        # the tokens kept from before an edit share the strings of the lexed ones
+        edited, _ = lexer.retokenize(buffer, len("🔢 total = 1\n🔢 count = total + "), len("total"), "total")
+        values = [edited.value(n) for n in range(len(edited)) if edited.type(n) == "IDENTIFIER"]
+        self.assertIs(values[0], values[3])
+        self.assertIs(values[0], lexer.lexnames["total"])
+
+        lexer.lineno = 1
+        tokens_and_grammar.get_parser().parse(buffer)
+        (first, second) = tokens_and_grammar.get_parser().session.scope.variables
+        self.assertIs(first, names[0])
+
+    def test_scope_keys_are_interned(self):
+        lexer = tokens_and_grammar.get_lexer()
+        lexer.lineno = 1
+        tokens_and_grammar.get_parser().parse("🔢 total = 1\n", lexer=lexer)
+
+        (name,) = tokens_and_grammar.get_parser().session.scope.variables
+        self.assertIs(name, lexer.lexnames["total"])
+
+
+class TestStreamLexer(unittest.TestCase):
+    def parse(self, path, size=None):
+        if size is None:
+            with open(path, "r", encoding="utf8") as f:
+                program = f.read()
+            lexer = tokens_and_grammar.get_lexer()
+            lexer.lineno = 1
+            program = program if program.endswith("\n") else program + "\n"
+        else:
+            lexer = StreamLexer(tokens_and_grammar.get_lexer(), tokens_and_grammar.window_end)
+            lexer.input(tokens_and_grammar.source_chunks(path, size))
+            lexer.lineno = 1
+            program = None
+        try:
+            return tokens_and_grammar.get_parser().parse(program, lexer=lexer)
+        except PintException as e:
+            return (str(e), e.line, e.column, lexer.line_index().line(e.line))
+
+    def test_windows_keep_translation(self):
+        for directory in (EXAMPLES_DIR, os.path.join(EXAMPLES_DIR, "bad")):
+            for filename in os.listdir(directory):
+                if filename.endswith(".pint") or filename.endswith(".🍺"):
+                    path = os.path.join(directory, filename)
+                    expected = self.parse(path)
+                    # windows of a few bytes split the emoji and the comments
+                    for size in (3, 64):
+                        with self.subTest(filename=filename, size=size):
+                            self.assertEqual(self.parse(path, size), expected)
+
+    def test_window_end(self):
+        window_end = tokens_and_grammar.window_end
+        self.assertEqual(window_end("a\nb")[0], 2)
+        self.assertEqual(window_end("a\n💬⬇️\nb\n")[0], 2)
+        self.assertEqual(window_end("💬⬇️\nb\n")[0], 0)
+        self.assertEqual(window_end("a\n💬⬇️\nb\n💬⬆️\nc")[0], len("a\n💬⬇️\nb\n💬⬆️\n"))
+        self.assertEqual(window_end("a\n💬⬇️\nb💬⬆️\n💬⬇️\nc")[0], len("a\n💬⬇️\nb💬⬆️\n"))
+
+        # marks split between the chunks
+        cut, state = window_end("a\n💬")
+        self.assertEqual(cut, 2)
+        cut, state = window_end("⬇️\nb\n💬⬆", state)
+        self.assertEqual(cut, 0)
+        self.assertEqual(window_end("️\nc", state)[0], len("️\n"))
+
+    def test_chunks_are_scanned_once(self):
+        scanned = []
+
+        def split(text, state):
+            scanned.append(text)
+            return tokens_and_grammar.window_end(text, state)
+
+        chunks = ["🔢 a = 1\n💬⬇️"] + ["comment "] * 50 + ["💬⬆️\n🔢 b = 2\n"]
+        stream = StreamLexer(tokens_and_grammar.get_lexer(), split)
+        stream.input(chunks)
+        stream.lineno = 1
+
+        self.assertEqual([tok.lineno for tok in stream if tok.type == "TYPE"], [1, 3])
+        self.assertEqual(scanned, chunks)
+
+    def test_lines_of_windows(self):
+        lexer = tokens_and_grammar.get_lexer()
+        stream = StreamLexer(lexer)
+        stream.input(["🔢 a = 1\n🔢 b", " = 2\n🔢 a = 3\n"])
+        stream.lineno = 1
+
+        self.assertEqual([(tok.type, tok.lineno) for tok in stream if tok.type == "TYPE"],
+                         [("TYPE", 1), ("TYPE", 2), ("TYPE", 3)])
+        self.assertEqual(lexer.line_index().line(3), "🔢 a = 3")
+        self.assertNotIn(1, lexer.line_index())
+        self.assertEqual(stream.base, len("🔢 a = 1\n"))
+        # the names are interned across the windows
+        self.assertEqual(len(lexer.lexnames), 3)
+
+
+class TestTokenFilters(unittest.TestCase):
+    def parse(self, lexer, program):
+        lexer.lineno = 1
+        try:
+            return tokens_and_grammar.get_parser().parse(program, lexer=lexer)
+        except PintException as e:
+            return (str(e), e.line, e.column)
+
+    def test_coalesced_newlines_keep_translation(self):
+        lexer = tokens_and_grammar.get_lexer()
+        filtered = lexer.filtered([tokens_and_grammar.coalesce_newlines])
+        programs = ["\n\n\n🔢 a = 1\n\n\n\n🔢 b = 2\n", "🔢 a = 1\n🔢 a = 2\n\n\n\n🔢 c = 3\n"]
+        for directory in (EXAMPLES_DIR, os.path.join(EXAMPLES_DIR, "bad")):
+            for filename in os.listdir(directory):
+                if filename.endswith(".pint") or filename.endswith(".🍺"):
+                    with open(os.path.join(directory, filename), "r", encoding="utf8") as f:
+                        program = f.read()
+                    programs.append(program if program.endswith("\n") else program + "\n")
+
+        for program in programs:
+            with self.subTest(program=program[:20]):
+                self.assertEqual(self.parse(lexer, program), self.parse(filtered, program))
+
+        self.parse(filtered, programs[0])
+        self.assertEqual(filtered.removed(), {"coalesce_newlines": 3})
+
+    def test_stripped_comments(self):
+        filtered = tokens_and_grammar.get_lexer().filtered([tokens_and_grammar.strip_comments])
+        program = "💬⬇️\ndoc\n💬⬆️\n🔢 a = 1 💬 one\n💬 two\n🔢 b = = 2\n"
+
+        self.assertEqual(self.parse(filtered, program.replace("= =", "=")), "a: int = 1 \nb: int = 2 \n")
+        self.assertEqual(filtered.removed(), {"strip_comments": 0})
+        self.assertEqual(self.parse(filtered, program)[1:], (6, 7))
+
+    def test_stripped_comments_in_blocks(self):
+        filtered = tokens_and_grammar.get_lexer().filtered([tokens_and_grammar.strip_comments])
+        stripping = tokens_and_grammar.get_lexer(strip_comments=True)
+        body = "🔢 i = 0\n🔁 (i 🐜 5) {\n    i = i + 1\n%s    🍃 (i 🐘 2) {\n        💬 inner\n        i = i + 1\n    }\n}\n"
+        for comment in ("    💬 step\n", "    💬⬇️\n    doc\n    💬⬆️\n"):
+            program = body % comment
+            with self.subTest(comment=comment):
+                expected = self.parse(stripping, program)
+                self.assertIsInstance(expected, str)
+                self.assertEqual(self.parse(filtered, program), expected)
+
+
+class TestImport(unittest.TestCase):
+    # seconds a fresh interpreter may spend importing tokens_and_grammar
+    IMPORT_BUDGET = 0.5
+
+    def test_import_does_not_build_lexer_or_parser(self):
+        code = (
+            "import sys, time\n"
+            "start = time.perf_counter()\n"
+            "import tokens_and_grammar\n"
+            "print(time.perf_counter() - start)\n"
+            "print(tokens_and_grammar._lexer is None and tokens_and_grammar._parser is None)\n"
+            "print('ply.lex' in sys.modules or 'ply.yacc' in sys.modules)\n"
+        )
+        result = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+        elapsed, lazy, ply_imported = result.stdout.split()
+
+        self.assertLess(float(elapsed), self.IMPORT_BUDGET)
+        self.assertEqual(lazy, "True")
+        self.assertEqual(ply_imported, "False")
+        self.assertTrue(tokens_and_grammar.tokens)
+
+
+class TestFrozenParser(unittest.TestCase):
+    def load_module(self, filename):
+        spec = importlib.util.spec_from_file_location("parsetab_test", filename)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    def test_frozen_tables_are_used(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "parsetab_test.py")
+            built = freeze(filename)
+
+            frozen = yacc(module=tokens_and_grammar, tabmodule=self.load_module(filename))
+
+            self.assertIsInstance(frozen.productions[1], MiniProduction)
+            self.assertEqual(built.action, frozen.action)
+            self.assertEqual(built.goto, frozen.goto)
+            self.assertEqual(built.signature, frozen.signature)
+
+    def test_frozen_tables_are_loaded_from_their_path(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "parsetab.py")
+            built = freeze(filename)
+
+            # a parsetab module elsewhere on sys.path is not taken for it
+            other = os.path.join(tmp, "other")
+            os.mkdir(other)
+            with open(os.path.join(other, "parsetab.py"), "w", encoding="utf8") as f:
+                f.write("raise AssertionError('wrong parsetab')\n")
+            with mock.patch.object(sys, "path", [other] + sys.path):
+                frozen = yacc(module=tokens_and_grammar, tabmodule=filename)
+            self.assertNotIn("parsetab", sys.modules)
+
+            self.assertIsInstance(frozen.productions[1], MiniProduction)
+            self.assertEqual(built.action, frozen.action)
+
+            missing = yacc(module=tokens_and_grammar, tabmodule=os.path.join(tmp, "missing.py"), errorlog=NullLogger())
+            self.assertNotIsInstance(missing.productions[1], MiniProduction)
+
+    def test_stale_frozen_tables_are_rejected(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "parsetab_test.py")
+            freeze(filename)
+            module = self.load_module(filename)
+            module._lr_signature = "stale"
+
+            rebuilt = yacc(module=tokens_and_grammar, tabmodule=module, errorlog=NullLogger())
+
+            self.assertNotIsInstance(rebuilt.productions[1], MiniProduction)
+
+
+class TestCompiledParser(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.parser = tokens_and_grammar.get_parser().compile()
+
+    def parse(self, program):
+        lexer = tokens_and_grammar.get_lexer()
+        lexer.lineno = 1
+        return self.parser.parse(program, lexer=lexer)
+
+    def test_examples(self):
+        for filename in os.listdir(EXAMPLES_DIR):
+            if filename.endswith(".pint") or filename.endswith(".🍺"):
+                input_file = os.path.join(EXAMPLES_DIR, filename)
+                input_pathname, _ = os.path.splitext(input_file)
+                with open(input_file, "r", encoding="utf8") as f:
+                    program = f.read()
+                with open(input_pathname + ".py", "r", encoding="utf8") as f:
                     expected = f.read()
-                with open(test_output_file, "r", encoding="utf8") as f:
-                    actual = f.read()
-
-                try:
-                    self.assertEqual(expected, actual)
-                    print(f"File {filename} OK")
-                except AssertionError:
-                    print(f"File {filename} failed")
-                    failed = True
-                finally:
-                    os.remove(test_output_file)
 
-        if failed:
-            self.fail("Some tests failed")
+                with self.subTest(filename=filename):
+                    self.assertEqual(expected, self.parse(program if program.endswith("\n") else program + "\n"))
+
+    def test_syntax_error(self):
+        with self.assertRaises(PintException) as cm:
+            self.parse("🔢 a = 1\n🔢 b = = 2\n")
+
+        self.assertEqual(cm.exception.line, 2)
+
+    def test_unterminated_block(self):
+        program = "🔢 i = 0\n🔁 (i 🐜 5) {\n    i = i + 1\n"
+        for parser in (self.parser, tokens_and_grammar.get_parser()):
+            lexer = tokens_and_grammar.get_lexer()
+            lexer.lineno = 1
+            with self.subTest(parser=type(parser).__name__), self.assertRaises(PintException) as cm:
+                parser.parse(program, lexer=lexer)
+
+            self.assertEqual(cm.exception.message, "Unexpected end of input")
+            self.assertEqual((cm.exception.line, cm.exception.column), (3, len("    i = i + 1") + 1))
+
+
+class TestGeneratedCode(unittest.TestCase):
+    def test_code_is_restored_from_cache(self):
+        parser = tokens_and_grammar.get_parser()
+        with tempfile.TemporaryDirectory() as tmp:
+            cachefile = os.path.join(tmp, "parser.marshal")
+            built = parser.compile(cachefile)
+
+            with mock.patch("builtins.compile", side_effect=AssertionError):
+                cached = parser.compile(cachefile)
+            self.assertEqual(built.source, cached.source)
+
+            lexer = tokens_and_grammar.get_lexer()
+            lexer.lineno = 1
+            self.assertEqual(cached.parse("🔢 a = 1\n", lexer=lexer), "a: int = 1 \n")
+
+            with open(cachefile, "wb") as f:
+                f.write(b"damaged")
+            parser.compile(cachefile)
+            with mock.patch("builtins.compile", side_effect=AssertionError):
+                parser.compile(cachefile)
+
+    def test_pool_uses_generated_parser(self):
+        self.assertIsInstance(tokens_and_grammar.ParserPool().parser, CompiledLRParser)
+
+
+class TestPackedParser(TestCompiledParser):
+    @classmethod
+    def setUpClass(cls):
+        cls.parser = tokens_and_grammar.get_parser().pack()
+
+    def test_tables_are_packed(self):
+        parser = self.parser
+
+        for state, actions in parser.action.items():
+            for name, code in parser.tokencodes.items():
+                i = parser.base[state] + code
+                t = parser.table[i] if parser.check[i] == state else parser.default[state]
+                if name in actions:
+                    self.assertEqual(actions[name], t)
+                else:
+                    self.assertTrue(t == PACKED_ERROR or t < 0)
+
+        for state, gotos in parser.goto.items():
+            for name, target in gotos.items():
+                n = parser.symbolcodes[name]
+                i = parser.goto_base[n] + state
+                self.assertEqual(target, parser.goto_table[i] if parser.goto_check[i] == n else parser.goto_default[n])
@@ -1,9 +1,25 @@
-from ply.lex import lex
-from ply.yacc import yacc
+import codecs
+import mmap
+import os
+import queue
+from contextlib import contextmanager
 
 from utils.errors import PintException
 from utils.utils import *
 
+# the generated lexer and parsing tables are cached here and rebuilt whenever the rules change
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__")
+LEXTAB = os.path.join(CACHE_DIR, "lextab.pickle")
+PARSETAB = os.path.join(CACHE_DIR, "parsetab.pickle")
+# code of the generated parser (get_parser().compile()) used by ParserPool
+PARSERCODE = os.path.join(CACHE_DIR, "parser.marshal")
+# record of the last grammar that passed validation, so it isn't validated again on every start
+MANIFEST = os.path.join(CACHE_DIR, "grammar.manifest")
+
+# precomputed parsing tables written by `python -m utils.freeze_parser`, used when present and current;
+# loaded from this path, not from whatever parsetab module is first on sys.path
+TABMODULE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parsetab.py")
+
 # --- Tokenizer ---
 
 # All tokens must be named in advance.
@@ -28,11 +44,17 @@ tokens = (
     "PRINT",
 )
 
+# In the "nocomments" state (get_lexer(strip_comments=True)) comments are passed on without their text
+states = (("nocomments", "inclusive"),)
+
 # Ignored characters - spaces and tabs
 t_ignore = " \t"
 
+# closing mark of a multiline comment, the newline included
+COMMENT_END = "💬⬆️\n"
+
 # Token matching rules are written as regexs
-t_TYPE = r"🔢|⏺️|🆒|🔠"
+# t_TYPE = r"🔢|⏺️|🆒|🔠" (see t_TYPE below)
 t_LEFTARROW = r"<"
 t_RIGHTARROW = r">"
 
@@ -40,7 +62,7 @@ t_BOOLEAN = r"✅|❌"
 t_STRING = r"\".*\"|✏️\“.*\”"
 t_NONE = r"🌌"
 
-t_IDENTIFIER = r"[a-zA-Z_][a-zA-Z0-9_]*"
+# t_IDENTIFIER = r"[a-zA-Z_][a-zA-Z0-9_]*" (see t_IDENTIFIER below)
 
 t_CLASS = r"🏛️"
 t_INHERITS = r"👨‍👦"
@@ -137,6 +159,20 @@ def t_INT(t):
     return t
 
 
+# Types and names are interned for the program being lexed, so that every use of a name is
+# the same string in the tokens, the scope dictionaries and the output
+def t_TYPE(t):
+    r"🔢|⏺️|🆒|🔠"
+    t.value = t.lexer.intern(t.value)
+    return t
+
+
+def t_IDENTIFIER(t):
+    r"[a-zA-Z_][a-zA-Z0-9_]*"
+    t.value = t.lexer.intern(t.value)
+    return t
+
+
 # t_NEWLINE = r'\n'
 def t_NEWLINE(t):
     r"\n"
@@ -145,9 +181,12 @@ def t_NEWLINE(t):
 
 
 # t_COMMENT = r'(💬⬇️(.|\n)*?💬⬆️\n)|(💬.*\n)'
+# only the opening mark is matched by the regex, the end is found with a single str.find
+# (a lazy (.|\n)*? walks the comment character by character)
 def t_MULTILINECOMMENT(t):
-    r"💬⬇️(.|\n)*?💬⬆️\n"
-    t.lexer.lineno += t.value.count("\n")
+    r"💬⬇️"
+    end = skip_multiline_comment(t)
+    t.value = t.lexer.lexdata[t.lexpos:end]
     return t
 
 
@@ -157,26 +196,174 @@ def t_ONELINECOMMENT(t):
     return t
 
 
-# Error handler for illegal characters
-def t_error(t):
-    last_cr = t.lexer.lexdata.rfind("\n", 0, t.lexpos)
-    if last_cr < 0:
-        last_cr = 0
-    column = (t.lexpos - last_cr)
+# moves the lexer past the multiline comment opened by t and returns where it ends
+def skip_multiline_comment(t):
+    lexer = t.lexer
+    end = lexer.lexdata.find(COMMENT_END, lexer.lexpos)
+    if end < 0:
+        line, column = lexer.line_index().position(t.lexpos)
+        raise PintException("Unterminated comment", f"No {COMMENT_END.strip()} closes the comment", line, column, t.value)
+
+    end += len(COMMENT_END)
+    lexer.lineno += lexer.lexdata.count("\n", t.lexpos, end)
+    lexer.lexpos = end
+    return end
 
-    raise PintException("Illegal character", "", t.lexer.lineno, column, t.value[0])
 
+# The comment tokens stay, as the grammar uses comments to separate statements and end declarations,
+# but their text is not sliced out of the program nor translated.  p_multiline_comment leaves out
+# a comment with no text, a one-line comment is left only with the newline ending a statement.
+def t_nocomments_MULTILINECOMMENT(t):
+    r"💬⬇️"
+    skip_multiline_comment(t)
+    t.value = ""
+    return t
 
-# Build the lexer object
-lexer = lex()
+
+def t_nocomments_ONELINECOMMENT(t):
+    r"💬.*\n"
+    t.lexer.lineno += 1
+    t.value = stripped_oneline_comment(t.lexer.lexdata, t.lexpos)
+    return t
+
+
+# the value of a one-line comment at lexpos without its text: the newline ending the statement
+# before it on its line, or nothing on a line of its own
+def stripped_oneline_comment(lexdata, lexpos):
+    return "\n" if lexdata[lexdata.rfind("\n", 0, lexpos) + 1:lexpos].strip() else ""
+
+
+# Error handler for illegal characters
+def t_error(t):
+    line, column = t.lexer.line_index().position(t.lexpos)
+
+    raise PintException("Illegal character", "", line, column, t.value[0])
+
+
+# The lexer is built on first use by get_lexer(); PLY itself is only imported then
+_lexer = None
+
+
+def get_lexer(strip_comments=False):
+    global _lexer
+
+    if _lexer is None:
+        from ply.lex import lex
+
+        # most tokens are told apart by their first character, so only the rules for it are tried
+        _lexer = lex(picklefile=LEXTAB).dispatch()
+    _lexer.begin("nocomments" if strip_comments else "INITIAL")
+    return _lexer
+
+
+# Large programs are lexed from the memory-mapped file in windows of about this many bytes
+WINDOW_SIZE = 1 << 20
+
+
+# Returns a lexer for parser.parse(lexer=...) reading the program at path a window at a time;
+# lexer is the one to read the windows with, get_lexer(strip_comments) by default, and chunks
+# the text of the program, source_chunks(path) by default.  The file stays open until the
+# chunks are read to the end or closed: pass chunks under contextlib.closing() to close it
+# after a parse that doesn't get to the end.
+def get_stream_lexer(path, strip_comments=False, lexer=None, chunks=None):
+    from ply.lex import StreamLexer
+
+    lexer = StreamLexer(lexer or get_lexer(strip_comments), window_end)
+    lexer.input(source_chunks(path) if chunks is None else chunks)
+    lexer.lineno = 1
+    return lexer
+
+
+# The text of the file decoded a window at a time, the last line ended with a newline
+def source_chunks(path, size=WINDOW_SIZE):
+    with open(path, "rb") as f:
+        # an empty file can't be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            decoder = codecs.getincrementaldecoder("utf8")()
+            last = ""
+            for start in range(0, len(data), size):
+                text = decoder.decode(data[start:start + size])
+                if text:
+                    last = text[-1]
+                    yield text
+            decoder.decode(b"", final=True)
+            if last != "\n":
+                yield "\n"
+
+
+# A window ends after the last newline outside of a multiline comment.  Comments are found as
+# t_MULTILINECOMMENT finds them; an opening mark in a string or a one-line comment at worst
+# ends the window early, on a line start, which is always between tokens.
+# The state is whether a comment is open at the end of the chunk and the last characters of
+# the chunk, which may begin a mark finished by the next one.
+def window_end(text, state=None):
+    opened, carry = state or (False, "")
+    text = carry + text
+    cut = pos = 0
+    while True:
+        if opened:
+            end = text.find(COMMENT_END, pos)
+            if end < 0:
+                pos = max(pos, len(text) - len(COMMENT_END) + 1)
+                break
+            # the closing mark ends with a newline
+            pos = cut = end + len(COMMENT_END)
+            opened = False
+        start = text.find("💬⬇️", pos)
+        cut = max(cut, text.rfind("\n", pos, len(text) if start < 0 else start) + 1)
+        if start < 0:
+            pos = max(pos, len(text) - len("💬⬇️") + 1)
+            break
+        pos = start + len("💬⬇️")
+        opened = True
+    return max(cut - len(carry), 0), (opened, text[pos:])
+
+
+# Token filters for get_lexer().filtered([...]), which run between the lexer and the parser
+
+# The NEWLINE ending a line is passed on as it is, the blank lines after it
+# arrive as one NEWLINE with all of their newlines as its value.  Blank lines
+# are only ever reduced into newlines or statements by joining their values,
+# so the translation doesn't change.
+def coalesce_newlines(tokens):
+    run = None
+    after_newline = False
+    for tok in tokens:
+        if tok.type != "NEWLINE":
+            if run is not None:
+                yield run
+                run = None
+            after_newline = False
+            yield tok
+        elif not after_newline:
+            after_newline = True
+            yield tok
+        elif run is None:
+            run = tok
+        else:
+            run.value += tok.value
+    if run is not None:
+        yield run
+
+
+# The text of the comments is dropped, as in the "nocomments" lexer state.  The comment tokens
+# stay, as the grammar uses comments to separate statements; the lexer state doesn't slice the
+# text out of the program in the first place and is the faster way of the two.
+def strip_comments(tokens):
+    for tok in tokens:
+        if tok.type == "ONELINECOMMENT":
+            tok.value = stripped_oneline_comment(tok.lexer.lexdata, tok.lexpos)
+        elif tok.type == "MULTILINECOMMENT":
+            tok.value = ""
+        yield tok
 
 
 # --- Parser ---
 
 spacing = 4 * " "
 
-variables = {}
-
 types = {
     "🔢": "int",
     "⏺️": "float",
@@ -190,7 +377,22 @@ types = {
 
 emoji_operators = {"🐜": "<", "🐜⚖️": "<=", "🐘": ">", "🐘⚖️": ">=", "⚖️": "=="}
 
-current_scope = Scope("global", None)
+
+# The state of the translation of one program: the current scope, the types
+# with the classes defined so far and the definitions of these classes.  The
+# grammar actions find it as p.parser.session; after a parse it holds the
+# session of that parse.
+class Session:
+    def __init__(self):
+        self.scope = Scope("global", None)
+        self.types = dict(types)
+        self.classes = []
+
+
+# Called by the parser at the start of every parse, so that each program is
+# translated in a session of its own
+def p_begin(parser):
+    parser.session = Session()
 
 
 def indent(lines):
@@ -216,7 +418,7 @@ def p_program(p):
     """
     program : nonexecutables imports nonexecutables definitions_and_statements nonexecutables
     """
-    p[0] = "".join(p[1:])
+    p[0] = "".join(p.values)
 
 
 # NEWLINES
@@ -225,7 +427,7 @@ def p_newlines(p):
     newlines : newlines NEWLINE
              | NEWLINE
     """
-    p[0] = "".join(p[1:])
+    p[0] = "".join(p.values)
 
 
 # EMPTY
@@ -243,7 +445,7 @@ def p_imports(p):
             | import
             | empty
     """
-    p[0] = "".join(p[1:])
+    p[0] = "".join(p.values)
 
 
 def p_import(p):
@@ -254,7 +456,7 @@ def p_import(p):
            | IMPORT compound_identifier FROM compound_identifier AS IDENTIFIER NEWLINE
     """
 
-    match p[1:]:
+    match p.values:
         case ["🚢", _, "\n"]:
             p[0] = f"import {p[2]}\n"
         case ["🚢", _, "🤿", _, "\n"]:
@@ -276,7 +478,7 @@ def p_definitions_and_statements(p):
                                | statement
                                | empty
     """
-    p[0] = "".join(p[1:])
+    p[0] = "".join(p.values)
 
 
 # TYPES
@@ -289,7 +491,7 @@ def p_type(p):
          | DICT LEFTARROW type COMMA type RIGHTARROW
          | SET LEFTARROW type RIGHTARROW
     """
-    p[0] = (types[p[1]] + "".join(p[2:])).replace("<", "[").replace(">", "]")
+    p[0] = (p.parser.session.types[p[1]] + "".join(p[2:])).replace("<", "[").replace(">", "]")
 
 
 def p_types(p):
@@ -318,12 +520,12 @@ def p_variable_definition(p):
     variable_definition : type IDENTIFIER ASSIGN expression NEWLINE
                         | type IDENTIFIER ASSIGN expression oneline_comment
     """
-    global current_scope
+    session = p.parser.session
 
-    if current_scope.contains_variable(p[2]):
-        raise PintException("Definition error", f"Variable \"{p[2]}\" already defined in scope {current_scope.name}", p.lexer.lineno - 1, 1, None)
+    if session.scope.contains_variable(p[2]):
+        raise PintException("Definition error", f"Variable \"{p[2]}\" already defined in scope {session.scope.name}", p.lexer.lineno - 1, 1, None)
     else:
-        current_scope.variables[p[2]] = Variable(p[2], p[1], p[4])
+        session.scope.variables[p[2]] = Variable(p[2], p[1], p[4])
 
     match p[-1]:
         case "\n":
@@ -338,13 +540,13 @@ def p_function_definition(p):
     function_definition : function_naming LPAREN parameters RPAREN RETURNARROW type LBRACE NEWLINE function_body RBRACE NEWLINE
                         | function_naming LPAREN parameters RPAREN RETURNARROW NONE LBRACE NEWLINE function_body RBRACE NEWLINE
     """
-    global current_scope
+    session = p.parser.session
 
-    current_scope = current_scope.parent
+    session.scope = session.scope.parent
 
-    current_scope.functions[p[1].name].parameters = p[3]
-    current_scope.functions[p[1].name].return_type = p[6]
-    current_scope.functions[p[1].name].body = p[9]
+    session.scope.functions[p[1].name].parameters = p[3]
+    session.scope.functions[p[1].name].return_type = p[6]
+    session.scope.functions[p[1].name].body = p[9]
 
     p[0] = f"def {p[1].name}({p[3]}) -> {p[6].replace('🌌', 'None')}:\n{indent(p[9])}\n"
 
@@ -353,13 +555,13 @@ def p_function_naming(p):
     """
     function_naming : FUNCTION IDENTIFIER
     """
-    global current_scope
+    session = p.parser.session
 
-    if current_scope.contains_function(p[2]):
-        raise PintException("Definition error", f"Function \"{p[2]}\" already defined in scope {current_scope.name}", p.lexer.lineno, 1, None)
+    if session.scope.contains_function(p[2]):
+        raise PintException("Definition error", f"Function \"{p[2]}\" already defined in scope {session.scope.name}", p.lexer.lineno, 1, None)
     else:
-        current_scope.functions[p[2]] = p[0] = Function(p[2], None, None, None)
-        current_scope = FunctionScope(p[2], current_scope)
+        session.scope.functions[p[2]] = p[0] = Function(p[2], None, None, None)
+        session.scope = FunctionScope(p[2], session.scope)
 
 
 def p_function_body(p):
@@ -370,7 +572,7 @@ def p_function_body(p):
                   | nonexecutables
                   | empty
     """
-    p[0] = "".join(p[1:])
+    p[0] = "".join(p.values)
 
 
 # STATEMENTS
@@ -397,7 +599,7 @@ def p_statements(p):
                | statement
                | empty
     """
-    p[0] = "".join(p[1:])
+    p[0] = "".join(p.values)
 
 
 def p_return_statement(p):
@@ -416,7 +618,7 @@ def p_assignment_statement(p):
                          | compound_identifier assign expression oneline_comment
                          | subscript_expression assign expression oneline_comment
     """
-    global current_scope
+    session = p.parser.session
 
     variable_basename = (
         p[1].split(".")[0] if "." in p[1] and not "self" in p[1]
@@ -425,10 +627,10 @@ def p_assignment_statement(p):
         else p[1]
     )
 
-    if not current_scope.contains_variable(variable_basename):
+    if not session.scope.contains_variable(variable_basename):
         raise PintException(
             "Assignment error", 
-            f"Variable \"{variable_basename}\" not defined in scope {current_scope.name}", 
+            f"Variable \"{variable_basename}\" not defined in scope {session.scope.name}", 
             p.lexer.lineno - 2, 
             1, 
             None
@@ -495,7 +697,7 @@ def p_if_body(p):
             | nonexecutables
             | empty
     """
-    p[0] = "".join(p[1:])
+    p[0] = "".join(p.values)
 
 
 def p_compound_if_statement(p):
@@ -511,7 +713,7 @@ def p_if_elseif_statements(p):
     if_elseif_statements : if_elseif_statements elseif_statement
                          | simple_if_statement
     """
-    p[0] = "".join(p[1:])
+    p[0] = "".join(p.values)
 
 
 def p_elseif_statement(p):
@@ -549,7 +751,7 @@ def p_match_cases(p):
     match_cases : match_cases match_case
                 | match_case
     """
-    p[0] = "".join(p[1:])
+    p[0] = "".join(p.values)
 
 
 def p_match_case(p):
@@ -581,7 +783,7 @@ def p_case_body(p):
               | nonexecutables
               | empty
     """
-    p[0] = "".join(p[1:])
+    p[0] = "".join(p.values)
 
 
 # LOOP
@@ -599,7 +801,7 @@ def p_while_statement(p):
     while_statement : loop_beginning LPAREN expression RPAREN LBRACE NEWLINE statements RBRACE NEWLINE
                     | loop_beginning LBRACE NEWLINE statements RBRACE NEWLINE
     """
-    global current_scope
+    session = p.parser.session
 
     statements = p[7] if len(p) == 10 else p[4]
 
@@ -610,7 +812,7 @@ def p_while_statement(p):
 
     condition = p[3] if len(p) == 10 else "True"
 
-    current_scope = current_scope.parent
+    session.scope = session.scope.parent
 
     p[0] = f"while {condition}:\n{statements}\n"
 
@@ -619,9 +821,9 @@ def p_loop_beginning(p):
     """
     loop_beginning : LOOP
     """
-    global current_scope
+    session = p.parser.session
 
-    current_scope = Scope("loop", current_scope)
+    session.scope = Scope("loop", session.scope)
 
     p[0] = p[1]
 
@@ -631,9 +833,9 @@ def p_for_statement(p):
     """
     for_statement : for_beginning LBRACE NEWLINE definitions_and_statements RBRACE NEWLINE
     """
-    global current_scope
+    session = p.parser.session
 
-    current_scope = current_scope.parent
+    session.scope = session.scope.parent
 
     if p[4].isspace() or not p[4]:
         p[4] = "pass"
@@ -645,9 +847,9 @@ def p_for_beginning(p):
     """
     for_beginning : loop_beginning LPAREN type IDENTIFIER ASSIGN expression RPAREN
     """
-    global current_scope
+    session = p.parser.session
 
-    current_scope.variables[p[4]] = Variable(p[4], p[3])
+    session.scope.variables[p[4]] = Variable(p[4], p[3])
 
     p[0] = f"for {p[4]} in {p[6]}:"
 
@@ -687,6 +889,11 @@ def p_multiline_comment(p):
     """
     multiline_comment : MULTILINECOMMENT
     """
+    # stripped by the lexer
+    if not p[1]:
+        p[0] = ""
+        return
+
     lines = p[1].replace("💬⬇️", "").replace("💬⬆️", "").strip().split("\n")
     lines = ["# " + line.strip() for line in lines]
     lines = "\n".join(lines) + "\n"
@@ -706,7 +913,7 @@ def p_comments(p):
     comments : comments comment
              | comment
     """
-    p[0] = "".join(p[1:])
+    p[0] = "".join(p.values)
 
 
 def p_nonexecutables(p):
@@ -715,7 +922,7 @@ def p_nonexecutables(p):
                    | nonexecutables newlines
                    | empty
     """
-    p[0] = "".join(p[1:])
+    p[0] = "".join(p.values)
 
 
 # PARAMETERS
@@ -747,9 +954,9 @@ def p_simple_parameter(p):
     """
     simple_parameter : type IDENTIFIER
     """
-    global current_scope
+    session = p.parser.session
 
-    current_scope.variables[p[2]] = Variable(p[2], p[1])
+    session.scope.variables[p[2]] = Variable(p[2], p[1])
     p[0] = f"{p[2]}: {p[1]}"
 
 
@@ -757,9 +964,9 @@ def p_default_parameter(p):
     """
     default_parameter : type IDENTIFIER ASSIGN expression
     """
-    global current_scope
+    session = p.parser.session
 
-    current_scope.variables[p[2]] = Variable(p[2], p[1], p[4])
+    session.scope.variables[p[2]] = Variable(p[2], p[1], p[4])
     p[0] = f"{p[2]}: {p[1]} = {p[4]}"
 
 
@@ -796,33 +1003,33 @@ def p_class_definition(p):
     class_definition : class_naming LBRACE NEWLINE class_body RBRACE NEWLINE
                      | class_naming INHERITS IDENTIFIER LBRACE NEWLINE class_body RBRACE NEWLINE
     """
-    global current_scope
+    session = p.parser.session
 
     match p[2]:
         case "👨‍👦":
             cls: Class = p[6]
             cls.name = p[1][1]
-            classes.append(cls)
+            session.classes.append(cls)
             p[0] = f"class {p[1][1]}({p[3]}):\n{indent(str(cls))}\n"
 
         case _:
             cls: Class = p[4]
             cls.name = p[1][1]
-            classes.append(cls)
+            session.classes.append(cls)
             p[0] = f"class {p[1][1]}:\n{indent(str(cls))}\n"
 
-    current_scope = current_scope.parent
+    session.scope = session.scope.parent
 
 
 def p_class_naming(p):
     """
     class_naming : CLASS IDENTIFIER
     """
-    global current_scope
+    session = p.parser.session
 
-    if not p[2] in types.keys():
-        types.update({p[2]: p[2]})
-        current_scope = ClassScope(p[2], current_scope)
+    if not p[2] in session.types.keys():
+        session.types.update({p[2]: p[2]})
+        session.scope = ClassScope(p[2], session.scope)
     else:
         raise PintException("Definition error", f"Class \"{p[2]}\" already defined", p.lexer.lineno, 1, None)
 
@@ -867,7 +1074,7 @@ def p_fields_declarations(p):
                         | field_declaration
                         | empty
     """
-    match p[1:]:
+    match p.values:
         case [_, _, _]:
             p[0] = [*p[1], p[3]]
         case Field():
@@ -883,29 +1090,26 @@ class Field:
         self.is_cls_field = is_cls_field
 
 
-classes = []
-
-
 def p_field_declaration(p):
     """
     field_declaration : type IDENTIFIER NEWLINE
                       | CLASS type IDENTIFIER NEWLINE
     """
-    global current_scope
+    session = p.parser.session
 
-    match p[1:]:
+    match p.values:
         case ["🏛️", _, _, _]:
-            if current_scope.contains_variable(p[3]):
-                raise PintException("Definition error", f"Field \"{p[3]}\" already defined in scope {current_scope.name}", p.lexer.lineno, 1, None)
+            if session.scope.contains_variable(p[3]):
+                raise PintException("Definition error", f"Field \"{p[3]}\" already defined in scope {session.scope.name}", p.lexer.lineno, 1, None)
             else:
-                current_scope.variables[p[3]] = Variable(p[3], p[2], None)
+                session.scope.variables[p[3]] = Variable(p[3], p[2], None)
                 p[0] = Field(p[3], p[2], True)
         
         case [_, _, _]:
-            if current_scope.contains_variable(p[2]):
-                raise PintException("Definition error", f"Field \"{p[2]}\" already defined in scope {current_scope.name}", p.lexer.lineno - 2, 1, None)
+            if session.scope.contains_variable(p[2]):
+                raise PintException("Definition error", f"Field \"{p[2]}\" already defined in scope {session.scope.name}", p.lexer.lineno - 2, 1, None)
             else:
-                current_scope.variables[p[2]] = Variable(p[2], p[1], None)
+                session.scope.variables[p[2]] = Variable(p[2], p[1], None)
                 p[0] = Field(p[2], p[1])
 
 
@@ -930,9 +1134,9 @@ def p_constructor_definition(p):
     """
     # @TODO constructor scope
     if len(p) > 2:
-        global current_scope
+        session = p.parser.session
 
-        current_scope = current_scope.parent
+        session.scope = session.scope.parent
 
         p[0] = Constructor(p[3], p[7])
     else:
@@ -943,11 +1147,11 @@ def p_constructor_naming(p):
     """
     constructor_naming : CONSTRUCTOR IDENTIFIER
     """
-    global current_scope
+    session = p.parser.session
 
-    current_scope = MethodScope("constructor", current_scope)
+    session.scope = MethodScope("constructor", session.scope)
 
-    p[0] = " ".join(p[1:])
+    p[0] = " ".join(p.values)
 
 
 def p_constructor_body(p):
@@ -955,7 +1159,7 @@ def p_constructor_body(p):
     constructor_body : function_body
                      | function_body super_init_call function_body
     """
-    p[0] = "".join(p[1:])
+    p[0] = "".join(p.values)
 
 
 def p_super_init_call(p):
@@ -996,7 +1200,7 @@ def p_methods_definitions(p):
                         | method_definition
                         | empty
     """
-    match p[1:]:
+    match p.values:
         case [_, _, _]:
             p[0] = [*p[1], p[3]]
         case [Method()]:
@@ -1010,14 +1214,14 @@ def p_method_definition(p):
     method_definition : method_naming LPAREN class_parameters RPAREN RETURNARROW type LBRACE NEWLINE function_body RBRACE NEWLINE
                       | method_naming LPAREN class_parameters RPAREN RETURNARROW NONE LBRACE NEWLINE function_body RBRACE NEWLINE
     """
-    global current_scope
+    session = p.parser.session
 
     is_cls_method = p[1].is_cls_method 
     name = p[1].name
     type = p[6].replace("🌌", "None")
 
-    p[0] = current_scope.functions[name] = Method(name, p[3], type, p[9], is_cls_method)
-    current_scope = current_scope.parent
+    p[0] = session.scope.functions[name] = Method(name, p[3], type, p[9], is_cls_method)
+    session.scope = session.scope.parent
 
 
 def p_method_naming(p):
@@ -1025,23 +1229,23 @@ def p_method_naming(p):
     method_naming : FUNCTION IDENTIFIER
                   | CLASS FUNCTION IDENTIFIER
     """
-    global current_scope
+    session = p.parser.session
 
-    match p[1:]:
+    match p.values:
         case [_, _]:
-            if current_scope.contains_function(p[2]):
-                raise PintException("Definition error", f"Method \"{p[2]}\" already defined in scope {current_scope.name}", p.lexer.lineno, 1, None)
+            if session.scope.contains_function(p[2]):
+                raise PintException("Definition error", f"Method \"{p[2]}\" already defined in scope {session.scope.name}", p.lexer.lineno, 1, None)
             else:
                 m = Method(p[2], None, None, None)
-                current_scope.functions[p[2]] = m
-                current_scope = MethodScope(p[2], current_scope)
+                session.scope.functions[p[2]] = m
+                session.scope = MethodScope(p[2], session.scope)
         case _:
-            if current_scope.contains_function(p[3]):
-                raise PintException("Definition error", f"Method \"{p[3]}\" already defined in scope {current_scope.name}", p.lexer.lineno, 1, None)
+            if session.scope.contains_function(p[3]):
+                raise PintException("Definition error", f"Method \"{p[3]}\" already defined in scope {session.scope.name}", p.lexer.lineno, 1, None)
             else:
                 m = Method(p[3], None, None, None, True)
-                current_scope.functions[p[3]] = m
-                current_scope = MethodScope(p[3], current_scope)
+                session.scope.functions[p[3]] = m
+                session.scope = MethodScope(p[3], session.scope)
 
     p[0] = m
 
@@ -1091,7 +1295,7 @@ def p_binary_expression(p):
     """
     binary_expression : expression binary_operator expression
     """
-    p[0] = " ".join(map(str, p[1:]))
+    p[0] = " ".join(map(str, p.values))
 
 
 def p_unary_expression(p):
@@ -1160,7 +1364,7 @@ def p_compound_identifier(p):
                         | SELF DOT IDENTIFIER
                         
     """
-    match p[1:]:
+    match p.values:
         case ["🤗", _, _]:
             p[0] = f"self.{p[3]}"
         case ["👨‍👦", _, _]:
@@ -1168,7 +1372,7 @@ def p_compound_identifier(p):
         case ["👨‍👦"]:
             p[0] = "super"
         case _:
-            p[0] = "".join(p[1:])
+            p[0] = "".join(p.values)
 
 
 def p_arguments(p):
@@ -1212,16 +1416,20 @@ def p_subscript_expression(p):
     """
     subscript_expression : expression LBRACKET expression RBRACKET
     """
-    p[0] = "".join(p[1:])
+    p[0] = "".join(p.values)
+
 
+# p is None when the program ends in the middle of a statement or a block,
+# which is reported at the end of its last line
+def p_error(p, parser):
+    if p is None:
+        lexer = parser.lexer
+        line, column = lexer.line_index().position(max(len(lexer.lexdata) - 1, 0))
+        raise PintException("Syntax error", "Unexpected end of input", line, column, "\n")
 
-def p_error(p):
-    last_cr = p.lexer.lexdata.rfind("\n", 0, p.lexpos)
-    if last_cr < 0:
-        last_cr = 0
-    column = (p.lexpos - last_cr)
+    line, column = p.lexer.line_index().position(p.lexpos)
 
-    raise PintException("Syntax error", "", p.lineno, column, p.value)
+    raise PintException("Syntax error", "", line, column, p.value)
 
 
 # uncomment to see the tokens (error messages in parsing don't work properly then)
@@ -1233,5 +1441,57 @@ def p_error(p):
 #         break
 #     print(tok)
 
-# build the parser
-parser = yacc()
+# The parser is built on first use by get_parser(), so importing this module
+# for the tokens or the types map doesn't pay for the table construction
+_parser = None
+
+
+def get_parser():
+    global _parser
+
+    if _parser is None:
+        from ply.yacc import yacc
+
+        # the pass-through rules (statement : if_statement, ...) are skipped by the parser;
+        # the grammar checks are skipped by the manifest only under python -O
+        _parser = yacc(tabmodule=TABMODULE, picklefile=PARSETAB, manifest=MANIFEST, optimize=not __debug__,
+                       collapse_units=True)
+    return _parser
+
+
+# A pool of parsers and lexers for translating in several threads at once.
+# The parsing tables and the master regexes are built once, by get_parser()
+# and get_lexer(), and shared: the pool hands out clones of the two, which
+# only keep the state of their own parse, and takes them back for later use.
+# parser is the one to clone: by default the generated parser, which has no
+# debug or tracking branches, or e.g. get_parser().pack() for the packed tables.
+class ParserPool:
+    def __init__(self, parser=None):
+        self.parser = parser or get_parser().compile(PARSERCODE)
+        self.lexer = get_lexer()
+        self.idle = queue.SimpleQueue()
+
+    # Yields a parser and a lexer, e.g.
+    #     with pool.acquire() as (parser, lexer):
+    #         result = parser.parse(program, lexer=lexer)
+    @contextmanager
+    def acquire(self, strip_comments=False):
+        try:
+            parser, lexer = self.idle.get_nowait()
+        except queue.Empty:
+            parser, lexer = self.parser.clone(), self.lexer.clone()
+        lexer.begin("nocomments" if strip_comments else "INITIAL")
+        lexer.lineno = 1
+        try:
+            yield parser, lexer
+        finally:
+            self.idle.put((parser, lexer))
+
+
+# `lexer` and `parser` are kept as module attributes for existing imports
+def __getattr__(name):
+    if name == "lexer":
+        return get_lexer()
+    if name == "parser":
+        return get_parser()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -10,6 +10,18 @@ class DebrewerException(Exception):
         return f"{self.yellow_color}Debrewer error{self.reset_color}:\n{self.message}"
     
     
+# An exception the transpiler didn't expect, raised while transpiling the file at filename;
+# error is that exception
+class InternalError(DebrewerException):
+    def __init__(self, filename, error):
+        super().__init__(f"{type(error).__name__} while transpiling {filename}: {error}")
+        self.filename = filename
+        self.error = error
+
+    def __str__(self):
+        return f"{self.yellow_color}Internal error{self.reset_color}:\n{self.message}"
+
+
 class PintException(Exception):
     red_color = '\033[91m'
     reset_color = '\033[0m'
@@ -42,8 +54,10 @@ class PintException(Exception):
         
         return "\n".join(output)
     
+    # lines is the LineIndex of the program (Lexer.line_index())
     @classmethod
-    def display(cls, filename, code_line, e):
+    def format(cls, filename, lines, e):
+        code_line = lines.line(e.line) if e.line in lines else ""
         output = [f"{e}"]
 
         output.append(f"In {filename} [{e.line}:{e.column}]:")
@@ -52,7 +66,11 @@ class PintException(Exception):
 
         output.append(cls.congratulations)
 
-        print("\n".join(output))
+        return "\n".join(output)
+
+    @classmethod
+    def display(cls, filename, lines, e):
+        print(cls.format(filename, lines, e))
 
 
 class MyPyError(Exception):
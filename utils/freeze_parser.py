@@ -0,0 +1,37 @@
+# Writes the parsing tables of the Pint grammar to a standalone Python module.
+# Deployments that ship this module load a precomputed parser instead of
+# analysing the grammar; it is rejected as soon as the grammar changes.
+#
+# Use (from the repository root): python -m utils.freeze_parser [-o <output_file>]
+
+import os
+import sys
+
+import tokens_and_grammar
+from ply.yacc import yacc
+from utils.errors import DebrewerException
+
+
+def freeze(output_file):
+    # the tables are always generated from the grammar, never taken from a cache
+    parser = yacc(module=tokens_and_grammar)
+    parser.write_table(output_file)
+    return parser
+
+
+if __name__ == "__main__":
+    try:
+        match sys.argv[1:]:
+            case []:
+                output_file = tokens_and_grammar.TABMODULE
+            case ["-o", output_file]:
+                if os.path.splitext(output_file)[1] != ".py":
+                    raise DebrewerException(f'Output file {output_file} doesn\'t have a proper extension to be a Python module.')
+            case _:
+                raise DebrewerException('Invalid arguments. Use: python -m utils.freeze_parser [-o <output_file>]')
+    except DebrewerException as e:
+        print(e)
+        sys.exit(1)
+
+    parser = freeze(output_file)
+    print(f"Wrote {len(parser.action)} states and {len(parser.productions)} productions to {output_file}")